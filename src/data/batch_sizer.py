@@ -0,0 +1,103 @@
+"""
+Adaptive job sizing for IEDB submissions (used by peptidecalcs).
+
+`AdaptiveBatchSizer` learns how job turnaround (submit → result done) grows
+with job size from the last `window` finished jobs and moves the batch size
+towards the one that maximises predictions per second:
+
+- until three distinct sizes have finished it probes around the initial
+  size (×1, ×1.5, ÷1.5)
+- after that it fits  turnaround ≈ a + b·n + c·n²  (per-job overhead, linear
+  work, slow-down of very large jobs) and takes the best n / t(n) on a grid,
+  moving at most `step`× per update and staying inside [min_size, max_size]
+
+Sizes are counted in predicted windows (`job_windows`), not input peptides: a
+job submitted with peptide_length_range [lo, hi] scores every sub-peptide of
+length lo..hi of each input, so a mixed-length job costs more than its
+peptide count.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Iterable, Optional
+
+import numpy as np
+
+MIN_DISTINCT = 3       # sizes needed before the quadratic fit is trusted
+GRID_POINTS = 64
+
+
+def job_windows(lengths: Iterable[int], lo: int, hi: int) -> int:
+    """Peptides IEDB scores for inputs of `lengths` under peptide_length_range [lo, hi]."""
+    total = 0
+    for k in lengths:
+        top = min(int(k), hi)
+        if top >= lo:
+            n = top - lo + 1                      # Σ_{L=lo..top} (k − L + 1)
+            total += n * (k + 1) - (lo + top) * n // 2
+    return total
+
+
+class AdaptiveBatchSizer:
+    def __init__(self, initial: int, min_size: int, max_size: int,
+                 window: int = 20, step: float = 2.0) -> None:
+        if not 0 < min_size <= max_size:
+            raise ValueError(f"need 0 < min_size <= max_size, got {min_size}, {max_size}")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.step = step
+        self.size = self._clamp(initial)
+        self.probes = list(dict.fromkeys(self._clamp(initial * f) for f in (1, 1.5, 1 / 1.5)))
+        self.obs: deque = deque(maxlen=window)    # (windows, seconds)
+        self.coef: Optional[np.ndarray] = None    # t(n) = polyval(coef, n / scale)
+        self.scale = float(self.size)
+
+    def _clamp(self, n: float) -> int:
+        return int(min(max(round(n), self.min_size), self.max_size))
+
+    @property
+    def fixed(self) -> bool:
+        return self.min_size == self.max_size
+
+    def observe(self, windows: int, seconds: float) -> int:
+        """Record one finished job; returns the (possibly updated) batch size."""
+        if windows <= 0 or seconds <= 0 or self.fixed:
+            return self.size
+        self.obs.append((windows, seconds))
+        seen = {n for n, _ in self.obs}
+        if len(seen) < MIN_DISTINCT:
+            self.size = next((p for p in self.probes if p not in seen), self.size)
+            return self.size
+
+        n = np.array([o[0] for o in self.obs], dtype=np.float64)
+        t = np.array([o[1] for o in self.obs], dtype=np.float64)
+        self.scale = float(n.mean())
+        self.coef = np.polyfit(n / self.scale, t, 2)
+
+        lo = max(self.min_size, self.size / self.step, n.min() / self.step)
+        hi = min(self.max_size, self.size * self.step, n.max() * self.step)
+        if lo >= hi:
+            return self.size
+        grid = np.unique(np.round(np.geomspace(lo, hi, GRID_POINTS)))
+        pred = np.polyval(self.coef, grid / self.scale)
+        ok = pred > 0
+        if ok.any():
+            rate = grid[ok] / pred[ok]
+            self.size = self._clamp(grid[ok][np.argmax(rate)])
+        return self.size
+
+    def turnaround(self, windows: int) -> Optional[float]:
+        """Predicted seconds for a job of `windows`, None before the first fit."""
+        if self.coef is None:
+            return None
+        return float(np.polyval(self.coef, windows / self.scale))
+
+    def worth_packing(self, a: int, b: int, together: int) -> bool:
+        """Is one job of `together` windows faster than jobs of `a` and `b`?"""
+        if together > self.size:
+            return False
+        ta, tb, tt = self.turnaround(a), self.turnaround(b), self.turnaround(together)
+        if tt is None:
+            return True          # no model yet: per-job overhead dominates small tails
+        return tt <= ta + tb
@@ -0,0 +1,107 @@
+"""
+Compare DuckDB lookup latency on two layouts of the same slim prediction
+table, e.g. the arrival-order file from slim_parquet.py and the one written
+with --clustered.
+
+Usage (from repo root):
+
+  python src/data/bench_lookup.py \
+    --baseline  src/data/iedb_netmhc_slim.parquet \
+    --candidate src/data/iedb_netmhc_slim_clustered.parquet
+
+Optional flags:
+  --queries 50     point lookups per kind (default: 50)
+  --seed 0
+
+Reports median / p95 latency for:
+  peptide  WHERE peptide = ?
+  allele   WHERE allele = ? (COUNT + MIN percentile, a range scan)
+  pair     WHERE allele = ? AND peptide = ?
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import time
+from typing import Dict, List
+
+import pyarrow.parquet as pq
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover - optional dependency
+    duckdb = None
+
+
+QUERIES = {
+    "peptide": "SELECT * FROM read_parquet(?) WHERE peptide = ?",
+    "allele":  "SELECT COUNT(*), MIN(netmhcpan_el_percentile) FROM read_parquet(?) WHERE allele = ?",
+    "pair":    "SELECT * FROM read_parquet(?) WHERE allele = ? AND peptide = ?",
+}
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark DuckDB lookups on two Parquet layouts.")
+    p.add_argument("--baseline", required=True, help="Parquet file in the original layout")
+    p.add_argument("--candidate", required=True, help="Parquet file in the clustered layout")
+    p.add_argument("--queries", type=int, default=50, help="Lookups per query kind (default: 50)")
+    p.add_argument("--seed", type=int, default=0)
+    return p.parse_args()
+
+
+def sample_keys(path: str, n: int, seed: int) -> List[Dict[str, str]]:
+    """Pick `n` (allele, peptide) pairs spread over the file's row groups."""
+    pf = pq.ParquetFile(path)
+    rng = random.Random(seed)
+    keys = []
+    for _ in range(n):
+        rg = pf.read_row_group(rng.randrange(pf.num_row_groups), columns=["allele", "peptide"])
+        i = rng.randrange(rg.num_rows)
+        keys.append({"allele": rg["allele"][i].as_py(), "peptide": rg["peptide"][i].as_py()})
+    return keys
+
+
+def time_queries(con, path: str, kind: str, keys: List[Dict[str, str]]) -> List[float]:
+    sql = QUERIES[kind]
+    out = []
+    for k in keys:
+        params = [path] + ([k["peptide"]] if kind == "peptide" else
+                           [k["allele"]] if kind == "allele" else
+                           [k["allele"], k["peptide"]])
+        t0 = time.perf_counter()
+        con.execute(sql, params).fetchall()
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def describe(path: str) -> str:
+    md = pq.ParquetFile(path).metadata
+    return f"{md.num_rows:,} rows, {md.num_row_groups} row groups"
+
+
+def main() -> None:
+    a = parse_args()
+    if duckdb is None:
+        raise SystemExit("bench_lookup needs the duckdb package (pip install duckdb)")
+
+    keys = sample_keys(a.baseline, a.queries, a.seed)
+    con = duckdb.connect()
+    print(f"[bench] baseline : {a.baseline} ({describe(a.baseline)})")
+    print(f"[bench] candidate: {a.candidate} ({describe(a.candidate)})")
+    print(f"[bench] {a.queries} lookups per kind, latency in ms (median / p95)\n")
+    print(f"  {'query':<8} {'baseline':>18} {'candidate':>18} {'speed-up':>9}")
+    for kind in QUERIES:
+        res = {}
+        for label, path in (("baseline", a.baseline), ("candidate", a.candidate)):
+            time_queries(con, path, kind, keys[:3])          # warm the OS cache
+            lat = sorted(time_queries(con, path, kind, keys))
+            res[label] = (statistics.median(lat), lat[int(0.95 * (len(lat) - 1))])
+        b, c = res["baseline"], res["candidate"]
+        print(f"  {kind:<8} {b[0]:>8.2f} / {b[1]:>7.2f} {c[0]:>8.2f} / {c[1]:>7.2f} "
+              f"{b[0] / c[0]:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
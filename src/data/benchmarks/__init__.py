@@ -0,0 +1,18 @@
+"""
+Benchmarks for the data-pipeline scripts in src/data.
+
+Synthetic inputs shaped like the real ones are generated once per scale and
+cached; every stage then runs in a fresh process so its wall time and peak
+RSS are measured in isolation. Results go to a JSON report that can be
+compared against a stored baseline.
+
+Run from src/data (the scripts import each other by module name):
+
+  cd src/data
+  python -m benchmarks run --rows 100k --output bench_100k.json
+  python -m benchmarks run --rows 1M --baseline bench_1M_baseline.json
+  python -m benchmarks compare bench_1M_baseline.json bench_1M.json --tolerance 0.15
+
+See `python -m benchmarks --help` for stage selection, repeats and the data
+cache location.
+"""
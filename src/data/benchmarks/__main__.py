@@ -0,0 +1,137 @@
+"""
+python -m benchmarks run      [--rows 100k] [--stages a,b] [--repeat 3] [--output report.json]
+                              [--baseline old.json --tolerance 0.15]
+python -m benchmarks compare  baseline.json current.json [--tolerance 0.15]
+
+Exit status is 1 when a stage failed or regressed beyond the tolerance.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .run import REPORT_VERSION, compare, environment, print_table, run_stage, summarise
+from .stages import STAGES
+from .synth import ensure_data
+
+
+def parse_count(s: str) -> int:
+    """'10k', '2.5M', '100000' → int."""
+    m = re.fullmatch(r"\s*([\d.]+)\s*([kKmMgG]?)\s*", s)
+    if not m:
+        raise argparse.ArgumentTypeError(f"not a row count: {s!r}")
+    mult = {"": 1, "k": 10**3, "m": 10**6, "g": 10**9}[m.group(2).lower()]
+    return int(float(m.group(1)) * mult)
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(prog="python -m benchmarks",
+                                description="Benchmark the data-pipeline scripts on synthetic inputs.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    r = sub.add_parser("run", help="Generate inputs (cached) and time every stage")
+    r.add_argument("--rows", type=parse_count, default=parse_count("100k"),
+                   help="Rows per synthetic input, e.g. 10k, 1M, 100M (default: 100k)")
+    r.add_argument("--seq-len", type=int, default=250, help="Synthetic sequence length (default: 250)")
+    r.add_argument("--seed", type=int, default=0)
+    r.add_argument("--stages", default=None,
+                   help=f"Comma-separated subset of: {', '.join(STAGES)} (default: all)")
+    r.add_argument("--repeat", type=int, default=3, help="Runs per stage; the median is reported (default: 3)")
+    r.add_argument("--data-dir", default=str(Path(tempfile.gettempdir()) / "immunopeptidomics-bench"),
+                   help="Cache for synthetic inputs (default: <tmp>/immunopeptidomics-bench)")
+    r.add_argument("--output", default=None, help="Report path (default: bench_<rows>.json)")
+    r.add_argument("--verbose", action="store_true", help="Show the stages' own output")
+    _compare_flags(r)
+    r.add_argument("--baseline", default=None, help="Compare the new report against this one")
+
+    c = sub.add_parser("compare", help="Compare two reports")
+    c.add_argument("baseline")
+    c.add_argument("current")
+    _compare_flags(c)
+    return p.parse_args()
+
+
+def _compare_flags(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--tolerance", type=float, default=0.15,
+                   help="Allowed slow-down as a fraction of the baseline time (default: 0.15)")
+    p.add_argument("--rss-tolerance", type=float, default=0.15,
+                   help="Allowed growth of peak RSS as a fraction (default: 0.15)")
+    p.add_argument("--min-delta", type=float, default=0.05,
+                   help="Ignore slow-downs smaller than this many seconds (default: 0.05)")
+
+
+def cmd_run(a: argparse.Namespace) -> int:
+    names = list(STAGES) if not a.stages else [s.strip() for s in a.stages.split(",") if s.strip()]
+    unknown = [n for n in names if n not in STAGES]
+    if unknown:
+        raise SystemExit(f"Unknown stage(s): {', '.join(unknown)}")
+
+    paths = ensure_data(Path(a.data_dir), a.rows, a.seq_len, a.seed)
+    work = Path(tempfile.mkdtemp(prefix="bench-work-"))
+    report = {
+        "version": REPORT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {"rows": a.rows, "seq_len": a.seq_len, "seed": a.seed, "repeat": a.repeat},
+        "environment": environment(),
+        "stages": {},
+    }
+    failed = 0
+    try:
+        for name in names:
+            runs = []
+            for _ in range(a.repeat):
+                res = run_stage(name, paths, work / name, quiet=not a.verbose)
+                if not res["ok"]:
+                    runs = None
+                    report["stages"][name] = {"error": res["error"]}
+                    print(f"[bench] ❌ {name}: {res['error']}")
+                    failed += 1
+                    break
+                runs.append(res)
+            if runs:
+                s = report["stages"][name] = summarise(runs)
+                rss = f"{s['peak_rss_mb']:,.0f} MB" if s["peak_rss_mb"] else "n/a"
+                print(f"[bench] {name:<24} {s['seconds']:>8.3f} s  {s['rows']:>12,} rows  "
+                      f"peak RSS {rss}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    out = Path(a.output or f"bench_{a.rows}.json")
+    out.write_text(json.dumps(report, indent=2))
+    print(f"[bench] Report → {out}")
+
+    if a.baseline:
+        return max(_compare_files(Path(a.baseline), report, a), 1 if failed else 0)
+    return 1 if failed else 0
+
+
+def _compare_files(baseline_path: Path, current: dict, a: argparse.Namespace) -> int:
+    baseline = json.loads(baseline_path.read_text())
+    if baseline.get("params", {}).get("rows") != current.get("params", {}).get("rows"):
+        print(f"[bench] ⚠️  Baseline was run with {baseline['params'].get('rows'):,} rows, "
+              f"current with {current['params'].get('rows'):,} – times are not comparable")
+    rows, regressions = compare(baseline, current, a.tolerance, a.rss_tolerance, a.min_delta)
+    print(f"\n[bench] Against {baseline_path} (tolerance {a.tolerance:.0%} time, "
+          f"{a.rss_tolerance:.0%} RSS)")
+    print_table(rows, ["stage", "baseline", "current", "time / RSS", "status"])
+    if regressions:
+        print(f"[bench] {regressions} regression(s)")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    a = parse_args()
+    if a.command == "run":
+        return cmd_run(a)
+    return _compare_files(Path(a.baseline), json.loads(Path(a.current).read_text()), a)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
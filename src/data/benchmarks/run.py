@@ -0,0 +1,153 @@
+"""
+Run stages in fresh processes, build the JSON report, compare two reports.
+"""
+
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - optional dependency
+    psutil = None
+
+from .stages import STAGES
+
+REPORT_VERSION = 1
+
+
+def _vm_hwm_mb() -> Optional[float]:
+    """Linux high-water RSS of this process image (unlike ru_maxrss, reset on exec)."""
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb() -> Tuple[Optional[float], Optional[float]]:
+    """(this process, largest waited-for child) peak RSS in MB, None if unknown."""
+    if resource is not None:
+        scale = 1 / 2**20 if sys.platform == "darwin" else 1 / 1024     # bytes vs KiB
+        own = _vm_hwm_mb() or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        kids = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+        return own, kids or None
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 2**20, None
+    return None, None
+
+
+def _child(name: str, paths: Dict[str, str], work: str, quiet: bool, conn) -> None:
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+    try:
+        work_dir = Path(work)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        run = STAGES[name](paths, work_dir)
+        base, _ = peak_rss_mb()
+        t0 = time.perf_counter()
+        rows = run()
+        seconds = time.perf_counter() - t0
+        own, kids = peak_rss_mb()
+        conn.send({"ok": True, "seconds": seconds, "rows": rows,
+                   "base_rss_mb": base, "peak_rss_mb": own, "child_peak_rss_mb": kids})
+    except BaseException as e:
+        conn.send({"ok": False, "error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def run_stage(name: str, paths: Dict[str, str], work: Path, quiet: bool = True) -> Dict[str, Any]:
+    """Run one stage once in a spawned process."""
+    ctx = mp.get_context("spawn")
+    recv, send = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(name, paths, str(work), quiet, send))
+    proc.start()
+    send.close()
+    try:
+        result = recv.recv()
+    except EOFError:
+        result = {"ok": False, "error": "stage process died"}
+    proc.join()
+    if proc.exitcode not in (0, None) and result.get("ok"):
+        result = {"ok": False, "error": f"exit code {proc.exitcode}"}
+    return result
+
+
+def summarise(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    secs = [r["seconds"] for r in runs]
+    med = statistics.median(secs)
+    out = {
+        "rows": runs[0]["rows"],
+        "seconds": med,
+        "seconds_min": min(secs),
+        "runs": secs,
+        "rows_per_s": runs[0]["rows"] / med if med > 0 else None,
+    }
+    for key in ("base_rss_mb", "peak_rss_mb", "child_peak_rss_mb"):
+        vals = [r[key] for r in runs if r.get(key) is not None]
+        out[key] = max(vals) if vals else None
+    return out
+
+
+def environment() -> Dict[str, Any]:
+    import numpy
+    import pyarrow
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "pyarrow": pyarrow.__version__,
+    }
+
+
+# ───────────────────────── comparison ─────────────────────────
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float,
+            rss_tolerance: float, min_delta: float) -> Tuple[List[List[str]], int]:
+    """Table rows and the number of regressions of `current` against `baseline`."""
+    rows, regressions = [], 0
+    for name, cur in current["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None or "error" in cur or "error" in base:
+            status = "error" if "error" in cur else "new" if base is None else "no baseline"
+            rows.append([name, "-", "-", "-", status])
+            regressions += "error" in cur
+            continue
+        ratio = cur["seconds"] / base["seconds"] if base["seconds"] else float("inf")
+        slower = ratio > 1 + tolerance and cur["seconds"] - base["seconds"] > min_delta
+        status = "SLOWER" if slower else "faster" if ratio < 1 - tolerance else "ok"
+
+        b_rss, c_rss = base.get("peak_rss_mb"), cur.get("peak_rss_mb")
+        rss = "-"
+        if b_rss and c_rss:
+            rss = f"{c_rss / b_rss:.2f}x"
+            if c_rss > b_rss * (1 + rss_tolerance):
+                status = "SLOWER+RSS" if slower else "RSS"
+        regressions += status not in ("ok", "faster")
+        rows.append([name, f"{base['seconds']:.3f}s", f"{cur['seconds']:.3f}s",
+                     f"{ratio:.2f}x / {rss}", status])
+    return rows, regressions
+
+
+def print_table(rows: List[List[str]], header: List[str]) -> None:
+    widths = [max(len(str(r[i])) for r in rows + [header]) for i in range(len(header))]
+    for r in [header] + rows:
+        print("  " + "  ".join(str(c).ljust(w) for c, w in zip(r, widths)))
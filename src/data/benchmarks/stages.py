@@ -0,0 +1,130 @@
+"""
+Benchmark stages.
+
+A stage is a function `(paths, workdir) -> run` that does its imports and
+loads its inputs, and returns the zero-argument callable that is timed. `run`
+returns the number of input rows it processed (for rows/s in the report).
+Stages that drive a script's CLI call its `main()` with a patched argv, so
+the benchmark covers exactly what a production run executes.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import shutil
+import sys
+from pathlib import Path
+from typing import Callable, Dict, List
+
+Paths = Dict[str, str]
+Stage = Callable[[Paths, Path], Callable[[], int]]
+
+
+@contextlib.contextmanager
+def _argv(args: List[str]):
+    saved = sys.argv
+    sys.argv = ["bench"] + args
+    try:
+        yield
+    finally:
+        sys.argv = saved
+
+
+def _parquet_rows(path: str) -> int:
+    import pyarrow.parquet as pq
+    return pq.ParquetFile(path).metadata.num_rows
+
+
+def _dataset_rows(root: str) -> int:
+    import pyarrow.dataset as ds
+    return ds.dataset(root, format="parquet", partitioning="hive").count_rows()
+
+
+# ───────────────────────── peptide generation ─────────────────────────
+def generate_peptides(paths: Paths, work: Path) -> Callable[[], int]:
+    import pandas as pd
+    from peptidecalcs import peptide_table
+
+    freq_df = pd.read_parquet(paths["sequencecalc"],
+                              columns=["protein", "position", "aminoacid", "frequency_all"])
+
+    def run() -> int:
+        peptide_table(freq_df, list(range(8, 15)), 30_000, set())
+        return len(freq_df)
+    return run
+
+
+# ───────────────────────── partitioning ─────────────────────────
+def protein_counts(paths: Paths, work: Path) -> Callable[[], int]:
+    import pyarrow.dataset as ds
+    from partition_iav6_by_protein import protein_counts as count
+
+    def run() -> int:
+        return sum(count(ds.dataset(paths["sequences"], format="parquet")).values())
+    return run
+
+
+def partition_write(paths: Paths, work: Path) -> Callable[[], int]:
+    import partition_iav6_by_protein as part
+
+    out = work / "partitioned"
+    shutil.rmtree(out, ignore_errors=True)
+
+    def run() -> int:
+        with _argv(["--input", paths["sequences"], "--outdir", str(out)]):
+            part.main()
+        return json.loads((out / "_manifest.json").read_text())["total_rows"]
+    return run
+
+
+# ───────────────────────── slimming ─────────────────────────
+def _slim(src_key: str, percentiles: str, clustered: bool) -> Stage:
+    def stage(paths: Paths, work: Path) -> Callable[[], int]:
+        from slim_parquet import load_mapping, slim_file
+
+        cols = load_mapping("iedb")
+        dst = work / f"slim_{src_key}_{percentiles}{'_clustered' if clustered else ''}.parquet"
+
+        def run() -> int:
+            return slim_file(Path(paths[src_key]), dst, cols, percentiles, "zstd",
+                             ["allele", "peptide"] if clustered else None, 5_000_000)
+        return run
+    return stage
+
+
+# ───────────────────────── aggregation ─────────────────────────
+def sequencecalc(paths: Paths, work: Path) -> Callable[[], int]:
+    import build_sequencecalc
+
+    out = work / "sequencecalc.parquet"
+
+    def run() -> int:
+        with _argv(["--dataset", paths["partitioned"], "--output", str(out)]):
+            build_sequencecalc.main()
+        return _dataset_rows(paths["partitioned"])
+    return run
+
+
+def filter_cube(paths: Paths, work: Path) -> Callable[[], int]:
+    import build_filter_cube
+
+    out = work / "filter_cube.parquet"
+
+    def run() -> int:
+        with _argv(["--dataset", paths["partitioned"], "--output", str(out)]):
+            build_filter_cube.main()
+        return _dataset_rows(paths["partitioned"])
+    return run
+
+
+STAGES: Dict[str, Stage] = {
+    "generate_peptides": generate_peptides,
+    "protein_counts": protein_counts,
+    "partition_write": partition_write,
+    "slim_csv": _slim("iedb_csv", "float32", False),
+    "slim_csv_uint16": _slim("iedb_csv", "uint16", False),
+    "slim_parquet_clustered": _slim("iedb_parquet", "float32", True),
+    "sequencecalc": sequencecalc,
+    "filter_cube": filter_cube,
+}
@@ -0,0 +1,211 @@
+"""
+Synthetic inputs shaped like the pipeline's real files.
+
+- sequencecalc  protein, position, aminoacid, frequency_all, … (like
+                IAV8_sequencecalc.parquet); mostly one dominant residue per
+                position, so generate_peptides finds a realistic number of
+                variant windows
+- sequences     accession, protein, genotype, country, host, collection_date,
+                release_date, sequence (like IAV6-all.parquet); aligned,
+                equal length per protein, with point mutations and gaps
+- partitioned   the sequences written as protein=*/part-0.parquet
+- iedb_results  allele, peptide, peptide length, start, end, EL/BA score and
+                percentile columns (like the IEDB results CSV), as CSV and
+                Parquet
+
+Everything is written in chunks, so 100M-row inputs need disk, not memory.
+"""
+
+from __future__ import annotations
+
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pcsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+CHUNK_ROWS = 1_000_000
+AMINO_ACIDS = np.frombuffer(b"ACDEFGHIKLMNPQRSTVWY", dtype=np.uint8)
+PROTEINS = ["HA", "M1", "M2", "NA", "NP", "NS1", "NS2", "PA", "PB1", "PB2"]
+ALLELES = ["HLA-A*02:01", "HLA-A*34:01", "HLA-B*15:02", "HLA-B*18:01",
+           "HLA-B*35:03", "HLA-C*04:01", "HLA-E*01:01"]
+GENOTYPES = ["H1N1", "H3N2", "H5N1", "H7N9", "H9N2"]
+HOSTS = ["Homo sapiens", "Homo sapiens", "Homo sapiens", "Gallus gallus", "Sus scrofa", "Anas platyrhynchos"]
+COUNTRIES = ["USA", "China", "Japan", "Brazil", "Kenya", "Germany", "India", "Australia"]
+
+
+def strings_from_matrix(mat: np.ndarray) -> pa.Array:
+    """(n, k) uint8 ASCII matrix → Arrow string array of length-k values."""
+    n, k = mat.shape
+    offsets = np.arange(0, (n + 1) * k, k, dtype=np.int64)
+    return pa.LargeStringArray.from_buffers(
+        n, pa.py_buffer(offsets), pa.py_buffer(np.ascontiguousarray(mat))).cast(pa.string())
+
+
+def _chunks(total: int) -> Iterator[int]:
+    done = 0
+    while done < total:
+        n = min(CHUNK_ROWS, total - done)
+        yield n
+        done += n
+
+
+# ───────────────────────── sequencecalc ─────────────────────────
+def sequencecalc_table(rows: int, rng: np.random.Generator, n_seqs: int = 100_000) -> pa.Table:
+    """About `rows` rows; every position has 1 major and 0–3 minor residues."""
+    minors = rng.choice([0, 1, 2, 3], size=max(rows // 2, 1), p=[0.55, 0.3, 0.1, 0.05])
+    per_pos = 1 + minors
+    n_pos = min(int(np.searchsorted(np.cumsum(per_pos), rows)) + 1, len(per_pos))
+    per_pos = per_pos[:n_pos]
+    lengths = np.diff(np.linspace(0, n_pos, len(PROTEINS) + 1).astype(np.int64))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    pos_protein = np.repeat(np.arange(len(PROTEINS)), lengths)
+    pos_global = np.repeat(np.arange(n_pos), per_pos)
+    protein = pos_protein[pos_global]
+    position = pos_global - starts[protein] + 1
+
+    # residue choice: distinct letters per position
+    rank = np.arange(len(pos_global)) - np.repeat(np.cumsum(per_pos) - per_pos, per_pos)
+    shift = np.repeat(rng.integers(0, len(AMINO_ACIDS), n_pos), per_pos)
+    aa = AMINO_ACIDS[(shift + rank * 7) % len(AMINO_ACIDS)]
+
+    # frequencies: a major residue and minors of which ~1 in 8 passes 30k of 100k
+    minor = rng.integers(1, 40_000, len(pos_global))
+    minor = np.where(rng.random(len(pos_global)) < 0.125, minor + 30_000, minor // 4)
+    freq = np.where(rank == 0, 0, minor)
+    pos_minor = np.bincount(pos_global, weights=freq, minlength=n_pos).astype(np.int64)
+    major = np.maximum(n_seqs - pos_minor, 1)
+    freq = np.where(rank == 0, major[pos_global], freq).astype(np.int32)
+    total = np.bincount(pos_global, weights=freq, minlength=n_pos).astype(np.int32)[pos_global]
+
+    return pa.table({
+        "protein": pa.array(np.array(PROTEINS)[protein]),
+        "position": pa.array(position, pa.int64()),
+        "aminoacid": strings_from_matrix(aa[:, None]),
+        "frequency_all": pa.array(freq, pa.int32()),
+        "total_all": pa.array(total, pa.int32()),
+        "value": pa.array(freq / total),
+        "frequency_unique": pa.array(np.maximum(freq // 50, 1), pa.int32()),
+        "total_unique": pa.array(np.maximum(total // 50, 1), pa.int32()),
+        "value_unique": pa.array(freq / total),
+    })
+
+
+# ───────────────────────── sequences ─────────────────────────
+def write_sequences(path: Path, rows: int, seq_len: int, rng: np.random.Generator) -> None:
+    consensus = {p: rng.choice(AMINO_ACIDS, seq_len) for p in PROTEINS}
+    days = np.datetime64("1990-01-01") + np.arange(0, 35 * 365)
+    writer = None
+    acc = 0
+    for n in _chunks(rows):
+        prot_idx = rng.integers(0, len(PROTEINS), n)
+        mat = np.stack([consensus[p] for p in PROTEINS])[prot_idx]
+        # ~2% point mutations, ~0.5% gaps
+        hit = rng.random(mat.shape)
+        mat = np.where(hit < 0.02, rng.choice(AMINO_ACIDS, mat.shape), mat)
+        mat = np.where(hit > 0.995, np.uint8(ord("-")), mat).astype(np.uint8)
+        dates = days[rng.integers(0, len(days), n)].astype(str)
+        dates = np.where(rng.random(n) < 0.1, [d[:4] for d in dates], dates)
+        tbl = pa.table({
+            "accession": pa.array([f"SYN{acc + i:09d}" for i in range(n)]),
+            "protein": pa.array(np.array(PROTEINS)[prot_idx]),
+            "genotype": pa.array(np.array(GENOTYPES)[rng.integers(0, len(GENOTYPES), n)]),
+            "country": pa.array(np.array(COUNTRIES)[rng.integers(0, len(COUNTRIES), n)]),
+            "host": pa.array(np.array(HOSTS)[rng.integers(0, len(HOSTS), n)]),
+            "collection_date": pa.array(dates),
+            "release_date": pa.array(days[rng.integers(0, len(days), n)].astype(str)),
+            "sequence": strings_from_matrix(mat),
+        })
+        if writer is None:
+            writer = pq.ParquetWriter(path, tbl.schema, compression="zstd")
+        writer.write_table(tbl, row_group_size=500_000)
+        acc += n
+    if writer is not None:
+        writer.close()
+
+
+def write_partitioned(src: Path, out_dir: Path) -> None:
+    shutil.rmtree(out_dir, ignore_errors=True)
+    ds.write_dataset(
+        ds.dataset(src, format="parquet"), out_dir, format="parquet",
+        partitioning=ds.partitioning(pa.schema([pa.field("protein", pa.string())]), flavor="hive"),
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+# ───────────────────────── IEDB results ─────────────────────────
+def iedb_batches(rows: int, rng: np.random.Generator) -> Iterator[pa.Table]:
+    """Every peptide is scored for every allele, as in the real results."""
+    per_allele = len(ALLELES)
+    pep_no = 0
+    for n in _chunks(rows):
+        n_peps = -(-n // per_allele)
+        lens = rng.integers(8, 15, n_peps)
+        mat = rng.choice(AMINO_ACIDS, (n_peps, 14))
+        peptides = [bytes(r[:k]).decode() for r, k in zip(mat, lens)]
+        idx = np.repeat(np.arange(n_peps), per_allele)[:n]
+        allele = np.tile(np.arange(per_allele), n_peps)[:n]
+        el = np.round(np.minimum(rng.exponential(25.0, n), 100.0), 3)
+        ba = np.round(np.minimum(el * rng.uniform(0.5, 2.0, n), 100.0), 3)
+        start = rng.integers(1, 700, n_peps)[idx]
+        yield pa.table({
+            "seq #": pa.array(pep_no + idx, pa.int64()),
+            "peptide": pa.array(np.array(peptides, dtype=object)[idx], pa.string()),
+            "start": pa.array(start, pa.int64()),
+            "end": pa.array(start + lens[idx] - 1, pa.int64()),
+            "peptide length": pa.array(lens[idx], pa.int64()),
+            "allele": pa.array(np.array(ALLELES)[allele]),
+            "netmhcpan_el_score": pa.array(np.round(1 - el / 100, 4)),
+            "netmhcpan_el_percentile": pa.array(el),
+            "netmhcpan_ba_score": pa.array(np.round(1 - ba / 100, 4)),
+            "netmhcpan_ba_percentile": pa.array(ba),
+        })
+        pep_no += n_peps
+
+
+def write_iedb(csv_path: Path, parquet_path: Path, rows: int, rng: np.random.Generator) -> None:
+    csv_writer = pq_writer = None
+    for tbl in iedb_batches(rows, rng):
+        if csv_writer is None:
+            csv_writer = pcsv.CSVWriter(csv_path, tbl.schema)
+            pq_writer = pq.ParquetWriter(parquet_path, tbl.schema, compression="zstd")
+        csv_writer.write_table(tbl)
+        pq_writer.write_table(tbl)
+    if csv_writer is not None:
+        csv_writer.close()
+        pq_writer.close()
+
+
+# ───────────────────────── cache ─────────────────────────
+def ensure_data(root: Path, rows: int, seq_len: int, seed: int) -> Dict[str, str]:
+    """Generate (or reuse) all inputs for one scale; returns name → path."""
+    key = f"rows{rows}_len{seq_len}_seed{seed}"
+    d = root / key
+    stamp = d / "_complete.json"
+    paths = {
+        "sequencecalc": d / "sequencecalc.parquet",
+        "sequences": d / "sequences.parquet",
+        "partitioned": d / "partitioned",
+        "iedb_csv": d / "iedb_results.csv",
+        "iedb_parquet": d / "iedb_results.parquet",
+    }
+    if stamp.exists():
+        return {k: str(v) for k, v in paths.items()}
+
+    shutil.rmtree(d, ignore_errors=True)
+    d.mkdir(parents=True)
+    rng = np.random.default_rng(seed)
+    print(f"[bench] Generating synthetic inputs ({rows:,} rows) → {d}")
+    pq.write_table(sequencecalc_table(rows, rng), paths["sequencecalc"], compression="zstd")
+    write_sequences(paths["sequences"], rows, seq_len, rng)
+    write_partitioned(paths["sequences"], paths["partitioned"])
+    write_iedb(paths["iedb_csv"], paths["iedb_parquet"], rows, rng)
+    stamp.write_text(json.dumps({"rows": rows, "seq_len": seq_len, "seed": seed}))
+    return {k: str(v) for k, v in paths.items()}
@@ -0,0 +1,182 @@
+"""
+Pre-aggregate per-position residue counts by the dashboard filter columns, so
+a filtered `positionStats` is a SUM over a few thousand cube rows instead of a
+live scan of every sequence in the browser.
+
+Input is the Hive dataset written by partition_iav6_by_protein.py
+(protein=*/…parquet with sequence, genotype, host, country, collection_date).
+Output is one Parquet "cube":
+
+  protein, genotype, host_category, country, collection_year,
+  position, aminoacid, frequency
+
+host_category follows the dashboards' Human / Non-human checkbox:
+'Human' for host = 'Homo sapiens', 'Non-human' for any other non-null host.
+collection_year is the leading YYYY of collection_date (NULL when missing).
+
+Answering a filter combination (DuckDB):
+
+  SELECT position, aminoacid, SUM(frequency) AS frequency_all,
+         SUM(SUM(frequency)) OVER (PARTITION BY position) AS total_all
+  FROM   read_parquet('filter_cube.parquet')
+  WHERE  protein = 'M1' AND host_category = 'Human'
+    AND  collection_year BETWEEN 2015 AND 2020
+  GROUP  BY position, aminoacid;
+
+Counts are additive, so "all sequences" statistics are exact at year
+resolution. Unique-sequence counts are not additive across cells and are
+not stored; the exact host and day-level date filters still need the live
+path.
+
+Usage (from repo root):
+
+  python src/data/build_filter_cube.py \
+    --dataset src/data/IAV6_partitioned \
+    --output  src/data/IAV8_filter_cube.parquet
+"""
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from build_sequencecalc import fixed_width_matrix, list_partitions
+
+GROUP_COLS = ["genotype", "host_category", "country", "collection_year"]
+
+CUBE_SCHEMA = pa.schema([
+    pa.field("protein", pa.string()),
+    pa.field("genotype", pa.string()),
+    pa.field("host_category", pa.string()),
+    pa.field("country", pa.string()),
+    pa.field("collection_year", pa.int16()),
+    pa.field("position", pa.int32()),
+    pa.field("aminoacid", pa.string()),
+    pa.field("frequency", pa.int32()),
+])
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Build a per-position residue count cube by filter columns.")
+    p.add_argument("--dataset", required=True, help="Root of the Hive dataset (protein=*/…parquet)")
+    p.add_argument("--output", required=True, help="Output Parquet file")
+    p.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    p.add_argument("--only-proteins", default=None,
+                   help="Comma-separated protein IDs to include (default: all partitions)")
+    p.add_argument("--compression", default="zstd", help="Parquet compression codec (default: zstd)")
+    return p.parse_args()
+
+
+def filter_keys(tbl: pa.Table) -> pd.DataFrame:
+    """Derive the cube's group columns from the raw metadata columns."""
+    host = tbl["host"]
+    date = pc.fill_null(tbl["collection_date"], "")
+    year_str = pc.utf8_slice_codeunits(date, 0, 4)
+    has_year = pc.match_substring_regex(date, r"^\d{4}")
+    return pd.DataFrame({
+        "genotype": tbl["genotype"].to_pandas(),
+        "host_category": pc.if_else(pc.equal(host, "Homo sapiens"), "Human", "Non-human").to_pandas(),
+        "country": tbl["country"].to_pandas(),
+        "collection_year": pc.if_else(has_year, pc.cast(pc.if_else(has_year, year_str, "0"), pa.int16()),
+                                      pa.scalar(None, pa.int16())).to_pandas(),
+    })
+
+
+def count_grouped(seqs: pa.Array, gid: np.ndarray, n_groups: int) -> pd.DataFrame:
+    """Sparse (group, position, byte) → count over sequences labelled with group ids."""
+    lens = pc.binary_length(seqs).to_numpy(zero_copy_only=False)
+    stride = int(lens.max(initial=0)) + 1
+    keys, freqs = [], []
+    for L in np.unique(lens):
+        if L == 0:
+            continue
+        sel = lens == L
+        mat = fixed_width_matrix(pc.filter(seqs, pa.array(sel)))
+        base = gid[sel].astype(np.int64) * 256
+        # dense bincount while the (group, byte) space is small next to the
+        # rows; otherwise sort-based counting, which only touches seen cells
+        dense = n_groups * 256 <= 4 * len(base)
+        for j in range(L):
+            cell = base + mat[:, j]
+            if dense:
+                counts = np.bincount(cell, minlength=n_groups * 256)
+                nz = np.flatnonzero(counts)
+                counts = counts[nz]
+            else:
+                nz, counts = np.unique(cell, return_counts=True)
+            # (group, position, byte) packed so that sorting keys sorts by all three
+            keys.append(((nz // 256) * stride + j + 1) * 256 + nz % 256)
+            freqs.append(counts)
+    if not keys:
+        return pd.DataFrame(columns=["group", "position", "byte", "frequency"])
+    key = np.concatenate(keys)
+    freq = np.concatenate(freqs)
+    key, inv = np.unique(key, return_inverse=True)
+    freq = np.bincount(inv, weights=freq, minlength=len(key)).astype(np.int64)
+    return pd.DataFrame({"group": key // 256 // stride, "position": key // 256 % stride,
+                         "byte": key % 256, "frequency": freq})
+
+
+def build_protein(protein: str, files: List[Path]) -> pa.Table:
+    tbl = pa.concat_tables(
+        pq.read_table(f, columns=["sequence", "genotype", "host", "country", "collection_date"])
+        for f in files
+    )
+    tbl = tbl.filter(pc.is_valid(tbl["sequence"]))
+    keys = filter_keys(tbl)
+    grouped = keys.groupby(GROUP_COLS, dropna=False, sort=True)
+    gid = grouped.ngroup().to_numpy()
+    groups = grouped.size().reset_index()[GROUP_COLS]
+
+    counts = count_grouped(tbl["sequence"].combine_chunks(), gid, len(groups))
+    cell = groups.iloc[counts["group"].to_numpy()].reset_index(drop=True)
+    out = pd.DataFrame({
+        "protein": protein,
+        **{c: cell[c] for c in GROUP_COLS},
+        "position": counts["position"].to_numpy(),
+        "aminoacid": counts["byte"].to_numpy().astype(np.uint8).view("S1").astype(str),
+        "frequency": counts["frequency"].to_numpy(),
+    })
+    return pa.Table.from_pandas(out, schema=CUBE_SCHEMA, preserve_index=False)
+
+
+def main() -> None:
+    a = parse_args()
+    root = Path(a.dataset)
+    out_path = Path(a.output)
+    if not root.exists():
+        raise SystemExit(f"Dataset not found: {root}")
+
+    parts = list_partitions(root)
+    if a.only_proteins:
+        keep = {s.strip() for s in a.only_proteins.split(",") if s.strip()}
+        parts = {k: v for k, v in parts.items() if k in keep}
+    if not parts:
+        raise SystemExit(f"No protein=* partitions under {root}")
+
+    tables = []
+    with ProcessPoolExecutor(max_workers=a.workers) as pool:
+        futures = {p: pool.submit(build_protein, p, fs) for p, fs in parts.items()}
+        for p, fut in futures.items():
+            t = fut.result()
+            print(f"[cube] {p}: {t.num_rows:,} rows")
+            tables.append(t)
+
+    cube = pa.concat_tables(tables)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(cube, out_path, compression=a.compression,
+                   use_dictionary=["protein", "genotype", "host_category", "country", "aminoacid"])
+    print(f"[cube] Wrote {cube.num_rows:,} rows → {out_path} "
+          f"({out_path.stat().st_size / 1e6:,.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Build a per-position amino-acid frequency table ("sequencecalc") from the
+Hive dataset written by partition_iav6_by_protein.py:
+
+  <dataset>/protein=M1/part-0.parquet   (needs a `sequence` column)
+  ...
+
+Output columns match IAV8_sequencecalc.parquet / IBV_preaggregated_frequencies:
+
+  protein, position, aminoacid,
+  frequency_all, total_all, value,
+  frequency_unique, total_unique, value_unique
+
+i.e. the same numbers the dashboards' live `positionStats` query computes
+with no filters applied. Residues are counted column-wise on uint8 views of
+the Arrow string buffers; proteins are processed in parallel processes.
+
+Usage (from repo root):
+
+  python src/data/build_sequencecalc.py \
+    --dataset src/data/IAV6_partitioned \
+    --output  src/data/IAV8_sequencecalc.parquet
+
+Optional flags:
+  --incremental        only count files not seen by the previous build and
+                       merge them into the existing output
+  --workers 4          worker processes (default: CPU count)
+  --only-proteins M1,NP
+
+Incremental state (files already counted, distinct sequences per protein)
+lives next to the output in `<output>.state/`. Files must be added, not
+rewritten: a changed or missing file forces a full rebuild.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+BATCH_SIZE = 65_536   # sequences per read batch
+
+OUTPUT_SCHEMA = pa.schema([
+    pa.field("protein", pa.string()),
+    pa.field("position", pa.int64()),
+    pa.field("aminoacid", pa.string()),
+    pa.field("frequency_all", pa.int32()),
+    pa.field("total_all", pa.int32()),
+    pa.field("value", pa.float64()),
+    pa.field("frequency_unique", pa.int32()),
+    pa.field("total_unique", pa.int32()),
+    pa.field("value_unique", pa.float64()),
+])
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Build per-position residue frequencies from a protein-partitioned dataset.")
+    p.add_argument("--dataset", required=True, help="Root of the Hive dataset (protein=*/…parquet)")
+    p.add_argument("--output", required=True, help="Output Parquet file")
+    p.add_argument("--incremental", action="store_true",
+                   help="Only count new files and merge into the existing output")
+    p.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    p.add_argument("--only-proteins", default=None,
+                   help="Comma-separated protein IDs to build (default: all partitions)")
+    return p.parse_args()
+
+
+# ───────────────────────── counting ─────────────────────────
+def fixed_width_matrix(arr: pa.Array) -> np.ndarray:
+    """View a non-null string array whose values all have the same length as (n, L) uint8."""
+    n = len(arr)
+    off_type = np.int64 if pa.types.is_large_string(arr.type) else np.int32
+    offsets = np.frombuffer(arr.buffers()[1], dtype=off_type)[arr.offset:arr.offset + n + 1]
+    data = np.frombuffer(arr.buffers()[2], dtype=np.uint8)[offsets[0]:offsets[-1]]
+    return data.reshape(n, -1) if n else data.reshape(0, 0)
+
+
+def count_residues(seqs: pa.Array | pa.ChunkedArray) -> np.ndarray:
+    """(max_len, 256) int64 counts of each byte at each 0-based position."""
+    if isinstance(seqs, pa.ChunkedArray):
+        seqs = seqs.combine_chunks()
+    seqs = pc.drop_null(seqs)
+    if len(seqs) == 0:
+        return np.zeros((0, 256), dtype=np.int64)
+
+    lens = pc.binary_length(seqs).to_numpy()
+    counts = np.zeros((int(lens.max()), 256), dtype=np.int64)
+    for L in np.unique(lens):
+        if L == 0:
+            continue
+        mat = fixed_width_matrix(pc.filter(seqs, pa.array(lens == L)))
+        for j in range(L):
+            counts[j] += np.bincount(mat[:, j], minlength=256)
+    return counts
+
+
+def add_counts(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    n = max(len(a), len(b))
+    out = np.zeros((n, 256), dtype=np.int64)
+    out[:len(a)] += a
+    out[:len(b)] += b
+    return out
+
+
+def counts_from_table(tbl: pa.Table, column: str) -> np.ndarray:
+    """Rebuild a (max_len, 256) count matrix from rows of an existing output table."""
+    if tbl.num_rows == 0:
+        return np.zeros((0, 256), dtype=np.int64)
+    pos = tbl["position"].to_numpy() - 1
+    aa = np.frombuffer("".join(tbl["aminoacid"].to_pylist()).encode("ascii"), dtype=np.uint8)
+    counts = np.zeros((int(pos.max()) + 1, 256), dtype=np.int64)
+    np.add.at(counts, (pos, aa), tbl[column].to_numpy())
+    return counts
+
+
+def counts_to_table(protein: str, all_counts: np.ndarray, uniq_counts: np.ndarray) -> pa.Table:
+    uniq_counts = add_counts(uniq_counts, np.zeros_like(all_counts))[:len(all_counts)]
+    pos, aa = np.nonzero(all_counts)                     # row-major → position, then residue
+    total_all = all_counts.sum(axis=1)[pos]
+    total_uniq = uniq_counts.sum(axis=1)[pos]
+    f_all = all_counts[pos, aa]
+    f_uniq = uniq_counts[pos, aa]
+    return pa.table({
+        "protein": pa.repeat(pa.scalar(protein, pa.string()), len(pos)),
+        "position": pa.array(pos + 1, pa.int64()),
+        "aminoacid": pa.array([chr(c) for c in aa], pa.string()),
+        "frequency_all": pa.array(f_all, pa.int32()),
+        "total_all": pa.array(total_all, pa.int32()),
+        "value": pa.array(f_all / total_all),
+        "frequency_unique": pa.array(f_uniq, pa.int32()),
+        "total_unique": pa.array(total_uniq, pa.int32()),
+        "value_unique": pa.array(np.divide(f_uniq, total_uniq, out=np.zeros(len(pos)),
+                                           where=total_uniq > 0)),
+    }, schema=OUTPUT_SCHEMA)
+
+
+# ───────────────────────── per-protein worker ─────────────────────────
+def iter_sequences(files: Iterable[Path]) -> Iterable[pa.Array]:
+    for f in files:
+        for batch in pq.ParquetFile(f).iter_batches(batch_size=BATCH_SIZE, columns=["sequence"]):
+            yield batch.column(0)
+
+
+def build_protein(protein: str, files: List[Path], distinct_dir: Path,
+                  existing: Optional[pa.Table]) -> pa.Table:
+    """Count `files` for one protein and merge with `existing` rows (incremental mode)."""
+    if existing is not None and existing.num_rows:
+        all_counts = counts_from_table(existing, "frequency_all")
+        uniq_counts = counts_from_table(existing, "frequency_unique")
+        seen_files = sorted(distinct_dir.glob("*.parquet"))
+        seen = (pa.concat_tables(pq.read_table(f) for f in seen_files)["sequence"]
+                if seen_files else pa.chunked_array([], pa.string()))
+    else:
+        all_counts = np.zeros((0, 256), dtype=np.int64)
+        uniq_counts = np.zeros((0, 256), dtype=np.int64)
+        seen = pa.chunked_array([], pa.string())
+
+    new_distinct = pa.array([], pa.string())
+    for seqs in iter_sequences(files):
+        all_counts = add_counts(all_counts, count_residues(seqs))
+        new_distinct = pc.unique(pa.chunked_array([new_distinct, pc.unique(seqs)]))
+
+    new_distinct = pc.drop_null(new_distinct)
+    if len(seen):
+        new_distinct = pc.filter(new_distinct, pc.invert(pc.is_in(new_distinct, value_set=seen)))
+    uniq_counts = add_counts(uniq_counts, count_residues(new_distinct))
+
+    if len(new_distinct):
+        distinct_dir.mkdir(parents=True, exist_ok=True)
+        n = len(list(distinct_dir.glob("*.parquet")))
+        pq.write_table(pa.table({"sequence": new_distinct}),
+                       distinct_dir / f"distinct-{n:05d}.parquet", compression="zstd")
+
+    return counts_to_table(protein, all_counts, uniq_counts)
+
+
+# ───────────────────────── driver ─────────────────────────
+def list_partitions(root: Path) -> Dict[str, List[Path]]:
+    parts: Dict[str, List[Path]] = {}
+    for d in sorted(root.glob("protein=*")):
+        if d.is_dir():
+            parts[d.name.split("=", 1)[1]] = sorted(d.glob("*.parquet"))
+    return parts
+
+
+def file_signature(f: Path) -> Tuple[int, int]:
+    st = f.stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def main() -> None:
+    a = parse_args()
+    root = Path(a.dataset)
+    out_path = Path(a.output)
+    state_dir = out_path.with_name(out_path.name + ".state")
+    manifest_path = state_dir / "manifest.json"
+
+    if not root.exists():
+        raise SystemExit(f"Dataset not found: {root}")
+    parts = list_partitions(root)
+    if a.only_proteins:
+        keep = {s.strip() for s in a.only_proteins.split(",") if s.strip()}
+        parts = {k: v for k, v in parts.items() if k in keep}
+    if not parts:
+        raise SystemExit(f"No protein=* partitions under {root}")
+
+    # Decide what to count
+    manifest: Dict[str, List] = {}
+    prev: Optional[pa.Table] = None
+    todo: Dict[str, List[Path]] = dict(parts)
+    if a.incremental and out_path.exists() and manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+        on_disk = {f.relative_to(root).as_posix(): f for fs in parts.values() for f in fs}
+        for rel, sig in manifest.items():
+            protein = rel.split("/", 1)[0].split("=", 1)[1]
+            f = on_disk.get(rel)
+            if protein in parts and (f is None or list(file_signature(f)) != sig):
+                raise SystemExit(f"[sequencecalc] {rel} changed or vanished since the last build – "
+                                 "run without --incremental")
+        todo = {p: [f for f in fs if f.relative_to(root).as_posix() not in manifest]
+                for p, fs in parts.items()}
+        todo = {p: fs for p, fs in todo.items() if fs}
+        prev = pq.read_table(out_path)
+        print(f"[sequencecalc] Incremental: {sum(map(len, todo.values()))} new file(s) "
+              f"in {len(todo)} protein(s)")
+    else:
+        if a.incremental:
+            print("[sequencecalc] No previous build found – counting everything")
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    # Count
+    results: Dict[str, pa.Table] = {}
+    if todo:
+        with ProcessPoolExecutor(max_workers=a.workers) as pool:
+            futures = {
+                p: pool.submit(build_protein, p, fs, state_dir / "distinct" / f"protein={p}",
+                               None if prev is None else prev.filter(pc.equal(prev["protein"], p)))
+                for p, fs in todo.items()
+            }
+            for p, fut in futures.items():
+                results[p] = fut.result()
+                print(f"[sequencecalc] {p}: {results[p].num_rows:,} rows")
+
+    # Assemble: proteins without new files come from the previous output
+    tables = []
+    if prev is not None:
+        tables.append(prev.filter(pc.invert(pc.is_in(prev["protein"], value_set=pa.array(list(results), pa.string())))))
+    tables.extend(results[p] for p in sorted(results))
+    out = pa.concat_tables(tables).cast(OUTPUT_SCHEMA) if tables else OUTPUT_SCHEMA.empty_table()
+    out = out.sort_by([("protein", "ascending"), ("position", "ascending"), ("aminoacid", "ascending")])
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    pq.write_table(out, tmp, compression="zstd")
+    os.replace(tmp, out_path)
+
+    for p, fs in todo.items():
+        for f in fs:
+            manifest[f.relative_to(root).as_posix()] = list(file_signature(f))
+    state_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+
+    print(f"[sequencecalc] Wrote {out.num_rows:,} rows for "
+          f"{len(pc.unique(out['protein']))} protein(s) → {out_path}")
+
+
+if __name__ == "__main__":
+    main()
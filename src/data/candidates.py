@@ -0,0 +1,375 @@
+"""
+Pick vaccine peptide candidates from slim prediction tables.
+
+A peptide binds an allele (a "hit") when its EL percentile is at most
+--el-max and, with --ba-max, its BA percentile at most --ba-max. Each
+peptide's hit alleles become a bitset of uint64 words; bit positions follow
+the allele order of HLAlistClassI.parquet, restricted to the alleles that
+occur in the predictions. Peptides with the same bitset are scored once.
+
+Population coverage is the IEDB population-coverage estimate: with f the
+summed frequency of the hit alleles of one locus (HLA-A, -B, -C, …), a person
+escapes that locus with probability (1 − f)², and is covered unless they
+escape every locus. Per-locus sums come from byte-wise lookup tables over
+the bitsets, so coverage of a million bitsets is a handful of array ops.
+Greedy needs --allele-frequencies. Without it, per-allele mode counts every
+allele as 1/n of its locus, n being the locus' alleles in HLAlistClassI.parquet,
+and writes that figure as `uniform_coverage`: it is not population coverage.
+
+Modes:
+  greedy      pick --n peptides one at a time, each maximising
+              coverage gain × conservancy^--conservancy-weight
+  per-allele  the --n best peptides for each allele, ranked by
+              (1 − EL/el-max) × conservancy^--conservancy-weight
+
+Conservancy (optional) is any table with `peptide` and --conservancy-column
+(default proportion_all), e.g. the output of kmer_index.py lookup or
+predictions_annotated.csv; peptides missing from it get conservancy 0.
+
+Usage (from repo root):
+
+  python src/data/candidates.py \
+    --predictions src/data/iedb_netmhc_slim \
+    --allele-frequencies src/data/allele_frequencies.csv \
+    --conservancy src/data/peptides_conservancy.csv \
+    --output src/data/candidates.csv
+
+Optional flags:
+  --hla src/data/HLAlistClassI.parquet   (default: next to this script)
+  --mode greedy | per-allele             (default: greedy)
+  --n 20
+  --el-max 2.0  --ba-max 2.0             (BA is not required by default)
+  --population "Europe"                  filter --allele-frequencies on its
+                                         `population` column
+  --peptide-dict src/data/peptide_dict.parquet
+                                         decode peptide_id predictions
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pcsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from peptide_dict import PeptideDictionary
+
+HLA_LIST = Path(__file__).with_name("HLAlistClassI.parquet")
+EL_COL = "netmhcpan_el_percentile"
+BA_COL = "netmhcpan_ba_percentile"
+_LOCUS = re.compile(r"^(?:HLA-)?([A-Za-z0-9]+)\*")
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Select vaccine peptide candidates by population coverage.")
+    p.add_argument("--predictions", required=True, nargs="+",
+                   help="Slim prediction Parquet file(s) or dataset directory")
+    p.add_argument("--output", required=True, help="Output CSV or Parquet (by extension)")
+    p.add_argument("--hla", default=str(HLA_LIST), help="HLA list (column 'Class I') fixing the bit order")
+    p.add_argument("--allele-frequencies", default=None,
+                   help="CSV/Parquet with allele, frequency [, population] (required for greedy)")
+    p.add_argument("--population", default=None, help="Use only rows of this population")
+    p.add_argument("--conservancy", default=None, help="CSV/Parquet with peptide and a conservancy column")
+    p.add_argument("--conservancy-column", default="proportion_all")
+    p.add_argument("--conservancy-weight", type=float, default=1.0,
+                   help="Exponent on conservancy in the ranking (0 → ignore; default: 1)")
+    p.add_argument("--mode", choices=["greedy", "per-allele"], default="greedy")
+    p.add_argument("--n", type=int, default=20, help="Peptides to pick (per allele for per-allele)")
+    p.add_argument("--el-max", type=float, default=2.0, help="EL percentile that counts as a hit")
+    p.add_argument("--ba-max", type=float, default=None, help="Also require BA percentile ≤ this")
+    p.add_argument("--peptide-dict", default=None, help="Decode peptide_id columns with this dictionary")
+    return p.parse_args()
+
+
+# ───────────────────────── inputs ─────────────────────────
+def read_table(path: Path) -> pa.Table:
+    if path.suffix.lower() == ".parquet":
+        return pq.read_table(path)
+    return pcsv.read_csv(path)
+
+
+def percentile_scale(field: pa.Field) -> float:
+    """Factor turning stored values into percentiles (uint16 columns store hundredths)."""
+    meta = field.metadata or {}
+    if b"scale" in meta:
+        return float(meta[b"scale"])
+    return 0.01 if pa.types.is_uint16(field.type) else 1.0
+
+
+def read_hits(paths: List[str], el_max: float, ba_max: Optional[float]) -> pa.Table:
+    """(allele, peptide|peptide_id, el, ba) rows that pass the thresholds."""
+    # A list given to ds.dataset must hold files; each path (file or Hive
+    # directory) becomes its own child dataset instead.
+    dataset = ds.dataset([ds.dataset(p, format="parquet", partitioning="hive") for p in paths])
+    names = dataset.schema.names
+    pep_col = "peptide" if "peptide" in names else "peptide_id"
+    for col in ("allele", pep_col, EL_COL):
+        if col not in names:
+            raise SystemExit(f"Predictions lack a `{col}` column (have: {', '.join(names)})")
+    el_scale = percentile_scale(dataset.schema.field(EL_COL))
+    cond = ds.field(EL_COL) <= el_max / el_scale
+    cols = ["allele", pep_col, EL_COL]
+    ba_scale = 1.0
+    if BA_COL in names:
+        cols.append(BA_COL)
+        ba_scale = percentile_scale(dataset.schema.field(BA_COL))
+        if ba_max is not None:
+            cond = cond & (ds.field(BA_COL) <= ba_max / ba_scale)
+    elif ba_max is not None:
+        raise SystemExit(f"--ba-max given but predictions have no `{BA_COL}` column")
+
+    tbl = dataset.to_table(columns=cols, filter=cond)
+    el = pc.multiply(tbl[EL_COL].cast(pa.float64()), el_scale)
+    ba = (pc.multiply(tbl[BA_COL].cast(pa.float64()), ba_scale) if BA_COL in cols
+          else pa.nulls(tbl.num_rows, pa.float64()))
+    return pa.table({"allele": tbl["allele"].cast(pa.string()), "peptide": tbl[pep_col],
+                     "el": el, "ba": ba})
+
+
+def hla_alleles(hla_path: Path) -> List[str]:
+    return pq.read_table(hla_path, columns=["Class I"])["Class I"].drop_null().to_pylist()
+
+
+def allele_order(hla: List[str], hla_name: str, alleles: List[str]) -> List[str]:
+    """`alleles` in HLA-list order; alleles missing from the list go last."""
+    rank = {a: i for i, a in enumerate(hla)}
+    unknown = sorted(a for a in alleles if a not in rank)
+    if unknown:
+        print(f"[candidates] ⚠️  {len(unknown)} allele(s) not in {hla_name}: {', '.join(unknown[:5])}"
+              + (" …" if len(unknown) > 5 else ""))
+    return sorted((a for a in alleles if a in rank), key=rank.get) + unknown
+
+
+def locus_of(allele: str) -> str:
+    m = _LOCUS.match(allele)
+    return m.group(1) if m else allele
+
+
+def uniform_frequencies(alleles: List[str], hla: List[str]) -> np.ndarray:
+    """1/n for each allele, n being the alleles of its locus in the HLA list (and `alleles`)."""
+    loci = Counter(locus_of(a) for a in set(hla) | set(alleles))
+    return np.array([1.0 / loci[locus_of(a)] for a in alleles])
+
+
+def allele_frequencies(path: Path, alleles: List[str], population: Optional[str]) -> np.ndarray:
+    """Frequency of each allele in `alleles` from an allele frequency table."""
+    tbl = read_table(path)
+    if population is not None:
+        if "population" not in tbl.column_names:
+            raise SystemExit(f"{path.name} has no `population` column")
+        tbl = tbl.filter(pc.equal(tbl["population"], population))
+        if tbl.num_rows == 0:
+            raise SystemExit(f"No rows for population {population!r} in {path.name}")
+    freq: Dict[str, float] = {}
+    for a, f in zip(tbl["allele"].to_pylist(), tbl["frequency"].to_pylist()):
+        if a is not None and f is not None:
+            freq[a] = freq.get(a, 0.0) + float(f)
+    missing = [a for a in alleles if a not in freq]
+    if missing:
+        print(f"[candidates] {len(missing)} predicted allele(s) have no frequency → 0")
+    return np.array([freq.get(a, 0.0) for a in alleles])
+
+
+def conservancy(path: Optional[Path], column: str, peptides: pa.Array) -> np.ndarray:
+    """Conservancy of each peptide (max over the table's rows; 0 when absent)."""
+    if path is None:
+        return np.ones(len(peptides))
+    tbl = read_table(path)
+    if column not in tbl.column_names or "peptide" not in tbl.column_names:
+        raise SystemExit(f"{path.name} needs `peptide` and `{column}` columns")
+    best = (tbl.select(["peptide", column]).group_by("peptide")
+            .aggregate([(column, "max")]))
+    idx = pc.index_in(peptides, value_set=best["peptide"].combine_chunks()).to_numpy(zero_copy_only=False)
+    found = ~np.isnan(idx.astype(np.float64))
+    vals = best[f"{column}_max"].to_numpy().astype(np.float64)
+    out = np.zeros(len(peptides))
+    out[found] = np.nan_to_num(vals[idx[found].astype(np.int64)])
+    if (~found).any():
+        print(f"[candidates] {(~found).sum():,} peptide(s) without conservancy → 0")
+    return out
+
+
+# ───────────────────────── bitsets ─────────────────────────
+def build_bitsets(pep_idx: np.ndarray, bit: np.ndarray, n_peps: int, n_bits: int) -> np.ndarray:
+    """(n_peps, words) uint64 with bit `bit[i]` set for peptide `pep_idx[i]`."""
+    words = max(1, -(-n_bits // 64))
+    masks = np.zeros((n_peps, words), dtype="<u8")
+    flat = np.unique(pep_idx.astype(np.int64) * n_bits + bit)   # one entry per (peptide, allele)
+    p, b = flat // n_bits, flat % n_bits
+    np.add.at(masks, (p, b // 64), np.left_shift(np.uint64(1), (b % 64).astype(np.uint64)))
+    return masks
+
+
+class Coverage:
+    """Population coverage of allele bitsets via per-byte lookup tables."""
+
+    def __init__(self, alleles: List[str], freq: np.ndarray) -> None:
+        self.alleles = alleles
+        loci = [locus_of(a) for a in alleles]
+        self.loci = sorted(set(loci))
+        locus_idx = np.array([self.loci.index(locus) for locus in loci])
+        n_bytes = max(1, -(-len(alleles) // 64)) * 8
+        # lut[j, v, k] = summed frequency of locus k over the bits set in byte value v at byte j
+        self.lut = np.zeros((n_bytes, 256, len(self.loci)))
+        values = np.arange(256)
+        for i, (f, k) in enumerate(zip(freq, locus_idx)):
+            j, b = divmod(i, 8)
+            self.lut[j, (values >> b) & 1 == 1, k] += f
+
+    def locus_sums(self, masks: np.ndarray) -> np.ndarray:
+        """(n, loci) summed frequency of the hit alleles per locus."""
+        by = np.ascontiguousarray(masks, dtype="<u8").view(np.uint8)
+        out = np.zeros((len(masks), len(self.loci)))
+        for j in range(by.shape[1]):
+            out += self.lut[j][by[:, j]]
+        return out
+
+    def coverage(self, masks: np.ndarray) -> np.ndarray:
+        f = np.clip(self.locus_sums(masks), 0.0, 1.0)
+        return 1.0 - np.prod((1.0 - f) ** 2, axis=1)
+
+    def names(self, mask: np.ndarray) -> List[str]:
+        bits = np.unpackbits(np.ascontiguousarray(mask, dtype="<u8").view(np.uint8), bitorder="little")
+        return [self.alleles[i] for i in np.flatnonzero(bits[:len(self.alleles)])]
+
+
+# ───────────────────────── selection ─────────────────────────
+def greedy(masks: np.ndarray, weight: np.ndarray, best_el: np.ndarray, cov: Coverage,
+           n: int) -> List[Tuple[int, float, float]]:
+    """[(peptide index, coverage gain, cumulative coverage)] picked greedily."""
+    uniq, group = np.unique(masks, axis=0, return_inverse=True)
+    group = group.ravel()
+    # best remaining peptide per bitset: highest weight, then lowest EL
+    order = np.lexsort((best_el, -weight, group))
+    starts = np.flatnonzero(np.concatenate(([True], group[order][1:] != group[order][:-1])))
+    ends = np.append(starts[1:], len(order))
+    cursor = starts.copy()
+
+    current = np.zeros(masks.shape[1], dtype="<u8")
+    covered = 0.0
+    picks = []
+    for _ in range(n):
+        live = cursor < ends
+        if not live.any():
+            break
+        gain = cov.coverage(uniq | current) - covered
+        top = order[np.minimum(cursor, len(order) - 1)]
+        score = np.where(live, np.maximum(gain, 0.0) * weight[top], -1.0)
+        g = int(np.argmax(score))
+        if score[g] <= 0:
+            break
+        p = int(top[g])
+        cursor[g] += 1
+        current |= masks[p]
+        picks.append((p, float(gain[g]), covered + float(gain[g])))
+        covered += float(gain[g])
+    return picks
+
+
+def per_allele(pep_idx: np.ndarray, bit: np.ndarray, el: np.ndarray, weight: np.ndarray,
+               el_max: float, n: int) -> np.ndarray:
+    """Row indices into the hit table of the `n` best peptides per allele bit."""
+    score = np.clip(1.0 - el / el_max, 0.0, 1.0) * weight[pep_idx]
+    order = np.lexsort((el, -score, bit))
+    b = bit[order]
+    first = np.flatnonzero(np.concatenate(([True], b[1:] != b[:-1])))
+    rank = np.arange(len(order)) - np.repeat(first, np.diff(np.append(first, len(order))))
+    return order[rank < n]
+
+
+# ───────────────────────── driver ─────────────────────────
+def write_table(tbl: pa.Table, out: Path) -> None:
+    out.parent.mkdir(parents=True, exist_ok=True)
+    if out.suffix.lower() == ".parquet":
+        pq.write_table(tbl, out, compression="zstd")
+    else:
+        pcsv.write_csv(tbl, out)
+
+
+def main() -> None:
+    a = parse_args()
+    t0 = time.time()
+    if a.mode == "greedy" and a.allele_frequencies is None:
+        raise SystemExit("Greedy selection maximises population coverage; pass --allele-frequencies")
+    hits = read_hits(a.predictions, a.el_max, a.ba_max)
+    if hits.num_rows == 0:
+        raise SystemExit(f"No predictions with EL ≤ {a.el_max}")
+    if pa.types.is_integer(hits["peptide"].type):
+        if a.peptide_dict is None:
+            raise SystemExit("Predictions carry peptide_id; pass --peptide-dict")
+        hits = hits.set_column(1, "peptide", PeptideDictionary(a.peptide_dict).decode(hits["peptide"]))
+
+    pep_enc = pc.dictionary_encode(hits["peptide"].combine_chunks())
+    peptides = pep_enc.dictionary
+    pep_idx = pep_enc.indices.to_numpy().astype(np.int64)
+    hla = hla_alleles(Path(a.hla))
+    alleles = allele_order(hla, Path(a.hla).name, pc.unique(hits["allele"]).to_pylist())
+    bit = pc.index_in(hits["allele"], value_set=pa.array(alleles)).to_numpy().astype(np.int64)
+    el = hits["el"].to_numpy()
+    ba = hits["ba"].to_numpy(zero_copy_only=False)
+
+    masks = build_bitsets(pep_idx, bit, len(peptides), len(alleles))
+    if a.allele_frequencies:
+        cov = Coverage(alleles, allele_frequencies(Path(a.allele_frequencies), alleles, a.population))
+        cov_col = "coverage"
+    else:
+        print(f"[candidates] No --allele-frequencies: `uniform_coverage` counts every allele as 1/n "
+              f"of its locus in {Path(a.hla).name}; it is not population coverage")
+        cov = Coverage(alleles, uniform_frequencies(alleles, hla))
+        cov_col = "uniform_coverage"
+    cons = conservancy(Path(a.conservancy) if a.conservancy else None, a.conservancy_column, peptides)
+    weight = cons ** a.conservancy_weight
+    best_el = np.full(len(peptides), np.inf)
+    np.minimum.at(best_el, pep_idx, el)
+    print(f"[candidates] {hits.num_rows:,} hits (EL ≤ {a.el_max}"
+          + (f", BA ≤ {a.ba_max}" if a.ba_max is not None else "") + f"): {len(peptides):,} peptides, "
+          f"{len(alleles)} alleles, {len(np.unique(masks, axis=0)):,} distinct allele sets")
+
+    if a.mode == "greedy":
+        picks = greedy(masks, weight, best_el, cov, a.n)
+        idx = np.array([p for p, _, _ in picks], dtype=np.int64)
+        out = pa.table({
+            "rank": pa.array(np.arange(1, len(picks) + 1), pa.int32()),
+            "peptide": pc.take(peptides, pa.array(idx)),
+            "alleles": pa.array([";".join(cov.names(masks[p])) for p in idx]),
+            "n_alleles": pa.array([len(cov.names(masks[p])) for p in idx], pa.int32()),
+            "best_el_percentile": pa.array(best_el[idx]),
+            "conservancy": pa.array(cons[idx]),
+            "coverage": pa.array(cov.coverage(masks[idx]) if len(idx) else np.empty(0)),
+            "coverage_gain": pa.array([g for _, g, _ in picks], pa.float64()),
+            "cumulative_coverage": pa.array([c for _, _, c in picks], pa.float64()),
+        })
+        total = picks[-1][2] if picks else 0.0
+        print(f"[candidates] Greedy: {len(picks)} peptide(s) cover {total:.1%} of the population")
+    else:
+        rows = per_allele(pep_idx, bit, el, weight, a.el_max, a.n)
+        rows = rows[np.lexsort((np.arange(len(rows)), bit[rows]))]
+        p = pep_idx[rows]
+        rank = np.arange(len(rows)) - np.searchsorted(bit[rows], bit[rows])
+        out = pa.table({
+            "allele": pa.array(np.array(alleles, dtype=object)[bit[rows]], pa.string()),
+            "rank": pa.array(rank + 1, pa.int32()),
+            "peptide": pc.take(peptides, pa.array(p)),
+            "netmhcpan_el_percentile": pa.array(el[rows]),
+            "netmhcpan_ba_percentile": pa.array(ba[rows], pa.float64(), from_pandas=True),
+            "conservancy": pa.array(cons[p]),
+            "n_alleles": pa.array(np.unpackbits(masks[p].view(np.uint8), axis=1).sum(axis=1), pa.int32()),
+            cov_col: pa.array(cov.coverage(masks[p]) if len(p) else np.empty(0)),
+        })
+        print(f"[candidates] Per allele: {out.num_rows:,} rows for {len(np.unique(bit[rows]))} allele(s)")
+
+    write_table(out, Path(a.output))
+    print(f"[candidates] Wrote {a.output} in {time.time() - t0:,.1f}s")
+
+
+if __name__ == "__main__":
+    main()
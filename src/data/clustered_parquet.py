@@ -0,0 +1,215 @@
+"""
+Clustered (sorted) Parquet writer for the slim prediction tables.
+
+`write_clustered` sorts an arbitrarily large stream of tables by `sort_keys`
+with a bounded-memory external sort and writes one Parquet file laid out for
+point and range lookups:
+
+- rows ordered by the sort keys (e.g. allele, then peptide), so min/max
+  statistics let readers skip almost every row group for `WHERE allele = …`
+  or `WHERE peptide = …`
+- small row groups (default 64k rows) and a page index
+- Bloom filters on the high-cardinality lookup columns (e.g. peptide)
+- the sort order recorded as `sorting_columns` in the footer
+
+Phase 1 sorts chunks of at most `memory_rows` rows and spills them as run
+files to a temporary directory. Phase 2 merges the runs batch by batch: every
+round emits all buffered rows that are <= the smallest "last key" held by any
+run, which keeps at most one read batch per run in memory.
+
+`external_sort` and `open_clustered` are the two halves on their own, for
+callers that transform the sorted stream before writing it (compact_results.py
+drops duplicate keys).
+"""
+
+from __future__ import annotations
+
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+MERGE_BATCH_ROWS = 65_536
+
+
+def plain_schema(schema: pa.Schema) -> pa.Schema:
+    """`schema` with dictionary-encoded fields replaced by their value types; metadata kept."""
+    return pa.schema([
+        pa.field(f.name, f.type.value_type if pa.types.is_dictionary(f.type) else f.type, f.nullable,
+                 metadata=f.metadata)
+        for f in schema
+    ], metadata=schema.metadata)
+
+
+def _row_key(tbl: pa.Table, keys: Sequence[str], i: int) -> Tuple:
+    """(is_null, value) per key, so nulls compare last like `sort_by` puts them."""
+    vals = (tbl.column(k)[i].as_py() for k in keys)
+    return tuple((v is None, v) for v in vals)
+
+
+def _upper_bound(tbl: pa.Table, keys: Sequence[str], bound: Tuple) -> int:
+    """Number of leading rows of sorted `tbl` whose key is <= `bound`."""
+    lo, hi = 0, tbl.num_rows
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _row_key(tbl, keys, mid) <= bound:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class _RowGroupWriter:
+    """Buffer sorted tables and write them as fixed-size row groups."""
+
+    def __init__(self, path: Path, schema: pa.Schema, row_group_size: int, **writer_kwargs) -> None:
+        try:
+            self.writer = pq.ParquetWriter(str(path), schema, **writer_kwargs)
+        except TypeError:
+            # pyarrow without bloom filter support – still write the sorted layout
+            writer_kwargs.pop("bloom_filter_options", None)
+            print("⚠️  This pyarrow cannot write Bloom filters; writing without them")
+            self.writer = pq.ParquetWriter(str(path), schema, **writer_kwargs)
+        self.row_group_size = row_group_size
+        self.pending: List[pa.Table] = []
+        self.pending_rows = 0
+        self.rows = 0
+
+    def write(self, tbl: pa.Table) -> None:
+        self.pending.append(tbl)
+        self.pending_rows += tbl.num_rows
+        if self.pending_rows >= self.row_group_size:
+            buf = pa.concat_tables(self.pending)
+            full = (buf.num_rows // self.row_group_size) * self.row_group_size
+            self.writer.write_table(buf.slice(0, full), row_group_size=self.row_group_size)
+            self.rows += full
+            rest = buf.slice(full)
+            self.pending, self.pending_rows = [rest], rest.num_rows
+
+    def close(self) -> None:
+        if self.pending_rows:
+            self.writer.write_table(pa.concat_tables(self.pending), row_group_size=self.row_group_size)
+            self.rows += self.pending_rows
+        self.writer.close()
+
+
+def external_sort(tables: Iterable[pa.Table],
+                  sort_keys: Sequence[str],
+                  *,
+                  memory_rows: int = 5_000_000,
+                  tmp_dir: Optional[str | Path] = None) -> Iterator[pa.Table]:
+    """
+    Yield the rows of `tables` sorted by `sort_keys` (ascending), as a series of
+    sorted tables, holding at most `memory_rows` input rows in memory. Yields at
+    least one (possibly empty) table unless `tables` is empty. Field and schema
+    metadata of the first table (e.g. a percentile `scale`) are kept.
+    """
+    order = [(k, "ascending") for k in sort_keys]
+    spill = Path(tempfile.mkdtemp(prefix="clustered-", dir=tmp_dir))
+    runs: List[Path] = []
+    schema: Optional[pa.Schema] = None
+    chunk: List[pa.Table] = []
+    chunk_rows = 0
+
+    def flush_run() -> None:
+        nonlocal chunk, chunk_rows
+        run = pa.concat_tables(chunk).sort_by(order)
+        path = spill / f"run-{len(runs):05d}.parquet"
+        pq.write_table(run, path, compression="LZ4", row_group_size=MERGE_BATCH_ROWS)
+        runs.append(path)
+        chunk, chunk_rows = [], 0
+
+    try:
+        # Phase 1: sorted runs
+        for tbl in tables:
+            if schema is None:
+                schema = plain_schema(tbl.schema)
+            chunk.append(tbl.cast(schema))
+            chunk_rows += tbl.num_rows
+            if chunk_rows >= memory_rows:
+                flush_run()
+        if schema is None:
+            return
+
+        # Everything fit in memory: no merge needed
+        if not runs:
+            yield pa.concat_tables(chunk).sort_by(order)
+            return
+        if chunk:
+            flush_run()
+
+        # Phase 2: k-way merge, one batch per run in memory
+        readers = {i: pq.ParquetFile(p).iter_batches(batch_size=MERGE_BATCH_ROWS) for i, p in enumerate(runs)}
+        buffers: Dict[int, pa.Table] = {}
+        while readers or buffers:
+            for i in list(readers):
+                if i not in buffers or buffers[i].num_rows == 0:
+                    batch = next(readers[i], None)
+                    if batch is None:
+                        del readers[i]
+                        buffers.pop(i, None)
+                    else:
+                        buffers[i] = pa.Table.from_batches([batch])
+            buffers = {i: b for i, b in buffers.items() if b.num_rows}
+            if not buffers:
+                break
+
+            bound = min(_row_key(b, sort_keys, b.num_rows - 1) for b in buffers.values())
+            out = []
+            for i, b in buffers.items():
+                n = _upper_bound(b, sort_keys, bound)
+                out.append(b.slice(0, n))
+                buffers[i] = b.slice(n)
+            yield pa.concat_tables(out).sort_by(order).cast(schema)
+    finally:
+        shutil.rmtree(spill, ignore_errors=True)
+
+
+def open_clustered(out_path: str | Path,
+                   schema: pa.Schema,
+                   sort_keys: Sequence[str],
+                   *,
+                   row_group_size: int = 65_536,
+                   bloom_columns: Sequence[str] = ("peptide",),
+                   bloom_fpp: float = 0.01,
+                   compression: str = "ZSTD",
+                   use_dictionary: Optional[Sequence[str]] = None) -> _RowGroupWriter:
+    """Writer for already sorted tables: small row groups, page index, Bloom filters."""
+    sorting = pq.SortingColumn.from_ordering(schema, [(k, "ascending") for k in sort_keys])
+    return _RowGroupWriter(
+        Path(out_path), schema, row_group_size,
+        compression=compression,
+        use_dictionary=list(use_dictionary) if use_dictionary is not None else True,
+        write_page_index=True,
+        sorting_columns=sorting,
+        bloom_filter_options={c: {"ndv": row_group_size, "fpp": bloom_fpp}
+                              for c in bloom_columns if c in schema.names},
+    )
+
+
+def write_clustered(tables: Iterable[pa.Table],
+                    out_path: str | Path,
+                    sort_keys: Sequence[str],
+                    *,
+                    memory_rows: int = 5_000_000,
+                    row_group_size: int = 65_536,
+                    bloom_columns: Sequence[str] = ("peptide",),
+                    bloom_fpp: float = 0.01,
+                    compression: str = "ZSTD",
+                    use_dictionary: Optional[Sequence[str]] = None,
+                    tmp_dir: Optional[str | Path] = None) -> int:
+    """Externally sort `tables` by `sort_keys` into a lookup-optimised Parquet file."""
+    writer: Optional[_RowGroupWriter] = None
+    for tbl in external_sort(tables, sort_keys, memory_rows=memory_rows, tmp_dir=tmp_dir):
+        if writer is None:
+            writer = open_clustered(out_path, tbl.schema, sort_keys, row_group_size=row_group_size,
+                                    bloom_columns=bloom_columns, bloom_fpp=bloom_fpp,
+                                    compression=compression, use_dictionary=use_dictionary)
+        writer.write(tbl)
+    if writer is None:
+        return 0
+    writer.close()
+    return writer.rows
@@ -0,0 +1,254 @@
+"""
+Compact accumulated IEDB results: drop duplicate predictions and sort.
+
+peptidecalcs appends every finished batch to its results, so repeated or
+partial runs leave several rows for the same (allele, peptide) prediction,
+and slim_parquet.py carries them on. Compaction keeps the newest row per key
+(the one written last), sorts by the key and rewrites the results in place:
+
+  results CSV (RESULTS_OUT)          → the same CSV, deduplicated and sorted
+  slim Parquet file                  → a clustered Parquet file
+  Parquet results dataset            → every partition directory on its own
+  (RESULTS_DATASET)                    becomes batch-000000-compacted.parquet,
+                                       which sorts before the batch files
+                                       peptidecalcs writes later, so newer
+                                       batches still win the next compaction
+
+Rows are tagged with their position in the input and sorted by key with the
+bounded-memory external sort from clustered_parquet.py; the first row of each
+key in the sorted stream is the newest one. The new file is written next to
+the old one and swapped in when complete.
+
+Run it while peptidecalcs is not running. With --cache, compaction refuses to
+touch a CSV whose last run was interrupted mid-write: the byte offset the
+cache keeps for that batch would point into the old file.
+
+Usage (from repo root):
+
+  python src/data/compact_results.py src/data/iedb_netmhcpan_30k_allalleles_results.csv
+  python src/data/compact_results.py src/data/iedb_netmhc_slim --memory-mb 512
+
+Optional flags:
+  --output PATH          write here instead of replacing a single-file input
+                         (.csv or .parquet)
+  --keys allele,peptide  (default: allele, peptide – or peptide_id – plus
+                         method when the table has a method column)
+  --memory-mb 1024       memory budget of the sort
+  --cache src/data/…_cache.sqlite
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pcsv
+import pyarrow.parquet as pq
+
+from clustered_parquet import external_sort, open_clustered, plain_schema
+
+RANK = "__rank"                     # −(row number): ascending sort puts the newest row first
+COMPACTED_NAME = "batch-000000-compacted.parquet"
+CSV_BLOCK_SIZE = 1 << 24            # 16 MB CSV read blocks
+PARQUET_BATCH_ROWS = 262_144
+SORT_OVERHEAD = 3                   # a sorted run briefly exists as chunks, concat and sorted copy
+MIN_RUN_ROWS = 10_000
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Deduplicate and sort accumulated IEDB results.")
+    p.add_argument("input", help="Results CSV, slim Parquet file or Parquet results dataset")
+    p.add_argument("--output", default=None, help="Write here instead of in place (single-file inputs)")
+    p.add_argument("--keys", default=None,
+                   help="Comma-separated key columns (default: allele,peptide[,method])")
+    p.add_argument("--memory-mb", type=float, default=1024, help="Memory budget of the sort (default: 1024)")
+    p.add_argument("--cache", default=None,
+                   help="peptidecalcs cache; refuse if a batch was interrupted mid-write")
+    return p.parse_args()
+
+
+# ───────────────────────── reading ─────────────────────────
+def read_tables(files: Sequence[Path]) -> Iterator[pa.Table]:
+    """Tables of `files` in write order, each row tagged with RANK."""
+    start = 0
+    for f in files:
+        if f.suffix.lower() == ".csv":
+            batches = pcsv.open_csv(
+                f, read_options=pcsv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+                convert_options=pcsv.ConvertOptions(
+                    column_types={"allele": pa.string(), "peptide": pa.string()}),
+            )
+        else:
+            batches = pq.ParquetFile(f).iter_batches(batch_size=PARQUET_BATCH_ROWS)
+        for batch in batches:
+            n = batch.num_rows
+            rank = pa.array(-np.arange(start, start + n, dtype=np.int64))
+            start += n
+            yield pa.Table.from_batches([batch]).append_column(RANK, rank)
+
+
+def default_keys(schema: pa.Schema) -> List[str]:
+    peptide = "peptide" if "peptide" in schema.names else "peptide_id"
+    return ["allele", peptide] + (["method"] if "method" in schema.names else [])
+
+
+def memory_rows(first: pa.Table, memory_mb: float) -> int:
+    """Rows per sorted run that fit the budget, from the size of the first table."""
+    per_row = max(first.nbytes / max(first.num_rows, 1), 1.0)
+    return max(int(memory_mb * 2**20 / (per_row * SORT_OVERHEAD)), MIN_RUN_ROWS)
+
+
+def _key_at(tbl: pa.Table, keys: Sequence[str], i: int) -> Tuple:
+    return tuple(tbl.column(k)[i].as_py() for k in keys)
+
+
+def newest_per_key(tables: Iterator[pa.Table], keys: Sequence[str]) -> Iterator[pa.Table]:
+    """Keep the first row of every key in a stream sorted by (keys, RANK); drop RANK."""
+    prev: Optional[Tuple] = None
+    for tbl in tables:
+        n = tbl.num_rows
+        if n == 0:
+            yield tbl.drop_columns([RANK])
+            continue
+        first = np.ones(n, dtype=bool)
+        if n > 1:
+            changed = np.zeros(n - 1, dtype=bool)
+            for k in keys:
+                col = tbl.column(k).combine_chunks()
+                ne = pc.fill_null(pc.not_equal(col.slice(1), col.slice(0, n - 1)), True)
+                changed |= ne.to_numpy(zero_copy_only=False)
+            first[1:] = changed
+        if prev is not None and _key_at(tbl, keys, 0) == prev:
+            first[0] = False
+        prev = _key_at(tbl, keys, n - 1)
+        yield tbl.filter(pa.array(first)).drop_columns([RANK])
+
+
+# ───────────────────────── compaction ─────────────────────────
+def compact(files: Sequence[Path], out_path: Path, keys_arg: Optional[List[str]],
+            memory_mb: float, in_place: bool = True) -> Dict[str, int]:
+    """
+    Compact `files` (oldest first) into `out_path`; returns row and byte counts.
+    With `in_place` the inputs are replaced, i.e. removed once `out_path` is
+    written; otherwise they are left alone.
+    """
+    tables = read_tables(files)
+    first = next(tables, None)
+    if first is None:
+        raise SystemExit(f"No rows in {', '.join(str(f) for f in files)}")
+    keys = keys_arg or default_keys(first.schema)
+    missing = [k for k in keys if k not in first.schema.names]
+    if missing:
+        raise SystemExit(f"Key column(s) {', '.join(missing)} not in {files[0]}")
+
+    rows_in = 0
+
+    def counted() -> Iterator[pa.Table]:
+        nonlocal rows_in
+        for t in itertools.chain([first], tables):
+            rows_in += t.num_rows
+            yield t
+
+    # Written with the input's own schema (metadata such as a uint16 `scale`
+    # included), not with whatever schema comes out of the sort
+    schema = plain_schema(first.schema.remove(first.schema.get_field_index(RANK)))
+    sort_keys = list(keys) + [RANK]
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    writer = None
+    rows_out = 0
+    try:
+        for tbl in newest_per_key(external_sort(counted(), sort_keys,
+                                                memory_rows=memory_rows(first, memory_mb),
+                                                tmp_dir=out_path.parent), keys):
+            if writer is None:
+                if out_path.suffix.lower() == ".csv":
+                    writer = pcsv.CSVWriter(str(tmp), schema,
+                                            write_options=pcsv.WriteOptions(quoting_style="needed"))
+                else:
+                    writer = open_clustered(tmp, schema, keys, use_dictionary=["allele", "peptide"])
+            writer.write(tbl.cast(schema))
+            rows_out += tbl.num_rows
+        writer.close()
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+    bytes_in = sum(f.stat().st_size for f in files)
+    os.replace(tmp, out_path)
+    if in_place:
+        for f in files:
+            if f.resolve() != out_path.resolve():
+                f.unlink()
+    return {"rows_in": rows_in, "rows_out": rows_out,
+            "bytes_in": bytes_in, "bytes_out": out_path.stat().st_size}
+
+
+def units(path: Path, output: Optional[Path]) -> List[Tuple[List[Path], Path]]:
+    """(input files oldest first, output file) for every independent part of `path`."""
+    if path.is_file():
+        return [([path], output or path)]
+    if output is not None:
+        raise SystemExit("--output only applies to single-file inputs")
+    leaves: Dict[Path, List[Path]] = {}
+    for f in path.rglob("*.parquet"):
+        leaves.setdefault(f.parent, []).append(f)
+    # Batch files are named after the batch number, so name order is write order
+    return [(sorted(fs, key=lambda f: f.name), leaf / COMPACTED_NAME) for leaf, fs in sorted(leaves.items())]
+
+
+def check_cache(cache: Path) -> None:
+    con = sqlite3.connect(f"file:{cache}?mode=ro", uri=True)
+    try:
+        n = con.execute("SELECT COUNT(*) FROM jobs WHERE status = 'writing'").fetchone()[0]
+    finally:
+        con.close()
+    if n:
+        raise SystemExit(f"{cache.name}: {n} batch(es) were interrupted mid-write; "
+                         "run peptidecalcs once to recover them before compacting")
+
+
+def fmt_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:,.1f} {unit}"
+        n /= 1024
+    return f"{n:,.1f} GB"
+
+
+def main() -> None:
+    a = parse_args()
+    t0 = time.time()
+    path = Path(a.input)
+    if not path.exists():
+        raise SystemExit(f"Input not found: {path}")
+    if a.cache:
+        check_cache(Path(a.cache))
+    keys = [k.strip() for k in a.keys.split(",") if k.strip()] if a.keys else None
+
+    todo = units(path, Path(a.output) if a.output else None)
+    totals = {"rows_in": 0, "rows_out": 0, "bytes_in": 0, "bytes_out": 0}
+    for files, out in todo:
+        if files == [out] and out.name == COMPACTED_NAME:
+            print(f"[compact] {out.parent.name}: already compact")
+            continue
+        r = compact(files, out, keys, a.memory_mb, in_place=a.output is None)
+        for k in totals:
+            totals[k] += r[k]
+        print(f"[compact] {out.parent.name if out.name == COMPACTED_NAME else out.name}: "
+              f"{r['rows_in']:,} → {r['rows_out']:,} rows ({r['rows_in'] - r['rows_out']:,} duplicates), "
+              f"{fmt_bytes(r['bytes_in'])} → {fmt_bytes(r['bytes_out'])}")
+
+    print(f"[compact] Reclaimed {totals['rows_in'] - totals['rows_out']:,} rows and "
+          f"{fmt_bytes(totals['bytes_in'] - totals['bytes_out'])} in {time.time() - t0:,.1f}s")
+
+
+if __name__ == "__main__":
+    main()
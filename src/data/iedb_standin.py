@@ -0,0 +1,408 @@
+"""
+Local stand-in for the IEDB Next-Gen tools API, and a load-test harness that
+runs the peptidecalcs client against it.
+
+The server mimics the two endpoints peptidecalcs uses:
+
+  POST /pipeline          → {"result_id", "pipeline_id", "results_uri"}
+  GET  /results/{id}      → {"status": "pending" | "running" | "done" | "error", …}
+  GET  /stats             counters of requests and injected faults (not in IEDB)
+
+Jobs go through a simulated queue: `--workers` jobs compute at once, each
+job waits at least --queue-s and then takes
+--per-window-s · n + --per-window2-s · n² seconds for n scored windows
+(the quadratic term models very large jobs slowing down), ± --jitter.
+Peptide tables have the IEDB columns; percentiles are a hash of (method,
+allele, peptide), so every run returns the same numbers for the same input.
+
+Faults, drawn from a seeded RNG per request:
+  --error-rate 0.05      answer 503
+  --drop-rate 0.01       close the connection without answering
+  --burst-every 60 --burst-s 5
+                         answer every request with 503 for 5 s each minute
+  --fail-rate 0.01       finish a job with status "error"
+
+Usage (from src/data):
+
+  python iedb_standin.py serve --port 8765 --error-rate 0.05
+  python iedb_standin.py loadtest --peptides 20000 --in-flight 4 \
+    --error-rate 0.05 --burst-every 30 --burst-s 3 --output loadtest.json
+
+`loadtest` starts the server in-process and points peptidecalcs at it
+(results, cache and telemetry go to a temporary directory). It generates
+random peptides and calls `peptidecalcs.run_predictions`. If a run aborts,
+it is restarted up to --restarts times, and the restart resumes from the
+prediction cache. The report gives end-to-end throughput, client retries
+(every retry robust_request makes, including those of given-up jobs and of
+resumed-job checks) and the faults the server injected.
+
+Optional loadtest flags:
+  --lengths 8,9,10        --alleles HLA-A*02:01,HLA-B*07:02
+  --batch-size 1000       --fixed-batches (turn off adaptive sizing)
+  --in-flight 4           --poll-min 0.5   --poll-interval 2
+  --max-retries 3         --seed 0
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import math
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+import peptidecalcs
+from batch_sizer import job_windows
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+TABLE_COLUMNS = ["seq #", "peptide", "start", "end", "peptide length", "allele"]
+
+
+@dataclass
+class StandinConfig:
+    queue_s: float = 1.0          # minimum time between accept and done
+    per_window_s: float = 2e-4    # compute seconds per scored window
+    per_window2_s: float = 0.0    # … plus this times windows²
+    jitter: float = 0.2           # ± fraction applied to the compute time
+    workers: int = 4              # jobs computed concurrently
+    error_rate: float = 0.0
+    drop_rate: float = 0.0
+    burst_every: float = 0.0      # seconds between 503 bursts (0 → none)
+    burst_s: float = 0.0
+    fail_rate: float = 0.0
+    seed: int = 0
+
+
+@dataclass
+class Job:
+    peptides: List[str]
+    alleles: List[str]
+    methods: List[str]
+    length_range: Tuple[int, int]
+    windows: int
+    done_at: float
+    failed: bool
+
+
+def percentile(method: str, allele: str, peptide: str) -> float:
+    """Deterministic fake percentile, skewed towards low values like real ones."""
+    h = hashlib.blake2b(f"{method}|{allele}|{peptide}".encode(), digest_size=8).digest()
+    u = int.from_bytes(h, "little") / 2.0**64
+    return round(min(-25.0 * math.log1p(-u), 100.0), 3)
+
+
+def peptide_table(job: Job) -> Dict[str, Any]:
+    """The peptide_table result of `job`: every window of every input, for every allele."""
+    lo, hi = job.length_range
+    rows = []
+    for seq_no, seq in enumerate(job.peptides, start=1):
+        for k in range(lo, min(hi, len(seq)) + 1):
+            for i in range(len(seq) - k + 1):
+                pep = seq[i:i + k]
+                for allele in job.alleles:
+                    row = [seq_no, pep, i + 1, i + k, k, allele]
+                    for m in job.methods:
+                        pct = percentile(m, allele, pep)
+                        row += [round(1 - pct / 100, 4), pct]
+                    rows.append(row)
+    cols = TABLE_COLUMNS + [f"{m}_{x}" for m in job.methods for x in ("score", "percentile")]
+    return {"type": "peptide_table", "table_columns": [{"name": c} for c in cols], "table_data": rows}
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], config: StandinConfig) -> None:
+        super().__init__(address, StandinHandler)
+        self.config = config
+        self.lock = threading.Lock()
+        self.rng = random.Random(config.seed)
+        self.started = time.monotonic()
+        self.jobs: Dict[str, Job] = {}
+        self.ids = itertools.count(1)
+        self.free_at = [0.0] * max(config.workers, 1)     # heap of worker-free times
+        self.counters: Dict[str, int] = {
+            "submits": 0, "polls": 0, "jobs_done": 0, "jobs_failed": 0, "windows": 0,
+            "errors_503": 0, "burst_503": 0, "drops": 0, "not_found": 0,
+        }
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self.lock:
+            self.counters[key] += n
+
+    def fault(self) -> Optional[str]:
+        """'burst' | 'error' | 'drop' | None for the request being handled."""
+        c = self.config
+        if c.burst_every > 0 and (time.monotonic() - self.started) % c.burst_every < c.burst_s:
+            return "burst"
+        with self.lock:
+            u = self.rng.random()
+        if u < c.error_rate:
+            return "error"
+        if u < c.error_rate + c.drop_rate:
+            return "drop"
+        return None
+
+    def submit(self, peptides: List[str], alleles: List[str], methods: List[str],
+               length_range: Tuple[int, int]) -> str:
+        c = self.config
+        lo, hi = length_range
+        windows = job_windows((len(p) for p in peptides), lo, hi)
+        now = time.monotonic()
+        with self.lock:
+            jitter = 1.0 + c.jitter * (2 * self.rng.random() - 1)
+            failed = self.rng.random() < c.fail_rate
+            start = max(now + c.queue_s, heapq.heappop(self.free_at))
+            done_at = start + (c.per_window_s * windows + c.per_window2_s * windows ** 2) * jitter
+            heapq.heappush(self.free_at, done_at)
+            rid = f"standin-{next(self.ids)}"
+            self.jobs[rid] = Job(peptides, alleles, methods, length_range, windows, done_at, failed)
+            self.counters["windows"] += windows
+        return rid
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    server: StandinServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def send_json(self, obj: Any, code: int = 200) -> None:
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def injected(self) -> bool:
+        """Answer with an injected fault; True if one was injected."""
+        kind = self.server.fault()
+        if kind is None:
+            return False
+        if kind == "drop":
+            self.server.count("drops")
+            self.close_connection = True
+        else:
+            self.server.count("burst_503" if kind == "burst" else "errors_503")
+            self.send_json({"detail": "Service temporarily unavailable"}, 503)
+        return True
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.rstrip("/").rsplit("/", 1)[-1] != "pipeline":
+            return self.send_json({"detail": "Not found"}, 404)
+        if self.injected():
+            return
+        try:
+            stage = json.loads(body)["stages"][0]
+            params = stage["input_parameters"]
+            peptides = [line.strip() for line in stage["input_sequence_text"].splitlines()
+                        if line.strip() and not line.startswith(">")]
+            alleles = params["alleles"].split(",")
+            methods = [p["method"] for p in params["predictors"]]
+            lo, hi = params["peptide_length_range"]
+        except (KeyError, IndexError, TypeError, ValueError) as exc:
+            return self.send_json({"detail": f"Bad request: {exc}"}, 400)
+        rid = self.server.submit(peptides, alleles, methods, (int(lo), int(hi)))
+        self.server.count("submits")
+        self.send_json({"result_id": rid, "pipeline_id": f"pipeline-{rid}",
+                        "results_uri": f"/api/v1/results/{rid}"})
+
+    def do_GET(self) -> None:
+        parts = self.path.rstrip("/").split("/")
+        if parts[-1] == "stats":
+            with self.server.lock:
+                return self.send_json(dict(self.server.counters))
+        if len(parts) < 2 or parts[-2] != "results":
+            return self.send_json({"detail": "Not found"}, 404)
+        if self.injected():
+            return
+        self.server.count("polls")
+        job = self.server.jobs.get(parts[-1])
+        if job is None:
+            self.server.count("not_found")
+            return self.send_json({"detail": "Result not found"}, 404)
+        if time.monotonic() < job.done_at:
+            return self.send_json({"status": "running"})
+        if job.failed:
+            self.server.count("jobs_failed")
+            return self.send_json({"status": "error", "errors": ["Simulated job failure"]})
+        self.server.count("jobs_done")
+        self.send_json({"status": "done", "data": {"results": [peptide_table(job)]}})
+
+
+def start_server(config: StandinConfig, host: str = "127.0.0.1", port: int = 0) -> StandinServer:
+    """Serve in a daemon thread; the bound port is `server.server_address[1]`."""
+    server = StandinServer((host, port), config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ───────────────────────── CLI ─────────────────────────
+def _server_flags(p: argparse.ArgumentParser) -> None:
+    d = StandinConfig()
+    p.add_argument("--queue-s", type=float, default=d.queue_s, help="Minimum seconds from accept to done")
+    p.add_argument("--per-window-s", type=float, default=d.per_window_s, help="Compute seconds per window")
+    p.add_argument("--per-window2-s", type=float, default=d.per_window2_s,
+                   help="Extra compute seconds per window² (large-job slow-down)")
+    p.add_argument("--jitter", type=float, default=d.jitter)
+    p.add_argument("--workers", type=int, default=d.workers, help="Jobs computed at once")
+    p.add_argument("--error-rate", type=float, default=d.error_rate, help="Share of requests answered 503")
+    p.add_argument("--drop-rate", type=float, default=d.drop_rate, help="Share of connections dropped")
+    p.add_argument("--burst-every", type=float, default=d.burst_every, help="Seconds between 503 bursts")
+    p.add_argument("--burst-s", type=float, default=d.burst_s, help="Length of each burst")
+    p.add_argument("--fail-rate", type=float, default=d.fail_rate, help="Share of jobs ending in 'error'")
+    p.add_argument("--seed", type=int, default=d.seed)
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Local IEDB API stand-in and load-test harness.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    s = sub.add_parser("serve", help="Run the stand-in server")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8765)
+    _server_flags(s)
+
+    t = sub.add_parser("loadtest", help="Run the peptidecalcs client against an in-process server")
+    t.add_argument("--peptides", type=int, default=5_000, help="Random peptides to predict")
+    t.add_argument("--lengths", default="8,9,10")
+    t.add_argument("--alleles", default="HLA-A*02:01,HLA-B*07:02,HLA-C*07:01")
+    t.add_argument("--batch-size", type=int, default=1_000)
+    t.add_argument("--fixed-batches", action="store_true", help="Turn off adaptive batch sizing")
+    t.add_argument("--in-flight", type=int, default=4)
+    t.add_argument("--poll-min", type=float, default=0.5)
+    t.add_argument("--poll-interval", type=float, default=2.0)
+    t.add_argument("--max-retries", type=int, default=3)
+    t.add_argument("--restarts", type=int, default=3, help="Restart an aborted run this often")
+    t.add_argument("--output", default=None, help="Also write the report as JSON")
+    t.add_argument("--verbose", action="store_true", help="Show the client's own output")
+    _server_flags(t)
+    return p.parse_args()
+
+
+def config_from(a: argparse.Namespace) -> StandinConfig:
+    return StandinConfig(**{k: getattr(a, k) for k in asdict(StandinConfig())})
+
+
+def random_peptides(n: int, lengths: List[int], seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    lens = rng.choice(lengths, n)
+    letters = rng.choice(np.frombuffer(AMINO_ACIDS.encode(), dtype=np.uint8), (n, max(lengths)))
+    peps = pd.unique(pd.Series([bytes(r[:k]).decode() for r, k in zip(letters, lens)]))
+    return pd.DataFrame({"peptide": peps, "peptide_len": [len(p) for p in peps]})
+
+
+def loadtest(a: argparse.Namespace) -> Dict[str, Any]:
+    server = start_server(config_from(a))
+    base = f"http://127.0.0.1:{server.server_address[1]}/api/v1"
+    work = Path(tempfile.mkdtemp(prefix="iedb-standin-"))
+    alleles = [s.strip() for s in a.alleles.split(",") if s.strip()]
+    overrides = {
+        "API_PIPELINE_URL": f"{base}/pipeline", "API_RESULTS_URL": f"{base}/results",
+        "ALLELES": alleles, "ALLELES_STR": ",".join(alleles),
+        "BATCH_SIZE": a.batch_size, "ADAPTIVE_BATCHING": not a.fixed_batches,
+        "IN_FLIGHT": a.in_flight, "POLL_MIN": a.poll_min, "POLL_INTERVAL": a.poll_interval,
+        "MAX_RETRIES": a.max_retries, "PRESCREEN_TRAINING": None, "RESULTS_FORMAT": "parquet",
+        "RESULTS_DATASET": work / "results", "CACHE_DB": work / "cache.sqlite",
+        "PEPTIDE_DICT": work / "peptide_dict.parquet",
+        "TELEMETRY_JSONL": work / "telemetry.jsonl", "TELEMETRY_PROM": None,
+    }
+    for k, v in overrides.items():
+        setattr(peptidecalcs, k, v)
+
+    pep_df = random_peptides(a.peptides, [int(x) for x in a.lengths.split(",")], a.seed)
+    print(f"[standin] {len(pep_df):,} peptides × {len(alleles)} alleles against {base}")
+    runs: List[Dict[str, Any]] = []
+    t0 = time.monotonic()
+    try:
+        for attempt in range(a.restarts + 1):
+            t1, retries0 = time.monotonic(), peptidecalcs.request_retries
+            try:
+                with contextlib.redirect_stdout(sys.stdout if a.verbose else io.StringIO()):
+                    tel = peptidecalcs.run_predictions(pep_df)
+                error = None
+            except Exception as exc:
+                tel, error = None, f"{type(exc).__name__}: {exc}"
+            runs.append({"seconds": round(time.monotonic() - t1, 3), "error": error,
+                         "retries": peptidecalcs.request_retries - retries0,
+                         "batches": tel.batches if tel else None, "rows": tel.rows if tel else None})
+            if error is None:
+                break
+            print(f"[standin] Run {attempt + 1} aborted ({error}); restarting from the cache")
+        seconds = time.monotonic() - t0
+        results = work / "results"
+        rows = ds.dataset(results, format="parquet", partitioning="hive").count_rows() if results.exists() else 0
+    finally:
+        server.shutdown()
+        shutil.rmtree(work, ignore_errors=True)
+
+    with server.lock:
+        counters = dict(server.counters)
+    ok = runs[-1]["error"] is None
+    return {
+        "ok": ok,
+        "peptides": len(pep_df),
+        "alleles": len(alleles),
+        "rows_written": rows,
+        "rows_expected": len(pep_df) * len(alleles),
+        "seconds": round(seconds, 3),
+        "peptides_per_s": round(len(pep_df) / seconds, 2) if ok else None,
+        "rows_per_s": round(rows / seconds, 2),
+        "runs": runs,
+        "client_retries": sum(r["retries"] for r in runs),
+        "server": counters,
+        "config": {**asdict(config_from(a)), "batch_size": a.batch_size,
+                   "adaptive": not a.fixed_batches, "in_flight": a.in_flight,
+                   "poll_min": a.poll_min, "poll_interval": a.poll_interval,
+                   "max_retries": a.max_retries},
+    }
+
+
+def main() -> None:
+    a = parse_args()
+    if a.command == "serve":
+        server = StandinServer((a.host, a.port), config_from(a))
+        print(f"[standin] Serving on http://{a.host}:{a.port}/api/v1 (pipeline, results/{{id}}, stats)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    report = loadtest(a)
+    s = report["server"]
+    print(f"[standin] {'✅' if report['ok'] else '❌'} {report['rows_written']:,}/{report['rows_expected']:,} rows "
+          f"in {report['seconds']:,.1f}s · {report['rows_per_s']:,.0f} rows/s"
+          + (f" · {report['peptides_per_s']:,.1f} pep/s" if report["ok"] else ""))
+    print(f"[standin] Runs: {len(report['runs'])} · client retries: {report['client_retries']} · "
+          f"server: {s['submits']} submits, {s['polls']} polls, {s['errors_503']} 503s, "
+          f"{s['burst_503']} burst 503s, {s['drops']} drops, {s['jobs_failed']} failed jobs")
+    if a.output:
+        Path(a.output).write_text(json.dumps(report, indent=2))
+        print(f"[standin] Report → {a.output}")
+    if not report["ok"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,615 @@
+"""
+Persistent k-mer conservancy index over the protein-partitioned sequence
+dataset written by partition_iav6_by_protein.py.
+
+For every protein and every k (default 8–14) the index stores each distinct
+k-mer found in the (degapped) sequences with
+
+  frequency_all     sequences that contain it
+  frequency_unique  distinct sequences that contain it
+
+next to the per-protein totals (total_all, total_unique), i.e. the columns of
+predictions_annotated.csv. A sequence that contains a k-mer twice counts once.
+
+Layout (every array is a plain .npy file, opened memory-mapped):
+
+  <index>/_index.json                  alphabet, k range, totals per protein
+  <index>/protein=HA/k=9/keys.npy      uint64, sorted: base-20 code of the k-mer
+  <index>/protein=HA/k=9/all.npy       uint32 frequency_all, aligned with keys
+  <index>/protein=HA/k=9/unique.npy    uint32 frequency_unique
+  <index>/protein=HA/k=9/masked.npy    uint32 (k, n): row j sorts keys with digit j zeroed
+
+A k-mer is coded in base 20 over the standard amino acids (20^14 < 2^64), so
+the sorted key array works as a static hash table: `np.searchsorted` answers
+millions of exact lookups at once. For Hamming-1 neighbourhoods the keys are
+taken in masked.npy order, which puts every k-mer differing from a query only
+at position j into one run of at most 20; a binary search through the
+memory-mapped order finds it. Gaps are removed before counting; k-mers
+containing X or another ambiguity code are not indexed.
+
+Usage (from repo root):
+
+  python src/data/kmer_index.py build \
+    --dataset src/data/IAV6_partitioned \
+    --index   src/data/IAV6_kmers
+
+  python src/data/kmer_index.py lookup \
+    --index  src/data/IAV6_kmers \
+    --input  src/data/peptides_30k_8-14.csv \
+    --output src/data/peptides_conservancy.csv
+
+Optional flags:
+  build:   --k 8-14  --workers 4  --only-proteins M1,NP
+  lookup:  --neighbours   also report the Hamming-1 neighbourhood per peptide
+           (lookup uses the input's `protein` column when it has one,
+           otherwise the protein where each peptide is most frequent, or
+           where its neighbours are, for peptides found in no protein)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pcsv
+import pyarrow.parquet as pq
+
+from build_sequencecalc import fixed_width_matrix, iter_sequences, list_partitions
+
+ALPHABET = "ACDEFGHIKLMNPQRSTVWY"
+RADIX = len(ALPHABET)
+K_RANGE = (8, 14)
+CHUNK_RESIDUES = 16_000_000   # residues of distinct sequences coded at once
+
+_CODE = np.full(256, 255, dtype=np.uint8)
+_CODE[np.frombuffer(ALPHABET.encode(), dtype=np.uint8)] = np.arange(RADIX, dtype=np.uint8)
+_CODE[np.frombuffer(ALPHABET.lower().encode(), dtype=np.uint8)] = np.arange(RADIX, dtype=np.uint8)
+_GAP = ord("-")
+
+LOOKUP_SCHEMA = pa.schema([
+    pa.field("peptide", pa.string()),
+    pa.field("protein", pa.string()),
+    pa.field("frequency_all", pa.int64()),
+    pa.field("total_all", pa.int64()),
+    pa.field("proportion_all", pa.float64()),
+    pa.field("frequency_unique", pa.int64()),
+    pa.field("total_unique", pa.int64()),
+    pa.field("proportion_unique", pa.float64()),
+])
+NEIGHBOUR_FIELDS = [
+    pa.field("neighbours", pa.int64()),                    # distinct indexed k-mers at distance 1
+    pa.field("neighbour_frequency_all", pa.int64()),       # summed over those k-mers
+    pa.field("neighbour_frequency_unique", pa.int64()),
+]
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Build or query a k-mer conservancy index.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    b = sub.add_parser("build", help="Index a protein-partitioned sequence dataset")
+    b.add_argument("--dataset", required=True, help="Root of the Hive dataset (protein=*/…parquet)")
+    b.add_argument("--index", required=True, help="Output index directory")
+    b.add_argument("--k", default=f"{K_RANGE[0]}-{K_RANGE[1]}", help="k-mer lengths, e.g. 8-14 or 9,10")
+    b.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    b.add_argument("--only-proteins", default=None,
+                   help="Comma-separated protein IDs to index (default: all partitions)")
+
+    q = sub.add_parser("lookup", help="Conservancy of the peptides in a CSV or Parquet file")
+    q.add_argument("--index", required=True, help="Index directory")
+    q.add_argument("--input", required=True, help="CSV/Parquet with a `peptide` column")
+    q.add_argument("--output", required=True, help="Output CSV or Parquet (by extension)")
+    q.add_argument("--neighbours", action="store_true",
+                   help="Add Hamming-1 neighbourhood counts per peptide")
+    return p.parse_args()
+
+
+def parse_k(spec: str) -> List[int]:
+    ks = set()
+    for part in spec.split(","):
+        lo, _, hi = part.strip().partition("-")
+        ks.update(range(int(lo), int(hi or lo) + 1))
+    if not ks or min(ks) < 1 or max(ks) > 14:
+        raise SystemExit(f"k must be within 1–14, got {spec!r}")
+    return sorted(ks)
+
+
+# ───────────────────────── coding ─────────────────────────
+def _powers(k: int) -> np.ndarray:
+    return RADIX ** np.arange(k - 1, -1, -1, dtype=np.uint64)
+
+
+def window_keys(codes: np.ndarray, starts: np.ndarray, k: int) -> np.ndarray:
+    """Base-20 keys of the k-mers codes[s:s+k] for every s in `starts`."""
+    keys = np.zeros(len(starts), dtype=np.uint64)
+    for j in range(k):
+        keys = keys * np.uint64(RADIX) + codes[starts + j].astype(np.uint64)
+    return keys
+
+
+def peptide_codes(peptides: pa.Array) -> Tuple[np.ndarray, np.ndarray]:
+    """(n,) lengths and (n, max_len) residue codes of `peptides` (255 = not indexable)."""
+    peptides = pc.fill_null(peptides, "")
+    lens = pc.utf8_length(peptides).to_numpy(zero_copy_only=False).astype(np.int64)
+    codes = np.full((len(peptides), max(int(lens.max(initial=0)), 1)), 255, dtype=np.uint8)
+    for L in np.unique(lens):
+        if L == 0:
+            continue
+        rows = np.flatnonzero(lens == L)
+        mat = fixed_width_matrix(pc.take(peptides, pa.array(rows)).cast(pa.string()))
+        if mat.shape[1] != L:                  # multi-byte characters: never indexable
+            continue
+        codes[rows, :L] = _CODE[mat]
+    return lens, codes
+
+
+def key_letters(keys: np.ndarray, k: int) -> np.ndarray:
+    """(n, k) uint8 ASCII matrix of the k-mers coded by `keys`."""
+    digits = (np.asarray(keys)[:, None] // _powers(k)) % np.uint64(RADIX)
+    return np.frombuffer(ALPHABET.encode(), dtype=np.uint8)[digits.astype(np.int64)]
+
+
+def decode_keys(keys: np.ndarray, k: int) -> List[str]:
+    return [bytes(r).decode() for r in key_letters(keys, k)]
+
+
+# ───────────────────────── counting ─────────────────────────
+def reduce_counts(keys: np.ndarray, n_all: np.ndarray, n_unique: np.ndarray,
+                  presorted: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sum the counts of equal keys; returns sorted distinct keys."""
+    if len(keys) == 0:
+        return keys, n_all, n_unique
+    if not presorted:
+        order = np.argsort(keys, kind="stable")
+        keys, n_all, n_unique = keys[order], n_all[order], n_unique[order]
+    bounds = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[bounds], np.add.reduceat(n_all, bounds), np.add.reduceat(n_unique, bounds)
+
+
+def chunk_windows(codes: np.ndarray, seq_id: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (starts, keys) of the k-mer windows in a chunk of sequences laid end to
+    end; `seq_id` names the sequence of every residue. Windows crossing a
+    sequence boundary or holding a 255 are skipped.
+    """
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.empty(0, np.int64), np.empty(0, np.uint64)
+    bad = np.concatenate(([0], np.cumsum(codes == 255)))
+    starts = np.flatnonzero((seq_id[:n] == seq_id[k - 1:]) & (bad[k:] == bad[:n]))
+    keys = codes[:n].astype(np.uint64)
+    for j in range(1, k):                        # contiguous slices, no gathers
+        keys *= np.uint64(RADIX)
+        keys += codes[j:j + n]
+    return starts, keys[starts]
+
+
+def count_windows(keys: np.ndarray, seq: np.ndarray, weight: np.ndarray
+                  ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (keys, frequency_all, frequency_unique) of windows found in distinct
+    sequences `seq`, each standing for `weight[seq]` sequences. A k-mer
+    repeated inside one sequence counts once.
+    """
+    order = np.argsort(keys, kind="stable")     # equal keys keep sequence order
+    keys, seq = keys[order], seq[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = (keys[1:] != keys[:-1]) | (seq[1:] != seq[:-1])
+    keys, seq = keys[first], seq[first]
+    return reduce_counts(keys, weight[seq].astype(np.int64), np.ones(len(keys), np.int64),
+                         presorted=True)
+
+
+def distinct_sequences(files: Sequence[Path]) -> Tuple[pa.Array, np.ndarray]:
+    """Distinct sequences of a protein and how often each occurs."""
+    parts = []
+    for seqs in iter_sequences(files):
+        vc = pc.value_counts(pc.drop_null(seqs))
+        parts.append(pa.table({"sequence": vc.field("values"), "n": vc.field("counts")}))
+    if not parts:
+        return pa.array([], pa.string()), np.empty(0, np.int64)
+    tbl = pa.concat_tables(parts).group_by("sequence").aggregate([("n", "sum")])
+    return tbl["sequence"].combine_chunks(), tbl["n_sum"].to_numpy()
+
+
+def reduce_positions(keys: np.ndarray, start: np.ndarray, end: np.ndarray, w: np.ndarray
+                     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Sum the weights of equal (key, start) pairs; sorted by key, then start."""
+    if len(keys) == 0:
+        return keys, start, end, w
+    order = np.lexsort((start, keys))
+    keys, start, end, w = keys[order], start[order], end[order], w[order]
+    bounds = np.flatnonzero(np.concatenate(([True], (keys[1:] != keys[:-1]) |
+                                            (start[1:] != start[:-1]))))
+    return keys[bounds], start[bounds], end[bounds], np.add.reduceat(w, bounds)
+
+
+def iter_chunks(seqs: pa.Array) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Degapped (codes, seq_id, column) for runs of `seqs` holding about
+    CHUNK_RESIDUES residues; `column` is each residue's 0-based aligned position.
+    """
+    cum = np.cumsum(pc.binary_length(seqs).to_numpy(zero_copy_only=False))
+    cuts = np.searchsorted(cum, np.arange(CHUNK_RESIDUES, cum[-1] if len(cum) else 0, CHUNK_RESIDUES),
+                           side="right")
+    bounds = np.unique(np.concatenate(([0], cuts, [len(seqs)])))
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        part = seqs.slice(start, stop - start).cast(pa.large_string())
+        offsets = np.frombuffer(part.buffers()[1], dtype=np.int64)[part.offset:part.offset + len(part) + 1]
+        raw = np.frombuffer(part.buffers()[2], dtype=np.uint8)[offsets[0]:offsets[-1]]
+        lens = np.diff(offsets)
+        seq_id = np.repeat(np.arange(start, stop), lens)
+        column = np.arange(len(raw)) - np.repeat(offsets[:-1] - offsets[0], lens)
+        keep = raw != _GAP
+        yield _CODE[raw[keep]], seq_id[keep], column[keep]
+
+
+def count_protein(seqs: pa.Array, weight: np.ndarray, ks: Sequence[int],
+                  positions: bool = False) -> Dict[int, Dict[str, np.ndarray]]:
+    """
+    Per k: sorted distinct `keys` with their `all` and `unique` counts. With
+    `positions`, also the aligned `start` and `end` column (0-based) where
+    each k-mer is found in the most sequences.
+    """
+    empty = np.empty(0, np.int64)
+    acc = {k: (np.empty(0, np.uint64), empty, empty) for k in ks}
+    pos = {k: (np.empty(0, np.uint64), empty, empty, empty) for k in ks}
+    for codes, seq_id, column in iter_chunks(seqs):
+        for k in ks:
+            starts, keys = chunk_windows(codes, seq_id, k)
+            counts = count_windows(keys, seq_id[starts], weight)
+            acc[k] = reduce_counts(*(np.concatenate(pair) for pair in zip(acc[k], counts)))
+            if positions:
+                found = (keys, column[starts], column[starts + k - 1], weight[seq_id[starts]])
+                pos[k] = reduce_positions(*(np.concatenate(pair) for pair in zip(pos[k], found)))
+
+    out = {}
+    for k in ks:
+        keys, n_all, n_uniq = acc[k]
+        out[k] = {"keys": keys, "all": n_all, "unique": n_uniq}
+        if positions:
+            p_keys, start, end, w = pos[k]
+            best = np.lexsort((-w, p_keys))      # heaviest start first within each key
+            first = np.ones(len(best), dtype=bool)
+            first[1:] = p_keys[best][1:] != p_keys[best][:-1]
+            out[k]["start"], out[k]["end"] = start[best[first]], end[best[first]]
+    return out
+
+
+def build_protein(protein: str, files: List[Path], out_dir: Path, ks: List[int]) -> Dict:
+    t0 = time.time()
+    seqs, weight = distinct_sequences(files)
+    info = {"total_all": int(weight.sum()), "total_unique": len(seqs), "kmers": {}}
+    counts = count_protein(seqs, weight, ks)
+
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    for k, c in counts.items():
+        keys, n_all, n_uniq = c["keys"], c["all"], c["unique"]
+        d = tmp / f"k={k}"
+        d.mkdir(parents=True)
+        np.save(d / "keys.npy", keys)
+        np.save(d / "all.npy", n_all.astype(np.uint32))
+        np.save(d / "unique.npy", n_uniq.astype(np.uint32))
+        np.save(d / "masked.npy", masked_orders(keys, k))
+        info["kmers"][str(k)] = len(keys)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)
+    info["seconds"] = round(time.time() - t0, 2)
+    return info
+
+
+def mask_digit(keys: np.ndarray, p: np.uint64) -> np.ndarray:
+    """`keys` with the base-20 digit of place value `p` set to zero."""
+    return keys - (keys // p % np.uint64(RADIX)) * p
+
+
+def masked_orders(keys: np.ndarray, k: int) -> np.ndarray:
+    """(k, n) uint32: row j is the stable argsort of `keys` with digit j masked."""
+    keys = np.asarray(keys)
+    out = np.empty((k, len(keys)), dtype=np.uint32)
+    for j, p in enumerate(_powers(k)):
+        out[j] = np.argsort(mask_digit(keys, p), kind="stable")
+    return out
+
+
+def masked_lower_bound(keys: np.ndarray, orders: np.ndarray, targets: np.ndarray,
+                       k: int) -> np.ndarray:
+    """
+    (k, m) first index into `orders[j]` whose masked key is >= `targets[j]`:
+    one batched binary search over every masked order at once.
+    """
+    n = orders.shape[1]
+    flat = orders.reshape(-1)
+    row = (np.arange(k, dtype=np.int64) * n)[:, None]
+    powers = _powers(k)[:, None]
+    lo = np.zeros(targets.shape, np.int64)
+    hi = np.full(targets.shape, n, np.int64)
+    for _ in range(n.bit_length()):
+        mid = (lo + hi) // 2
+        v = mask_digit(keys[flat[row + np.minimum(mid, n - 1)]], powers)
+        go = (lo < hi) & (v < targets)
+        lo = np.where(go, mid + 1, lo)
+        hi = np.where(go, hi, np.maximum(mid, lo))
+    return lo
+
+
+# ───────────────────────── querying ─────────────────────────
+class KmerIndex:
+    """Read side of the index; arrays are memory-mapped on first use."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+        meta = json.loads((self.root / "_index.json").read_text())
+        if meta["alphabet"] != ALPHABET:
+            raise ValueError(f"{self.root}: index built with alphabet {meta['alphabet']!r}")
+        self.ks: List[int] = meta["k"]
+        self.proteins: Dict[str, Dict] = meta["proteins"]
+        self._arrays: Dict[Tuple[str, int], Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._masked: Dict[Tuple[str, int], np.ndarray] = {}
+
+    def arrays(self, protein: str, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        key = (protein, k)
+        if key not in self._arrays:
+            d = self.root / f"protein={protein}" / f"k={k}"
+            self._arrays[key] = tuple(np.load(d / f"{n}.npy", mmap_mode="r")
+                                      for n in ("keys", "all", "unique"))
+        return self._arrays[key]
+
+    def masked(self, protein: str, k: int) -> np.ndarray:
+        """masked.npy, memory-mapped; computed once for indexes built without it."""
+        key = (protein, k)
+        if key not in self._masked:
+            path = self.root / f"protein={protein}" / f"k={k}" / "masked.npy"
+            if path.exists():
+                self._masked[key] = np.load(path, mmap_mode="r")
+            else:
+                self._masked[key] = masked_orders(self.arrays(protein, k)[0], k)
+        return self._masked[key]
+
+    @staticmethod
+    def _find(keys: np.ndarray, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(hit mask, position in `keys`) of every query key."""
+        if len(keys) == 0:
+            return np.zeros(len(queries), bool), np.zeros(len(queries), np.int64)
+        order = np.argsort(queries)                # sorted probes walk the memmap once
+        pos = np.empty(len(queries), dtype=np.int64)
+        pos[order] = np.searchsorted(keys, queries[order])
+        pos = np.minimum(pos, len(keys) - 1)
+        return np.asarray(keys[pos]) == queries, pos
+
+    def counts(self, protein: str, k: int, codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """frequency_all and frequency_unique for an (n, k) matrix of valid codes."""
+        keys, n_all, n_uniq = self.arrays(protein, k)
+        hit, pos = self._find(keys, window_keys(codes.ravel(), np.arange(len(codes)) * k, k))
+        return (np.where(hit, n_all[pos], 0).astype(np.int64),
+                np.where(hit, n_uniq[pos], 0).astype(np.int64))
+
+    def neighbour_counts(self, protein: str, k: int, codes: np.ndarray
+                         ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Per row: indexed k-mers at Hamming distance 1 and their summed counts.
+
+        In the order of masked.npy row j, all k-mers that differ from a query
+        only at position j form one run (at most RADIX long), found by a
+        binary search for the masked query; only the run is read. The query
+        itself, when indexed, sits in every run and is subtracted.
+        """
+        keys, n_all, n_uniq = self.arrays(protein, k)
+        if not len(keys):
+            return tuple(np.zeros(len(codes), np.int64) for _ in range(3))
+        orders = self.masked(protein, k)
+        q = window_keys(codes.ravel(), np.arange(len(codes)) * k, k)
+        hit, pos = self._find(keys, q)
+        own = hit.astype(np.int64)
+        own_all = np.where(hit, n_all[pos], 0).astype(np.int64)
+        own_uniq = np.where(hit, n_uniq[pos], 0).astype(np.int64)
+
+        powers = _powers(k)[:, None]
+        targets = q - codes.T.astype(np.uint64) * powers
+        start = masked_lower_bound(keys, orders, targets, k)
+
+        n, flat = orders.shape[1], orders.reshape(-1)
+        row = (np.arange(k, dtype=np.int64) * n)[:, None]
+        out = tuple(np.zeros(len(codes), np.int64) for _ in range(3))
+        alive = np.ones(targets.shape, bool)
+        for t in range(RADIX):
+            pos = start + t
+            idx = flat[row + np.minimum(pos, n - 1)]
+            alive &= (pos < n) & (mask_digit(keys[idx], powers) == targets)
+            if not alive.any():
+                break
+            out[0][:] += alive.sum(axis=0)
+            out[1][:] += np.where(alive, n_all[idx], 0).sum(axis=0, dtype=np.int64)
+            out[2][:] += np.where(alive, n_uniq[idx], 0).sum(axis=0, dtype=np.int64)
+        out[0][:] -= k * own
+        out[1][:] -= k * own_all
+        out[2][:] -= k * own_uniq
+        return out
+
+    def lookup(self, peptides: Sequence[str] | pa.Array,
+               proteins: Optional[Sequence[str] | pa.Array] = None,
+               neighbours: bool = False) -> pa.Table:
+        """
+        Conservancy of `peptides` as a table with LOOKUP_SCHEMA (plus the
+        neighbourhood columns with `neighbours`), one row per peptide in
+        input order. Without `proteins` each peptide is matched against every
+        indexed protein and reported for the one where it is most frequent;
+        with `neighbours`, a peptide found in no protein is reported for the
+        one where its Hamming-1 neighbours are most frequent.
+        """
+        peptides = pa.array(peptides, pa.string()) if not isinstance(peptides, pa.Array) else peptides
+        n = len(peptides)
+        lens, codes = peptide_codes(peptides)
+        names = list(self.proteins)
+        if proteins is None:
+            prot = np.full(n, -1, dtype=np.int64)
+            candidates = range(len(names))
+        else:
+            prot_arr = pa.array(proteins, pa.string()) if not isinstance(proteins, pa.Array) else proteins
+            prot = pc.index_in(prot_arr, value_set=pa.array(names, pa.string())).to_numpy(
+                zero_copy_only=False)
+            prot = np.nan_to_num(prot.astype(np.float64), nan=-1).astype(np.int64)
+            candidates = None
+
+        f_all = np.zeros(n, np.int64)
+        f_uniq = np.zeros(n, np.int64)
+        nb = [np.zeros(n, np.int64) for _ in range(3)]
+        for k in self.ks:
+            rows_k = np.flatnonzero((lens == k) & (codes[:, :k] != 255).all(axis=1)
+                                    if k <= codes.shape[1] else np.zeros(n, bool))
+            if not len(rows_k):
+                continue
+            for p_i in (candidates if candidates is not None else np.unique(prot[rows_k])):
+                if p_i < 0:
+                    continue
+                rows = rows_k if candidates is not None else rows_k[prot[rows_k] == p_i]
+                a, u = self.counts(names[p_i], k, codes[rows, :k])
+                near = self.neighbour_counts(names[p_i], k, codes[rows, :k]) if neighbours else None
+                if candidates is None:
+                    better = np.ones(len(rows), bool)
+                elif near is None:
+                    better = a > f_all[rows]
+                else:
+                    # most frequent exact match; peptides found nowhere take the
+                    # protein with the most frequent Hamming-1 neighbourhood
+                    better = (a > f_all[rows]) | ((a == 0) & (f_all[rows] == 0) & (near[1] > nb[1][rows]))
+                sel = rows[better]
+                f_all[sel] = a[better]
+                f_uniq[sel] = u[better]
+                if candidates is not None:
+                    prot[sel] = p_i
+                if near is not None:
+                    for acc, v in zip(nb, near):
+                        acc[sel] = v[better]
+
+        has = prot >= 0
+        tot_all = np.array([self.proteins[p]["total_all"] for p in names] + [0], np.int64)[prot]
+        tot_uniq = np.array([self.proteins[p]["total_unique"] for p in names] + [0], np.int64)[prot]
+        prot_names = pa.array(np.array(names + [None], dtype=object)[prot], pa.string())
+        cols = {
+            "peptide": peptides,
+            "protein": prot_names if proteins is None else prot_arr,
+            "frequency_all": pa.array(f_all),
+            "total_all": pa.array(np.where(has, tot_all, 0)),
+            "proportion_all": pa.array(np.divide(f_all, tot_all, out=np.zeros(n), where=tot_all > 0)),
+            "frequency_unique": pa.array(f_uniq),
+            "total_unique": pa.array(np.where(has, tot_uniq, 0)),
+            "proportion_unique": pa.array(np.divide(f_uniq, tot_uniq, out=np.zeros(n), where=tot_uniq > 0)),
+        }
+        schema = LOOKUP_SCHEMA
+        if neighbours:
+            for f, v in zip(NEIGHBOUR_FIELDS, nb):
+                cols[f.name] = pa.array(v)
+            schema = pa.schema(list(LOOKUP_SCHEMA) + NEIGHBOUR_FIELDS)
+        return pa.table(cols, schema=schema)
+
+    def neighbours(self, peptide: str, protein: str) -> pa.Table:
+        """The indexed k-mers at Hamming distance 1 from one peptide, with their counts."""
+        k = len(peptide)
+        codes = _CODE[np.frombuffer(peptide.encode(), dtype=np.uint8)]
+        if k not in self.ks or (codes == 255).any():
+            return pa.table({"peptide": pa.array([], pa.string()),
+                             "position": pa.array([], pa.int64()),
+                             "frequency_all": pa.array([], pa.int64()),
+                             "frequency_unique": pa.array([], pa.int64())})
+        keys, n_all, n_uniq = self.arrays(protein, k)
+        c = np.repeat(codes[None, :], k * (RADIX - 1), axis=0)
+        j = np.repeat(np.arange(k), RADIX - 1)
+        c[np.arange(len(c)), j] = (codes[j] + np.tile(np.arange(1, RADIX), k)) % RADIX
+        cand = window_keys(c.ravel(), np.arange(len(c)) * k, k)
+        hit, pos = self._find(keys, cand)
+        return pa.table({
+            "peptide": pa.array(decode_keys(cand[hit], k), pa.string()),
+            "position": pa.array(j[hit] + 1, pa.int64()),
+            "frequency_all": pa.array(np.asarray(n_all[pos[hit]]), pa.int64()),
+            "frequency_unique": pa.array(np.asarray(n_uniq[pos[hit]]), pa.int64()),
+        })
+
+
+# ───────────────────────── driver ─────────────────────────
+def cmd_build(a: argparse.Namespace) -> None:
+    root, out = Path(a.dataset), Path(a.index)
+    ks = parse_k(a.k)
+    if not root.exists():
+        raise SystemExit(f"Dataset not found: {root}")
+    parts = list_partitions(root)
+    if a.only_proteins:
+        keep = {s.strip() for s in a.only_proteins.split(",") if s.strip()}
+        parts = {k: v for k, v in parts.items() if k in keep}
+    if not parts:
+        raise SystemExit(f"No protein=* partitions under {root}")
+
+    out.mkdir(parents=True, exist_ok=True)
+    meta_path = out / "_index.json"
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+    if meta.get("k") not in (None, ks):
+        meta["proteins"] = {}                   # other k range: every protein is rebuilt
+    proteins: Dict[str, Dict] = meta.get("proteins", {})
+
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=a.workers) as pool:
+        futures = {p: pool.submit(build_protein, p, fs, out / f"protein={p}", ks)
+                   for p, fs in parts.items()}
+        for p, fut in futures.items():
+            info = proteins[p] = fut.result()
+            print(f"[kmers] {p}: {info['total_all']:,} sequences ({info['total_unique']:,} distinct), "
+                  f"{sum(info['kmers'].values()):,} k-mers in {info['seconds']:.1f}s")
+
+    meta = {"alphabet": ALPHABET, "k": ks, "dataset": str(root),
+            "proteins": dict(sorted(proteins.items()))}
+    tmp = meta_path.with_name(meta_path.name + ".tmp")
+    tmp.write_text(json.dumps(meta, indent=1))
+    os.replace(tmp, meta_path)
+    print(f"[kmers] Indexed {len(parts)} protein(s) in {time.time() - t0:,.1f}s → {out}")
+
+
+def read_table(path: Path) -> pa.Table:
+    if path.suffix.lower() == ".parquet":
+        return pq.read_table(path)
+    return pcsv.read_csv(path, convert_options=pcsv.ConvertOptions(strings_can_be_null=True))
+
+
+def cmd_lookup(a: argparse.Namespace) -> None:
+    index = KmerIndex(Path(a.index))
+    tbl = read_table(Path(a.input))
+    if "peptide" not in tbl.column_names:
+        raise SystemExit(f"{a.input}: no `peptide` column")
+    peptides = tbl["peptide"].combine_chunks().cast(pa.string())
+    proteins = (tbl["protein"].combine_chunks().cast(pa.string())
+                if "protein" in tbl.column_names else None)
+
+    t0 = time.time()
+    res = index.lookup(peptides, proteins, neighbours=a.neighbours)
+    found = pc.sum(pc.greater(res["frequency_all"], 0)).as_py() or 0
+    print(f"[kmers] Looked up {len(res):,} peptides in {time.time() - t0:,.2f}s; "
+          f"{found:,} found in the index")
+
+    out = Path(a.output)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    if out.suffix.lower() == ".parquet":
+        pq.write_table(res, out, compression="zstd")
+    else:
+        pcsv.write_csv(res, out)
+    print(f"[kmers] Wrote {out}")
+
+
+def main() -> None:
+    a = parse_args()
+    if a.command == "build":
+        cmd_build(a)
+    else:
+        cmd_lookup(a)
+
+
+if __name__ == "__main__":
+    main()
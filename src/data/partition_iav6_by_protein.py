@@ -20,21 +20,64 @@ Optional flags:
   --row-group-size 500000      (rows per row group)
   --rows-per-file  2000000     (rows per output file)
   --only-proteins M1,HA,NA     (restrict to subset for a test run)
-  --no-stats                   (skip pre/pass stats to reduce work)
+  --no-stats                   (skip the per-protein tally)
+  --manifest-columns collection_date,release_date
+                               (columns whose min/max go into the manifest)
+  --split-shards               also write browser shards (see below); holds
+                               one protein's filter or metadata columns in
+                               memory at a time (HA/NA: the sequence column)
+  --shards-dir DIR             (default: <outdir>/_shards)
+  --shard-row-group-size 8192  (rows per row group in the shards)
+
+The input is scanned once: per-protein counts are tallied with
+`pyarrow.compute.value_counts` on the batches as they stream into
+`ds.write_dataset`. Partitions written by the run replace their old files.
+A run without --only-proteins also deletes protein=* directories of proteins
+no longer in the input; with it, other partitions are left alone. Afterwards
+`<outdir>/_manifest.json` lists, for every protein=* directory on disk, the
+row count, files, bytes, row-group count and min/max of the manifest columns
+(taken from the Parquet footers), so loaders can plan reads without opening
+every file.
 
 Then, in DuckDB you can point a table or view to the dataset root and
 benefit from partition pruning when querying with `WHERE protein = 'M1'`.
+
+With --split-shards every protein is also written as two column groups for
+clients that fetch files over HTTP:
+
+  <shards>/M1.filter.parquet   row, sequence, the filter columns (genotype,
+                               host, country, collection_date, release_date)
+                               and collection_day (collection_date as a DATE,
+                               normalised like the dashboards' TRY_CAST)
+  <shards>/M1.meta.parquet     row and every other column (accession, title…)
+
+Rows are sorted by collection_day (undated rows last), then country, and
+`row` numbers them in that order in both files. Row groups are small and
+carry statistics and a page index, so range reads that filter on
+collection_day or country skip most of the filter shard, and the first
+render never touches the metadata shard. The manifest lists the shards
+under "shards", with the collection_day range of every row group. Shards
+of partitions rewritten without --split-shards are dropped from the manifest
+and deleted.
 """
 
 from __future__ import annotations
 
 import argparse
+import json
 import os
+import shutil
+import time
 from pathlib import Path
-from typing import Iterable, Dict
+from typing import Any, Dict, Iterable, List
 
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+FILTER_COLUMNS = ["genotype", "host", "country", "collection_date", "release_date"]
+DAY_COLUMN = "collection_day"
 
 
 def parse_args() -> argparse.Namespace:
@@ -49,7 +92,14 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--only-proteins", default=None,
                    help="Comma-separated protein IDs to include (e.g., M1,HA). If omitted, include all.")
     p.add_argument("--no-stats", action="store_true",
-                   help="Skip pre-run protein counts (saves time for large files)")
+                   help="Skip the per-protein tally taken while writing")
+    p.add_argument("--manifest-columns", default="collection_date,release_date",
+                   help="Comma-separated columns whose min/max are recorded in _manifest.json")
+    p.add_argument("--split-shards", action="store_true",
+                   help="Also write a narrow filter shard and a wide metadata shard per protein")
+    p.add_argument("--shards-dir", default=None, help="Directory for the shards (default: <outdir>/_shards)")
+    p.add_argument("--shard-row-group-size", type=int, default=8192,
+                   help="Rows per row group in the shards (default: 8192)")
     return p.parse_args()
 
 
@@ -58,21 +108,166 @@ def ensure_has_column(schema: pa.Schema, col: str) -> None:
         raise SystemExit(f"Input file does not have required column: {col}")
 
 
+def tally(col: pa.Array, counts: Dict[str, int]) -> None:
+    """Add one batch's non-null value counts to `counts`."""
+    vc = pc.value_counts(col)
+    for v, n in zip(vc.field("values").to_pylist(), vc.field("counts").to_pylist()):
+        if v is not None:
+            counts[v] = counts.get(v, 0) + n
+
+
 def protein_counts(dataset: ds.Dataset, protein_field: str = "protein") -> Dict[str, int]:
-    """Stream records to compute a rough count per protein without loading whole table."""
+    """Stream records to compute a count per protein without loading whole table."""
     counts: Dict[str, int] = {}
     scanner = ds.Scanner.from_dataset(dataset, columns=[protein_field])
     for batch in scanner.to_reader():
-        col = batch.column(0)
-        # Convert to Python values in chunks to avoid big allocations
-        for i in range(len(batch)):
-            v = col[i].as_py()
-            if v is None:
-                continue
-            counts[v] = counts.get(v, 0) + 1
+        tally(batch.column(0), counts)
     return counts
 
 
+def counting_reader(reader: pa.RecordBatchReader, field: str,
+                    counts: Dict[str, int]) -> pa.RecordBatchReader:
+    """Pass batches through unchanged while tallying `field` into `counts`."""
+    idx = reader.schema.get_field_index(field)
+
+    def batches() -> Iterable[pa.RecordBatch]:
+        for batch in reader:
+            tally(batch.column(idx), counts)
+            yield batch
+
+    return pa.RecordBatchReader.from_batches(reader.schema, batches())
+
+
+def file_entry(path: Path, metadata: Any, columns: List[str]) -> Dict[str, Any]:
+    """Manifest entry for one written Parquet file, from its footer."""
+    schema = metadata.schema.to_arrow_schema()
+    entry: Dict[str, Any] = {
+        "path": path.name,
+        "rows": metadata.num_rows,
+        "bytes": path.stat().st_size,
+        "row_groups": metadata.num_row_groups,
+        "min": {},
+        "max": {},
+    }
+    for col in columns:
+        if col not in schema.names:
+            continue
+        ci = schema.get_field_index(col)
+        lo = hi = None
+        for rg in range(metadata.num_row_groups):
+            st = metadata.row_group(rg).column(ci).statistics
+            if st is None or not st.has_min_max:
+                continue
+            lo = st.min if lo is None else min(lo, st.min)
+            hi = st.max if hi is None else max(hi, st.max)
+        entry["min"][col], entry["max"][col] = lo, hi
+    return entry
+
+
+def build_manifest(out_dir: Path, columns: List[str]) -> Dict[str, Any]:
+    """Manifest of every partition file under `out_dir`, including earlier runs' partitions."""
+    partitions: Dict[str, Dict[str, Any]] = {}
+    for path in sorted(out_dir.glob("protein=*/*.parquet")):
+        key = path.parent.name.split("=", 1)[1]
+        part = partitions.setdefault(key, {"path": path.parent.name, "rows": 0, "bytes": 0,
+                                           "row_groups": 0, "files": []})
+        entry = file_entry(path, pq.read_metadata(path), columns)
+        part["files"].append(entry)
+        for k in ("rows", "bytes", "row_groups"):
+            part[k] += entry[k]
+
+    for part in partitions.values():
+        part["files"].sort(key=lambda e: e["path"])
+        for bound, pick in (("min", min), ("max", max)):
+            part[bound] = {}
+            for col in columns:
+                vals = [e[bound][col] for e in part["files"] if e[bound].get(col) is not None]
+                part[bound][col] = pick(vals) if vals else None
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "partition_column": "protein",
+        "total_rows": sum(p["rows"] for p in partitions.values()),
+        "partitions": dict(sorted(partitions.items())),
+    }
+
+
+def normalized_day(col: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Dates as DATE: YYYY → YYYY-01-01, YYYY-MM → YYYY-MM-01; empty or unparsable → null."""
+    n = pc.utf8_length(col)
+    padded = pc.if_else(pc.equal(n, 4), pc.binary_join_element_wise(col, "-01-01", ""),
+                        pc.if_else(pc.equal(n, 7), pc.binary_join_element_wise(col, "-01", ""), col))
+    ts = pc.strptime(padded, format="%Y-%m-%d", unit="s", error_is_null=True)
+    return pc.cast(ts, pa.date32())
+
+
+def row_group_days(metadata: Any) -> List[Dict[str, Any]]:
+    """Rows and collection_day range of every row group, from a shard footer."""
+    ci = metadata.schema.to_arrow_schema().get_field_index(DAY_COLUMN)
+    groups = []
+    for rg in range(metadata.num_row_groups):
+        st = metadata.row_group(rg).column(ci).statistics
+        has = st is not None and st.has_min_max
+        groups.append({"rows": metadata.row_group(rg).num_rows,
+                       "min": st.min if has else None, "max": st.max if has else None})
+    return groups
+
+
+def write_shards(out_dir: Path, shard_dir: Path, written: List[Any], compression: str,
+                 row_group_size: int) -> Dict[str, Dict[str, Any]]:
+    """Write the filter and metadata shard of every written partition; returns manifest entries."""
+    files: Dict[str, List[str]] = {}
+    for wf in written:
+        files.setdefault(Path(wf.path).parent.name.split("=", 1)[1], []).append(wf.path)
+
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    shards: Dict[str, Dict[str, Any]] = {}
+    for protein, paths in sorted(files.items()):
+        dataset = ds.dataset(sorted(paths), format="parquet")
+        names = dataset.schema.names
+
+        # sort order from the key columns alone; shards then read only their own columns
+        keys_tbl = dataset.to_table(columns=[c for c in ("collection_date", "country") if c in names])
+        if "collection_date" in names:
+            day = normalized_day(keys_tbl["collection_date"])
+        else:
+            day = pa.chunked_array([pa.nulls(keys_tbl.num_rows, pa.date32())])
+        keys_tbl = keys_tbl.append_column(DAY_COLUMN, day)
+        keys = [(DAY_COLUMN, "ascending")]
+        if "country" in names:
+            keys.append(("country", "ascending"))
+        order = pc.sort_indices(keys_tbl, sort_keys=keys)   # nulls sort last by default
+        day = keys_tbl[DAY_COLUMN].take(order)
+        rows = pa.array(range(keys_tbl.num_rows), pa.int32())
+        del keys_tbl
+
+        narrow = ["row", "sequence"] + [c for c in FILTER_COLUMNS if c in names] + [DAY_COLUMN]
+        narrow = [c for c in narrow if c in names or c in ("row", DAY_COLUMN)]
+        wide = ["row"] + [c for c in names if c not in narrow]
+
+        entry: Dict[str, Any] = {}
+        for kind, cols in (("filter", narrow), ("meta", wide)):
+            path = shard_dir / f"{protein}.{kind}.parquet"
+            tbl = dataset.to_table(columns=[c for c in cols if c in names]).take(order)
+            tbl = tbl.add_column(0, "row", rows)
+            if DAY_COLUMN in cols:
+                tbl = tbl.append_column(DAY_COLUMN, day)
+            pq.write_table(tbl.select(cols), path, compression=compression,
+                           row_group_size=row_group_size, use_dictionary=True,
+                           write_statistics=True, write_page_index=True)
+            md = pq.read_metadata(path)
+            entry[kind] = {"path": os.path.relpath(path, out_dir), "rows": md.num_rows,
+                           "bytes": path.stat().st_size, "row_groups": md.num_row_groups,
+                           "columns": cols}
+            if kind == "filter":
+                entry[kind]["row_group_days"] = row_group_days(md)
+            del tbl
+        shards[protein] = entry
+        print(f"[partition] Shards {protein}: filter {entry['filter']['bytes'] / 1024:,.0f} KB, "
+              f"meta {entry['meta']['bytes'] / 1024:,.0f} KB, {entry['filter']['row_groups']} row groups")
+    return shards
+
+
 def main() -> None:
     a = parse_args()
 
@@ -96,28 +291,23 @@ def main() -> None:
             filter_expr = ds.field("protein").isin(items)
             print(f"[partition] Restricting to proteins: {', '.join(items)}")
 
-    if not a.no_stats:
-        print("[partition] Computing per-protein counts (streaming)…")
-        counts = protein_counts(dataset)
-        if counts:
-            top = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)
-            print("[partition] Proteins (top 20 by rows):")
-            for k, v in top[:20]:
-                print(f"  {k}: {v:,}")
-            print(f"[partition] Total proteins: {len(counts)}")
-        else:
-            print("[partition] No non-null protein values found.")
-
     # Set Parquet writing options
     pq_format = ds.ParquetFileFormat()
     write_opts = pq_format.make_write_options(compression=a.compression, use_dictionary=True)
 
     # Create a scanner with an optional filter to limit proteins for a test run
     scanner = ds.Scanner.from_dataset(dataset, filter=filter_expr)
+    reader = scanner.to_reader()
 
+    # Tally proteins on the same pass that writes them
+    counts: Dict[str, int] = {}
+    if not a.no_stats:
+        reader = counting_reader(reader, "protein", counts)
+
+    written: List[Any] = []
     print(f"[partition] Writing Hive-partitioned dataset to: {out_dir}")
     ds.write_dataset(
-        data=scanner,
+        data=reader,
         base_dir=str(out_dir),
         format=pq_format,
         file_options=write_opts,
@@ -128,10 +318,57 @@ def main() -> None:
         ),
         max_rows_per_group=a.row_group_size,
         max_rows_per_file=a.rows_per_file,
-        existing_data_behavior="overwrite_or_ignore",
+        existing_data_behavior="delete_matching",     # replace only the partitions written
         use_threads=True,
+        file_visitor=written.append,
     )
 
+    if filter_expr is None:
+        # a full run mirrors the input: drop partitions of proteins it no longer has
+        current = {Path(wf.path).parent.name for wf in written}
+        for d in sorted(out_dir.glob("protein=*")):
+            if d.is_dir() and d.name not in current:
+                print(f"[partition] Removing {d.name} (no longer in the input)")
+                shutil.rmtree(d)
+
+    if not a.no_stats:
+        if counts:
+            top = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)
+            print("[partition] Proteins (top 20 by rows):")
+            for k, v in top[:20]:
+                print(f"  {k}: {v:,}")
+            print(f"[partition] Total proteins: {len(counts)}")
+        else:
+            print("[partition] No non-null protein values found.")
+
+    manifest_cols = [c.strip() for c in a.manifest_columns.split(",") if c.strip()]
+    manifest_path = out_dir / "_manifest.json"
+    old_shards = json.loads(manifest_path.read_text()).get("shards", {}) if manifest_path.exists() else {}
+    manifest = build_manifest(out_dir, manifest_cols)
+    shards = {p: e for p, e in old_shards.items()
+              if p in manifest["partitions"]
+              and all((out_dir / e[kind]["path"]).exists() for kind in ("filter", "meta"))}
+    if a.split_shards:
+        shard_dir = Path(a.shards_dir) if a.shards_dir else out_dir / "_shards"
+        print(f"[partition] Writing filter and metadata shards to: {shard_dir}")
+        shards.update(write_shards(out_dir, shard_dir, written, a.compression,
+                                   a.shard_row_group_size))
+    else:
+        # shards of partitions rewritten without --split-shards are out of date
+        rewritten = {Path(wf.path).parent.name.split("=", 1)[1] for wf in written}
+        shards = {p: e for p, e in shards.items() if p not in rewritten}
+    # remove shard files the manifest no longer lists
+    kept = {e[kind]["path"] for e in shards.values() for kind in ("filter", "meta")}
+    for e in old_shards.values():
+        for kind in ("filter", "meta"):
+            if e[kind]["path"] not in kept:
+                (out_dir / e[kind]["path"]).unlink(missing_ok=True)
+    if shards:
+        manifest["shards"] = dict(sorted(shards.items()))
+    manifest_path.write_text(json.dumps(manifest, indent=2, default=str))
+    print(f"[partition] Manifest: {len(manifest['partitions'])} partitions, "
+          f"{manifest['total_rows']:,} rows → {out_dir / '_manifest.json'}")
+
     # Show a quick hint for DuckDB usage
     print("[partition] Done. Example DuckDB usage:")
     print("  CREATE OR REPLACE VIEW proteins AS")
@@ -0,0 +1,115 @@
+"""
+Global peptide dictionary: every distinct peptide gets a stable int32 ID.
+
+The dictionary is one Parquet file with two columns,
+
+  peptide_id int32   0, 1, 2, … in order of first sight
+  peptide    string
+
+and is append-only: IDs are never reused or renumbered, so a `peptide_id`
+written into any table stays valid as the dictionary grows. Tables that carry
+`peptide_id` instead of the peptide string join and group on integers:
+
+  SELECT d.peptide, s.*
+  FROM   read_parquet('iedb_netmhc_slim.parquet') s
+  JOIN   read_parquet('peptide_dict.parquet') d USING (peptide_id);
+
+Used by slim_parquet.py (--peptide-dict) and peptidecalcs.py (PEPTIDE_DICT).
+Writers must not update the same dictionary file concurrently.
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+DICT_SCHEMA = pa.schema([
+    pa.field("peptide_id", pa.int32(), nullable=False),
+    pa.field("peptide", pa.string(), nullable=False),
+])
+
+MAX_ID = np.iinfo(np.int32).max
+
+
+class PeptideDictionary:
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        if self.path.exists():
+            tbl = pq.read_table(self.path, schema=DICT_SCHEMA)
+            ids = tbl["peptide_id"].to_numpy()
+            if not np.array_equal(ids, np.arange(len(ids))):
+                raise ValueError(f"{self.path}: peptide_id must be 0..n-1 in file order")
+            peptides = tbl["peptide"].to_pylist()
+        else:
+            peptides = []
+        self._index = pd.Index(peptides, dtype=object)
+        self._persisted = len(peptides)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def dirty(self) -> bool:
+        return len(self._index) > self._persisted
+
+    def add(self, peptides: Iterable[str] | pa.Array | pa.ChunkedArray) -> int:
+        """Assign IDs to peptides not yet in the dictionary; returns how many were new."""
+        uniq = pd.unique(pd.Series(_to_numpy(peptides), dtype=object).dropna().to_numpy())
+        new = uniq[self._index.get_indexer(uniq) < 0]
+        if len(self._index) + len(new) > MAX_ID:
+            raise OverflowError("peptide dictionary is full (int32 IDs)")
+        if len(new):
+            self._index = self._index.append(pd.Index(new, dtype=object))
+        return len(new)
+
+    def encode(self, peptides: Iterable[str] | pa.Array | pa.ChunkedArray,
+               add: bool = False) -> pa.Int32Array:
+        """peptide → peptide_id; unknown peptides raise unless `add` is set. Nulls stay null."""
+        values = _to_numpy(peptides)
+        if add:
+            self.add(values)
+        idx = self._index.get_indexer(pd.Index(values, dtype=object))
+        nulls = pd.isna(values)
+        unknown = (idx < 0) & ~nulls
+        if unknown.any():
+            first = values[int(np.flatnonzero(unknown)[0])]
+            raise KeyError(f"{int(unknown.sum()):,} peptide(s) not in {self.path.name}, e.g. {first!r}")
+        return pa.array(idx, pa.int32(), mask=nulls)
+
+    def decode(self, ids: Iterable[int] | pa.Array | pa.ChunkedArray) -> pa.StringArray:
+        """peptide_id → peptide."""
+        return pc.take(pa.array(self._index.to_numpy(), pa.string()),
+                       pa.array(_to_numpy(ids), pa.int32(), from_pandas=True))
+
+    def table(self) -> pa.Table:
+        return pa.table({
+            "peptide_id": pa.array(np.arange(len(self._index)), pa.int32()),
+            "peptide": pa.array(self._index.to_numpy(), pa.string()),
+        }, schema=DICT_SCHEMA)
+
+    def save(self) -> None:
+        """Rewrite the dictionary file atomically (only if peptides were added)."""
+        if not self.dirty and self.path.exists():
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        pq.write_table(self.table(), tmp, compression="zstd")
+        os.replace(tmp, self.path)
+        self._persisted = len(self._index)
+
+
+def _to_numpy(values) -> np.ndarray:
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        if pa.types.is_dictionary(values.type):
+            values = values.cast(values.type.value_type)
+        return values.to_numpy(zero_copy_only=False)
+    if isinstance(values, (pd.Series, pd.Index, np.ndarray)):
+        return np.asarray(values, dtype=object)
+    return np.asarray(list(values), dtype=object)
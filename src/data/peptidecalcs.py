@@ -5,26 +5,63 @@ API for NetMHCpan 4.1 EL & BA across multiple alleles, in batches.
 
 Outputs:
   - peptides_30k_8-14.csv                      (generated peptide list)
-  - iedb_netmhcpan_30k_allalleles_results.csv  (growing results file)
+  - iedb_netmhc_slim/peptide_len=*/…           (slim Parquet results, RESULTS_FORMAT="parquet")
+    or iedb_netmhcpan_30k_allalleles_results.csv (growing CSV, RESULTS_FORMAT="csv")
+  - …_results_cache.sqlite                     (prediction cache + job manifest)
+
+With GENERATION = "observed" the peptides are the k-mers actually present in
+the per-protein sequence dataset (SEQUENCE_DATASET) that occur in at least
+THRESHOLD sequences, instead of every combination of residues passing the
+threshold position by position.
+
+Peptides already in the cache are not resubmitted, and jobs left in flight by
+an interrupted run are re-polled rather than paid for again (see predcache.py).
+With PRESCREEN_TRAINING set, a local PSSM model drops clear non-binders before
+submission (see prescreen.py).
 """
 
-import csv
+import itertools
 import json
 import math
 import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-import itertools
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import requests
+from numpy.lib.stride_tricks import sliding_window_view
+
+from batch_sizer import AdaptiveBatchSizer, job_windows
+from build_sequencecalc import list_partitions
+from kmer_index import count_protein, distinct_sequences, key_letters
+from peptide_dict import PeptideDictionary
+from predcache import PredictionCache
+from prescreen import Predictor, Prescreen, load_training
+from results_sink import CsvResultsSink, ParquetResultsSink
+from telemetry import Telemetry
 
 
 # ───────────────────────── CONFIG ─────────────────────────
 FREQ_PARQUET   = Path(r"C:\Users\mcjen\Documents\GitHub\immunopeptidomics\src\data\IAV8_sequencecalc.parquet")
+SEQUENCE_DATASET = Path(r"C:\Users\mcjen\Documents\GitHub\immunopeptidomics\src\data\IAV6_partitioned")
+GENERATION     = "product"          # "product" → per-position combinations (FREQ_PARQUET),
+                                    # "observed" → k-mers seen in SEQUENCE_DATASET
+GENERATION_WORKERS = None           # processes for "observed" (None → CPU count)
 
 PEPTIDE_OUT    = Path(r"C:\Users\mcjen\Documents\GitHub\immunopeptidomics\src\data\peptides_30k_8-14.csv")
+PEPTIDE_DICT   = Path(r"C:\Users\mcjen\Documents\GitHub\immunopeptidomics\src\data\peptide_dict.parquet")  # None → no peptide_id column
 RESULTS_OUT    = Path(r"C:\Users\mcjen\Documents\GitHub\immunopeptidomics\src\data\iedb_netmhcpan_30k_allalleles_results_YES.csv")
+RESULTS_DATASET = Path(r"C:\Users\mcjen\Documents\GitHub\immunopeptidomics\src\data\iedb_netmhc_slim")
+RESULTS_FORMAT = "parquet"          # "parquet" → RESULTS_DATASET, "csv" → RESULTS_OUT
+RESULTS_PARTITION = "peptide_len"   # or "allele"
+CACHE_DB       = RESULTS_OUT.with_name(RESULTS_OUT.stem + "_cache.sqlite")
+TELEMETRY_JSONL = RESULTS_OUT.with_name(RESULTS_OUT.stem + "_telemetry.jsonl")  # None → off
+TELEMETRY_PROM  = RESULTS_OUT.with_name(RESULTS_OUT.stem + ".prom")             # Prometheus textfile; None → off
 
 THRESHOLD      = 30_000
 EXCLUDE_PROTS  = {"HA", "NA"}
@@ -40,25 +77,124 @@ PREDICTORS = [
     {"type": "binding", "method": "netmhcpan_el"},
     {"type": "binding", "method": "netmhcpan_ba"}
 ]
+PREDICTOR_VERSION = "netmhcpan-4.1"   # part of the cache key; bump to invalidate
+
+# Local pre-screen (None → submit every peptide). It switches itself off unless the
+# training data covers every allele in ALLELES: predictions_annotated.csv has
+# A*34:01, B*35:03 and C*04:01 only, so with the list above it does nothing.
+PRESCREEN_TRAINING   = Path(r"C:\Users\mcjen\Documents\GitHub\immunopeptidomics\src\data\predictions_annotated.csv")
+PRESCREEN_RECALL     = 0.99   # share of held-out binders the pre-screen must keep
+PRESCREEN_BINDER_PCT = 2.0    # EL percentile that counts as a binder
 
 API_PIPELINE_URL = "https://api-nextgen-tools.iedb.org/api/v1/pipeline"
 API_RESULTS_URL  = "https://api-nextgen-tools.iedb.org/api/v1/results"  # + /{result_id}
 
-BATCH_SIZE    = 1_000    # peptides per API call
-POLL_INTERVAL = 30       # seconds
+BATCH_SIZE    = 1_000    # peptides per API call (the starting size when adaptive)
+ADAPTIVE_BATCHING = True # learn the job size with the best throughput from turnaround times
+BATCH_MIN     = 250      # bounds for the adaptive size, in predicted windows
+BATCH_MAX     = 5_000
+PACK_SPAN     = 1        # pack tail batches of lengths ≤ this far apart into one job (0 → off)
+POLL_INTERVAL = 30       # seconds (also the cap for per-job poll backoff)
+IN_FLIGHT     = 4        # concurrent IEDB jobs (1 = submit, wait, submit …)
+POLL_MIN      = 5        # seconds before the first poll of an in-flight job
+POLL_BACKOFF  = 1.5      # per-job poll delay multiplier, capped at POLL_INTERVAL
 MAX_RETRIES   = 3
 TIMEOUT_SEC   = 30
 # ──────────────────────────────────────────────────────────
 
 
 # ─────────────── peptide generation (freq >= 30k) ────────────────
-def generate_peptides(freq_df: pd.DataFrame,
-                      lengths: List[int],
-                      thr: int,
-                      exclude: set) -> pd.DataFrame:
-    """Return DataFrame of peptides (protein, peptide_len, start, end, peptide)."""
-
-    rows = []
+PEPTIDE_SCHEMA = pa.schema([
+    pa.field("protein",        pa.string()),
+    pa.field("peptide_len",    pa.int64()),
+    pa.field("start_position", pa.int64()),
+    pa.field("end_position",   pa.int64()),
+    pa.field("peptide",        pa.string()),
+])
+
+
+def encode_residues(residues: np.ndarray) -> Tuple[np.ndarray, int]:
+    """Map uint8 residue bytes onto dense codes 0..A-1; return (codes, bits per code)."""
+    lut = np.zeros(256, dtype=np.uint8)
+    alphabet = np.unique(residues)
+    lut[alphabet] = np.arange(len(alphabet), dtype=np.uint8)
+    bits = max(1, int(len(alphabet) - 1).bit_length())
+    return lut[residues], bits
+
+
+def pack_keys(codes: np.ndarray, bits: int) -> np.ndarray:
+    """Pack an (n, k) matrix of dense residue codes into (n, words) uint64 keys."""
+    per_word = 64 // bits
+    n, k = codes.shape
+    words = -(-k // per_word)
+    keys = np.zeros((n, words), dtype=np.uint64)
+    for j in range(k):
+        w = j // per_word
+        keys[:, w] = (keys[:, w] << np.uint64(bits)) | codes[:, j].astype(np.uint64)
+    return keys
+
+
+def first_occurrences(keys: np.ndarray) -> np.ndarray:
+    """Row indices of the first occurrence of every distinct key row, in input order."""
+    if len(keys) == 0:
+        return np.empty(0, dtype=np.int64)
+    order = np.lexsort(keys.T[::-1])             # stable → ties keep input order
+    sk = keys[order]
+    new_key = np.ones(len(sk), dtype=bool)
+    new_key[1:] = (sk[1:] != sk[:-1]).any(axis=1)
+    return np.sort(order[new_key])
+
+
+def strings_from_codes(codes: np.ndarray) -> pa.Array:
+    """Build an Arrow string array from an (n, k) uint8 matrix without Python strings."""
+    n, k = codes.shape
+    offsets = np.arange(0, (n + 1) * k, k, dtype=np.int32)
+    data = np.ascontiguousarray(codes)
+    return pa.StringArray.from_buffers(n, pa.py_buffer(offsets), pa.py_buffer(data))
+
+
+def _protein_windows(protein: str,
+                     positions: np.ndarray,
+                     counts: np.ndarray,
+                     residues: np.ndarray,
+                     k: int) -> Optional[pa.RecordBatch]:
+    """All deduplicated k-mers of one protein as a RecordBatch (itertools.product order)."""
+    n_win = len(positions) - k + 1
+    if n_win <= 0:
+        return None
+
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    combos = sliding_window_view(counts, k).prod(axis=1)
+    total = int(combos.sum())
+
+    win = np.repeat(np.arange(n_win), combos)
+    rem = np.arange(total) - np.repeat(np.cumsum(combos) - combos, combos)
+
+    # Mixed-radix decode; the last window position varies fastest, like product()
+    raw = np.empty((total, k), dtype=np.uint8)
+    for j in range(k - 1, -1, -1):
+        cnt = counts[win + j]
+        raw[:, j] = residues[offsets[win + j] + rem % cnt]
+        rem //= cnt
+
+    dense, bits = encode_residues(raw.ravel())
+    keep = first_occurrences(pack_keys(dense.reshape(total, k), bits))
+    win = win[keep]
+
+    return pa.RecordBatch.from_arrays([
+        pa.repeat(pa.scalar(protein, pa.string()), len(keep)),
+        pa.repeat(pa.scalar(k, pa.int64()), len(keep)),
+        pa.array(positions[win]),
+        pa.array(positions[win + k - 1]),
+        strings_from_codes(raw[keep]),
+    ], schema=PEPTIDE_SCHEMA)
+
+
+def peptide_table(freq_df: pd.DataFrame,
+                  lengths: List[int],
+                  thr: int,
+                  exclude: set) -> pa.Table:
+    """Vectorised peptide generator; returns an Arrow table with PEPTIDE_SCHEMA."""
 
     # filter early
     filt = (
@@ -66,38 +202,84 @@ def generate_peptides(freq_df: pd.DataFrame,
         (freq_df["aminoacid"] != "-") &
         (~freq_df["protein"].isin(exclude))
     )
-    df = freq_df[filt]
+    df = freq_df.loc[filt, ["protein", "position", "aminoacid"]]
 
+    batches = []
     for protein, grp in df.groupby("protein", sort=False):
-        pos2aas = (
-            grp.groupby("position")["aminoacid"]
-               .apply(lambda s: list(s.unique()))
-               .to_dict()
-        )
-        positions = sorted(pos2aas.keys())
-        if not positions:
+        # per-position residues in first-seen order, positions ascending
+        grp = (grp[["position", "aminoacid"]]
+               .drop_duplicates()
+               .sort_values("position", kind="stable"))
+        if grp.empty:
             continue
+        pos = grp["position"].to_numpy(dtype=np.int64)
+        residues = np.frombuffer("".join(grp["aminoacid"]).encode("ascii"), dtype=np.uint8)
+        if len(residues) != len(pos):
+            raise ValueError(f"{protein}: aminoacid values must be single residues")
+
+        bounds = np.flatnonzero(np.diff(pos)) + 1
+        positions = pos[np.concatenate(([0], bounds))]
+        counts = np.diff(np.concatenate(([0], bounds, [len(pos)])))
 
         for k in lengths:
-            if len(positions) < k:  # too short
-                continue
-            for i in range(len(positions) - k + 1):
-                window = positions[i:i + k]
-                # build cartesian product of AA lists
-                aa_lists = [pos2aas[p] for p in window]
-                for combo in itertools.product(*aa_lists):
-                    rows.append({
-                        "protein":        protein,
-                        "peptide_len":    k,
-                        "start_position": window[0],
-                        "end_position":   window[-1],
-                        "peptide":        "".join(combo)
-                    })
-
-    out = (pd.DataFrame(rows)
-           .drop_duplicates(subset=["protein", "peptide_len", "peptide"])
-           .reset_index(drop=True))
-    return out
+            batch = _protein_windows(protein, positions, counts, residues, k)
+            if batch is not None and batch.num_rows:
+                batches.append(batch)
+
+    return pa.Table.from_batches(batches, schema=PEPTIDE_SCHEMA)
+
+
+def _observed_protein(protein: str, files: List[Path], lengths: List[int],
+                      thr: int) -> Optional[pa.Table]:
+    """k-mers of one protein found in at least `thr` sequences (PEPTIDE_SCHEMA)."""
+    seqs, weight = distinct_sequences(files)
+    batches = []
+    for k, c in count_protein(seqs, weight, lengths, positions=True).items():
+        keep = c["all"] >= thr
+        if not keep.any():
+            continue
+        start, end = c["start"][keep] + 1, c["end"][keep] + 1
+        order = np.lexsort((c["keys"][keep], start))          # by position, then peptide
+        batches.append(pa.RecordBatch.from_arrays([
+            pa.repeat(pa.scalar(protein, pa.string()), len(order)),
+            pa.repeat(pa.scalar(k, pa.int64()), len(order)),
+            pa.array(start[order], pa.int64()),
+            pa.array(end[order], pa.int64()),
+            strings_from_codes(key_letters(c["keys"][keep][order], k)),
+        ], schema=PEPTIDE_SCHEMA))
+    return pa.Table.from_batches(batches, schema=PEPTIDE_SCHEMA) if batches else None
+
+
+def observed_peptide_table(dataset: Path, lengths: List[int], thr: int, exclude: set,
+                           workers: Optional[int] = None) -> pa.Table:
+    """
+    Peptides actually present in the protein-partitioned sequence dataset.
+
+    A k-mer is kept when at least `thr` sequences contain it (gaps removed,
+    k-mers with ambiguity codes skipped); start/end are the aligned positions
+    where it occurs in the most sequences. Proteins stream through a process
+    pool, one distinct-sequence set in memory per worker.
+    """
+    parts = {p: fs for p, fs in list_partitions(Path(dataset)).items() if p not in exclude}
+    if not parts:
+        raise SystemExit(f"No protein=* partitions under {dataset}")
+    tables = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {p: pool.submit(_observed_protein, p, fs, lengths, thr) for p, fs in parts.items()}
+        for p, fut in futures.items():
+            tbl = fut.result()
+            print(f"   🧬  {p}: {0 if tbl is None else tbl.num_rows:,} observed peptides")
+            if tbl is not None:
+                tables.append(tbl)
+    return pa.concat_tables(tables) if tables else PEPTIDE_SCHEMA.empty_table()
+
+
+def generate_peptides(freq_df: pd.DataFrame,
+                      lengths: List[int],
+                      thr: int,
+                      exclude: set) -> pd.DataFrame:
+    """Return DataFrame of peptides (protein, peptide_len, start, end, peptide)."""
+    return peptide_table(freq_df, lengths, thr, exclude).to_pandas()
 
 
 # ──────────────── IEDB helpers ─────────────────────────
@@ -108,7 +290,12 @@ def fasta_from_sequences(seqs: List[str], start_index: int = 1) -> str:
     return "\n".join(lines)
 
 
-def robust_request(method: str, url: str, **kwargs) -> requests.Response:
+request_retries = 0   # HTTP retries made by robust_request since import, for load tests
+
+
+def robust_request(method: str, url: str, on_retry: Optional[Callable[[], None]] = None,
+                   **kwargs) -> requests.Response:
+    global request_retries
     for attempt in range(1, MAX_RETRIES + 1):
         try:
             resp = requests.request(method, url, timeout=TIMEOUT_SEC, **kwargs)
@@ -119,14 +306,21 @@ def robust_request(method: str, url: str, **kwargs) -> requests.Response:
             if attempt == MAX_RETRIES:
                 raise
             print(f"   ⚠️  {method.upper()} {url} failed ({exc}), retrying ({attempt}/{MAX_RETRIES}) …")
+            request_retries += 1
+            if on_retry is not None:
+                on_retry()
             time.sleep(2 ** attempt)
 
 
 def submit_batch(peps: List[str], pep_len: int, batch_no: int,
-                 alleles_str: str) -> Tuple[str, str]:
+                 alleles_str: str, on_retry: Optional[Callable[[], None]] = None,
+                 max_len: Optional[int] = None) -> Tuple[str, str]:
+    """Submit one job; with `max_len`, score lengths pep_len..max_len (a packed batch)."""
     fasta_text = fasta_from_sequences(peps)
+    max_len = pep_len if max_len is None else max_len
+    lens = f"{pep_len}" if max_len == pep_len else f"{pep_len}-{max_len}"
     payload = {
-        "pipeline_title": f"batch_{batch_no}_len_{pep_len}",
+        "pipeline_title": f"batch_{batch_no}_len_{lens}",
         "run_stage_range": [1, 1],
         "stages": [{
             "stage_number": 1,
@@ -134,7 +328,7 @@ def submit_batch(peps: List[str], pep_len: int, batch_no: int,
             "input_sequence_text": fasta_text,
             "input_parameters": {
                 "alleles": alleles_str,
-                "peptide_length_range": [int(pep_len), int(pep_len)],
+                "peptide_length_range": [int(pep_len), int(max_len)],
                 "predictors": PREDICTORS
             }
         }]
@@ -144,31 +338,29 @@ def submit_batch(peps: List[str], pep_len: int, batch_no: int,
         "post",
         API_PIPELINE_URL,
         headers={"accept": "application/json", "Content-Type": "application/json"},
-        data=json.dumps(payload)
+        data=json.dumps(payload),
+        on_retry=on_retry,
     )
     if resp.status_code != 200:
         raise RuntimeError(f"POST /pipeline failed: HTTP {resp.status_code} – {resp.text}")
 
     data = resp.json()
-    print(f"   📨  Submitted batch {batch_no} (len={pep_len}, {len(peps):,} peptides) "
+    print(f"   📨  Submitted batch {batch_no} (len={lens}, {len(peps):,} peptides) "
           f"→ result_id={data['result_id']}")
     return data["result_id"], data["pipeline_id"]
 
 
-def poll_result(result_id: str) -> dict:
+def check_result(result_id: str, on_retry: Optional[Callable[[], None]] = None) -> Optional[dict]:
+    """Poll once; return the result JSON when done, None while pending/running."""
     url = f"{API_RESULTS_URL}/{result_id}"
-    elapsed = 0
-    while True:
-        resp = robust_request("get", url, headers={"accept": "application/json"})
-        data = resp.json()
-        status = data.get("status", "unknown")
-        if status == "done":
-            return data
-        if status not in ("pending", "running"):
-            raise RuntimeError(f"Unexpected status for {result_id}: {status}")
-        print(f"      ⏳  {result_id} still {status} … ({elapsed}s elapsed)")
-        time.sleep(POLL_INTERVAL)
-        elapsed += POLL_INTERVAL
+    resp = robust_request("get", url, on_retry=on_retry, headers={"accept": "application/json"})
+    data = resp.json()
+    status = data.get("status", "unknown")
+    if status == "done":
+        return data
+    if status not in ("pending", "running"):
+        raise RuntimeError(f"Unexpected status for {result_id}: {status}")
+    return None
 
 
 def extract_peptide_table(result_json: dict) -> Tuple[List[str], List[List]]:
@@ -180,59 +372,459 @@ def extract_peptide_table(result_json: dict) -> Tuple[List[str], List[List]]:
     raise ValueError("peptide_table not found in result JSON")
 
 
+def batch_rows(b: "Batch", result_json: dict) -> Tuple[List[str], List[List]]:
+    """
+    The peptide table of a finished batch, restricted to the submitted peptides.
+
+    A packed batch is scored with a length range, so IEDB also returns every
+    shorter sub-peptide of its longer inputs; those rows are dropped.
+    """
+    cols, rows = extract_peptide_table(result_json)
+    lo, hi = b.length_range
+    if lo == hi:
+        return cols, rows
+    i_pep, i_all = cols.index("peptide"), cols.index("allele")
+    wanted = set(b.peptides)
+    seen = set()
+    keep = []
+    for r in rows:
+        key = (r[i_pep], r[i_all])
+        if r[i_pep] in wanted and key not in seen:
+            seen.add(key)
+            keep.append(r)
+    return cols, keep
+
+
+# ──────────────── batch scheduling ─────────────────────
+@dataclass
+class Batch:
+    batch_no: int
+    pep_len: int                  # shortest length in the batch
+    peptides: List[str]
+    result_id: Optional[str] = None
+    delay: float = POLL_MIN
+    next_poll: float = 0.0
+    # telemetry
+    resumed: bool = False
+    submitted_at: float = 0.0     # unix time
+    completed_at: float = 0.0
+    submit_s: float = 0.0
+    poll_s: float = 0.0
+    polls: int = 0
+    retries: int = 0
+    failures: int = 0             # jobs lost to an error status or exhausted request retries
+
+    def count_retry(self) -> None:
+        self.retries += 1
+
+    @property
+    def length_range(self) -> Tuple[int, int]:
+        lens = [len(p) for p in self.peptides]
+        return min(lens), max(lens)
+
+    @property
+    def windows(self) -> int:
+        """Peptides IEDB scores for this batch (more than submitted when packed)."""
+        return job_windows((len(p) for p in self.peptides), *self.length_range)
+
+
+def poll_batch(b: Batch) -> Optional[dict]:
+    """check_result for `b`, counting polls, retries and time spent polling."""
+    t0 = time.monotonic()
+    try:
+        res_json = check_result(b.result_id, on_retry=b.count_retry)
+    finally:
+        b.polls += 1
+        b.poll_s += time.monotonic() - t0
+    if res_json is not None:
+        b.completed_at = time.time()
+    return res_json
+
+
+def poll_result(b: Batch) -> dict:
+    elapsed = 0
+    while True:
+        data = poll_batch(b)
+        if data is not None:
+            return data
+        print(f"      ⏳  {b.result_id} still running … ({elapsed}s elapsed)")
+        time.sleep(POLL_INTERVAL)
+        elapsed += POLL_INTERVAL
+
+
+def iter_batches(pep_df: pd.DataFrame, batch_size: int = BATCH_SIZE,
+                 start: int = 0) -> Iterator[Batch]:
+    """Split peptides by length into batches of at most `batch_size`, numbered after `start`."""
+    batch_no = start
+    for pep_len in sorted(pep_df["peptide_len"].unique()):
+        subset = pep_df[pep_df["peptide_len"] == pep_len]["peptide"]
+        total_batches = math.ceil(len(subset) / batch_size)
+        print(f"\n••• Length {pep_len}: {len(subset):,} peptides → {total_batches} batches ≤ {batch_size}")
+
+        for i in range(total_batches):
+            batch_no += 1
+            yield Batch(batch_no, int(pep_len),
+                        subset.iloc[i * batch_size:(i + 1) * batch_size].tolist())
+
+
+def iter_adaptive_batches(pep_df: pd.DataFrame, sizer: AdaptiveBatchSizer,
+                          start: int = 0, pack_span: int = PACK_SPAN) -> Iterator[Batch]:
+    """
+    Like iter_batches, but every batch takes the size `sizer` holds when it is
+    pulled, so feedback from finished jobs shapes the batches still to come.
+
+    The short last batch of each length is held back and packed together with
+    the tails of the next lengths (at most `pack_span` apart) while the sizer
+    predicts one packed job to be faster than separate ones.
+    """
+    batch_no = start
+    carry: List[str] = []
+
+    def flush() -> Iterator[Batch]:
+        nonlocal batch_no, carry
+        if carry:
+            batch_no += 1
+            yield Batch(batch_no, len(carry[0]), carry)
+            carry = []
+
+    for pep_len in sorted(pep_df["peptide_len"].unique()):
+        pep_len = int(pep_len)
+        subset = pep_df.loc[pep_df["peptide_len"] == pep_len, "peptide"].tolist()
+        print(f"\n••• Length {pep_len}: {len(subset):,} peptides, batches of ~{sizer.size:,}")
+
+        i = 0
+        while len(subset) - i >= sizer.size:
+            n, batch_no = sizer.size, batch_no + 1
+            yield Batch(batch_no, pep_len, subset[i:i + n])
+            i += n
+        tail = subset[i:]
+        if not tail:
+            continue
+
+        if carry and pep_len - len(carry[0]) <= pack_span:
+            lo = len(carry[0])
+            alone = job_windows((len(p) for p in carry), lo, len(carry[-1]))
+            together = job_windows((len(p) for p in carry + tail), lo, pep_len)
+            if sizer.worth_packing(alone, len(tail), together):
+                carry = carry + tail
+                continue
+        yield from flush()
+        carry = tail
+    yield from flush()
+
+
+def start_batch(b: Batch, on_submit: Optional[Callable[[Batch], None]] = None) -> None:
+    """Submit `b` unless it already carries a result_id (a job resumed from the manifest)."""
+    if b.result_id is not None:
+        print(f"   🔁  Resuming batch {b.batch_no} → result_id={b.result_id}")
+        b.resumed = True
+        b.submitted_at = time.time()
+        return
+    t0 = time.monotonic()
+    lo, hi = b.length_range
+    b.result_id, _ = submit_batch(b.peptides, lo, b.batch_no, ALLELES_STR,
+                                  on_retry=b.count_retry, max_len=hi)
+    b.submit_s = time.monotonic() - t0
+    b.submitted_at = time.time()
+    if on_submit is not None:
+        on_submit(b)
+
+
+def retry_batch(b: Batch, exc: Exception,
+                on_failed: Optional[Callable[[Batch], None]] = None) -> bool:
+    """
+    Record a lost job of `b` and reset it for resubmission; False once `b`
+    has failed more than MAX_RETRIES times and is given up.
+    """
+    b.failures += 1
+    if b.result_id is not None and on_failed is not None:
+        on_failed(b)
+    b.result_id, b.resumed = None, False
+    if b.failures > MAX_RETRIES:
+        print(f"   ❌  Batch {b.batch_no} failed {b.failures} times ({exc}); giving up")
+        return False
+    print(f"   ⚠️  Batch {b.batch_no} failed ({exc}), resubmitting ({b.failures}/{MAX_RETRIES}) …")
+    return True
+
+
+def run_sequential(batches: Iterable[Batch],
+                   on_done: Callable[[Batch, dict], None],
+                   on_submit: Optional[Callable[[Batch], None]] = None,
+                   on_failed: Optional[Callable[[Batch], None]] = None) -> List[Batch]:
+    """Submit one batch, wait for it, write it, then move on; returns the batches given up."""
+    given_up = []
+    for b in batches:
+        while True:
+            try:
+                start_batch(b, on_submit)
+                res_json = poll_result(b)
+            except Exception as exc:
+                if retry_batch(b, exc, on_failed):
+                    continue
+                given_up.append(b)
+                break
+            on_done(b, res_json)
+            break
+    return given_up
+
+
+def run_concurrent(batches: Iterable[Batch],
+                   on_done: Callable[[Batch, dict], None],
+                   in_flight: int = IN_FLIGHT,
+                   on_submit: Optional[Callable[[Batch], None]] = None,
+                   on_failed: Optional[Callable[[Batch], None]] = None) -> List[Batch]:
+    """
+    Keep up to `in_flight` IEDB jobs running and poll them together.
+
+    Each job backs off from POLL_MIN to POLL_INTERVAL between polls. Finished
+    jobs are handed to `on_done` in submission order, so the results file is
+    written in the same order as `run_sequential` would write it; results
+    waiting behind a slower job count against `in_flight`. A job that fails
+    is resubmitted up to MAX_RETRIES times (`on_failed` sees the lost job)
+    while the others keep running. Returns the batches given up.
+    """
+    pending = iter(batches)
+    running: Dict[int, Batch] = {}
+    finished: Dict[int, Tuple[Batch, dict]] = {}
+    order: deque = deque()
+    given_up: List[Batch] = []
+    exhausted = False
+
+    def launch(b: Batch) -> None:
+        while True:
+            try:
+                start_batch(b, on_submit)
+            except Exception as exc:
+                if retry_batch(b, exc, on_failed):
+                    continue
+                given_up.append(b)
+                order.remove(b.batch_no)
+                return
+            b.delay = POLL_MIN
+            b.next_poll = time.monotonic() + b.delay
+            running[b.batch_no] = b
+            return
+
+    def drain() -> None:
+        while order and order[0] in finished:
+            on_done(*finished.pop(order.popleft()))
+
+    while True:
+        # top up
+        while not exhausted and len(running) + len(finished) < in_flight:
+            b = next(pending, None)
+            if b is None:
+                exhausted = True
+                break
+            order.append(b.batch_no)
+            launch(b)
+
+        drain()
+        if not running:
+            break
+
+        wait = min(b.next_poll for b in running.values()) - time.monotonic()
+        if wait > 0:
+            print(f"      ⏳  {len(running)} job(s) in flight, next poll in {wait:,.0f}s")
+            time.sleep(wait)
+
+        # poll every job that is due
+        for batch_no, b in list(running.items()):
+            if b.next_poll > time.monotonic():
+                continue
+            try:
+                res_json = poll_batch(b)
+            except Exception as exc:
+                del running[batch_no]
+                if retry_batch(b, exc, on_failed):
+                    launch(b)
+                else:
+                    given_up.append(b)
+                    order.remove(batch_no)
+                continue
+            if res_json is None:
+                b.delay = min(b.delay * POLL_BACKOFF, POLL_INTERVAL)
+                b.next_poll = time.monotonic() + b.delay
+                continue
+            del running[batch_no]
+            finished[batch_no] = (b, res_json)
+
+        # write in submission order
+        drain()
+    return given_up
+
+
+# ──────────────── predictor backends ───────────────────
+class IedbPredictor(Predictor):
+    """
+    Remote NetMHCpan EL through the IEDB API for ALLELES; score = -EL
+    percentile. Peptides of given-up batches score -inf. Not cached:
+    run_predictions remains the path for bulk runs, this one serves
+    `Predictor` callers such as checks of a local model against the remote one.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, in_flight: Optional[int] = None) -> None:
+        self.alleles = list(ALLELES)             # jobs are submitted for ALLELES_STR
+        self.batch_size = batch_size or BATCH_SIZE
+        self.in_flight = in_flight or IN_FLIGHT
+
+    def score(self, peptides: Sequence[str]) -> np.ndarray:
+        uniq = pd.DataFrame({"peptide": pd.unique(pd.Series(list(peptides), dtype=object))})
+        uniq["peptide_len"] = uniq["peptide"].str.len()
+        row_of = {p: i for i, p in enumerate(uniq["peptide"])}
+        col_of = {a: j for j, a in enumerate(self.alleles)}
+        scores = np.full((len(uniq), len(self.alleles)), -np.inf)
+
+        def collect(b: Batch, res_json: dict) -> None:
+            cols, rows = batch_rows(b, res_json)
+            i_pep, i_all = cols.index("peptide"), cols.index("allele")
+            i_el = cols.index("netmhcpan_el_percentile")
+            for r in rows:
+                if r[i_all] in col_of:
+                    scores[row_of[r[i_pep]], col_of[r[i_all]]] = -float(r[i_el])
+
+        run_concurrent(iter_batches(uniq, self.batch_size), collect, self.in_flight)
+        return scores[[row_of[p] for p in peptides]]
+
+
+# ──────────────── pre-screen ───────────────────────────
+def prescreen_peptides(pep_df: pd.DataFrame) -> pd.DataFrame:
+    """Drop peptides the local PSSM pre-screen rules out for every allele."""
+    train = load_training(PRESCREEN_TRAINING)
+    missing = sorted(set(ALLELES) - set(train["allele"]))
+    if missing:
+        print(f"🔎  Pre-screen off: no training data for {', '.join(missing)}")
+        return pep_df
+
+    screen = Prescreen.calibrate(train, recall=PRESCREEN_RECALL,
+                                 binder_pct=PRESCREEN_BINDER_PCT)
+    missing = screen.uncovered(ALLELES)
+    if missing:
+        print(f"🔎  Pre-screen off: no held-out binders for {', '.join(missing)}")
+        return pep_df
+    unpruned = screen.unpruned(ALLELES)
+    if unpruned:
+        print(f"🔎  Pre-screen off: validation recall below {PRESCREEN_RECALL:.0%} for "
+              + ", ".join(f"{a} ({screen.recall[a]:.1%})" for a in unpruned))
+        return pep_df
+
+    keep = screen.keep_mask(pep_df["peptide"].tolist(), ALLELES)
+    worst = min(screen.recall[a] for a in ALLELES)
+    print(f"🔎  Pre-screen (target recall {PRESCREEN_RECALL:.0%}, "
+          f"validation ≥ {worst:.1%}): pruned {(~keep).sum():,} of {len(pep_df):,} peptides")
+    pruned = pep_df.loc[~keep, "peptide_len"].value_counts().sort_index()
+    for pep_len, n in pruned.items():
+        print(f"      len {pep_len}: −{n:,}")
+    return pep_df[keep]
+
+
 # ───────────────────────── main ─────────────────────────
+def run_predictions(pep_df: pd.DataFrame) -> Telemetry:
+    """
+    Steps 2–4 of main for a generated peptide table (columns peptide,
+    peptide_len): skip cached peptides, resume jobs left in flight, submit the
+    rest and write the results. Returns the run's telemetry.
+    """
+    # 2. Undo interrupted writes, drop peptides already predicted, pick up jobs left in flight
+    cache = PredictionCache(CACHE_DB, ALLELES, [p["method"] for p in PREDICTORS],
+                            PREDICTOR_VERSION)
+    if RESULTS_FORMAT == "parquet":
+        sink = ParquetResultsSink(RESULTS_DATASET, partition_by=RESULTS_PARTITION,
+                                  peptides=PeptideDictionary(PEPTIDE_DICT) if PEPTIDE_DICT else None)
+    else:
+        sink = CsvResultsSink(RESULTS_OUT)
+    # before stale jobs are marked failed, which would hide their partial rows
+    sink.recover(cache.truncate_offset(), cache.writing_batches())
+
+    resumed = []
+    for rid, batch_no, pep_len, peps in cache.pending_jobs():
+        try:
+            check_result(rid)
+        except Exception as exc:
+            print(f"   ⚠️  Dropping stale job {rid} (batch {batch_no}): {exc}")
+            cache.record_failed(rid)
+            continue
+        resumed.append(Batch(batch_no, pep_len, peps, result_id=rid))
+    in_flight_peps = {p for b in resumed for p in b.peptides}
+
+    missing = cache.missing(pep_df["peptide"])
+    todo_df = pep_df[pep_df["peptide"].isin(missing - in_flight_peps)]
+    print(f"🗃️  Cache: {(~pep_df['peptide'].isin(missing)).sum():,} peptides cached, "
+          f"{len(resumed)} job(s) resumed, {len(todo_df):,} peptides to submit")
+    if PRESCREEN_TRAINING is not None:
+        todo_df = prescreen_peptides(todo_df)
+
+    # 3. Telemetry and batch sizing
+    remaining = Counter(todo_df["peptide_len"].value_counts().to_dict())
+    for b in resumed:
+        remaining.update(len(p) for p in b.peptides)
+    telemetry = Telemetry(remaining, TELEMETRY_JSONL, TELEMETRY_PROM, in_flight=IN_FLIGHT)
+    if ADAPTIVE_BATCHING:
+        sizer = AdaptiveBatchSizer(BATCH_SIZE, BATCH_MIN, BATCH_MAX)
+    else:
+        sizer = AdaptiveBatchSizer(BATCH_SIZE, BATCH_SIZE, BATCH_SIZE)
+
+    # 4. Batch submit by length (tails of neighbouring lengths packed together)
+    with sink:
+        def on_submit(b: Batch) -> None:
+            cache.record_submitted(b.result_id, b.batch_no, b.pep_len, b.peptides)
+
+        def write_batch(b: Batch, res_json: dict) -> None:
+            cols, rows = batch_rows(b, res_json)
+            t0 = time.monotonic()
+            cache.record_writing(b.result_id, sink.tell())
+            lo, hi = b.length_range
+            n = sink.write(b.batch_no, lo if lo == hi else None, cols, rows)
+            cache.record_done(b.result_id, cols, rows)
+            print(f"   ✅  Batch {b.batch_no} done – wrote {n:,} rows")
+            telemetry.batch_done(b, n, time.monotonic() - t0)
+            if not b.resumed:
+                old = sizer.size
+                sizer.observe(b.windows, b.submit_s + b.completed_at - b.submitted_at)
+                if sizer.size != old:
+                    print(f"   📐  Batch size {old:,} → {sizer.size:,}")
+
+        def on_failed(b: Batch) -> None:
+            cache.record_failed(b.result_id)
+
+        batches = itertools.chain(resumed, iter_adaptive_batches(
+            todo_df, sizer, cache.last_batch_no(), PACK_SPAN))
+        if IN_FLIGHT > 1:
+            given_up = run_concurrent(batches, write_batch, IN_FLIGHT, on_submit, on_failed)
+        else:
+            given_up = run_sequential(batches, write_batch, on_submit, on_failed)
+
+    cache.close()
+    telemetry.close()
+    if given_up:
+        n = sum(len(b.peptides) for b in given_up)
+        raise RuntimeError(f"{len(given_up)} batch(es) ({n:,} peptides) failed after "
+                           f"{MAX_RETRIES} resubmissions; run again to retry them")
+    return telemetry
+
+
 def main():
     t0 = time.time()
 
     # 1. Generate peptides (freq>=30k, exclude HA/NA)
-    freq_df = pd.read_parquet(FREQ_PARQUET,
-                              columns=["protein", "position", "aminoacid", "frequency_all"])
-    pep_df = generate_peptides(freq_df, LENGTHS, THRESHOLD, EXCLUDE_PROTS)
+    if GENERATION == "observed":
+        pep_df = observed_peptide_table(SEQUENCE_DATASET, LENGTHS, THRESHOLD, EXCLUDE_PROTS,
+                                        GENERATION_WORKERS).to_pandas()
+    else:
+        freq_df = pd.read_parquet(FREQ_PARQUET,
+                                  columns=["protein", "position", "aminoacid", "frequency_all"])
+        pep_df = generate_peptides(freq_df, LENGTHS, THRESHOLD, EXCLUDE_PROTS)
+    if PEPTIDE_DICT is not None:
+        peptides = PeptideDictionary(PEPTIDE_DICT)
+        pep_df.insert(0, "peptide_id", peptides.encode(pep_df["peptide"], add=True).to_numpy())
+        peptides.save()
+        print(f"🔢  Peptide dictionary: {len(peptides):,} IDs → {PEPTIDE_DICT.name}")
     pep_df.to_csv(PEPTIDE_OUT, index=False)
     print(f"✔️  Generated {len(pep_df):,} peptides (@≥{THRESHOLD:,}) → {PEPTIDE_OUT.name}")
 
-    # 2. Prepare output for results
-    if RESULTS_OUT.exists():
-        print(f"Appending to existing result file: {RESULTS_OUT.name}")
-        first_write = False
-    else:
-        RESULTS_OUT.parent.mkdir(parents=True, exist_ok=True)
-        first_write = True
-
-    # 3. Batch submit by length
-    global_batch = 0
-    with open(RESULTS_OUT, "a", newline="", encoding="utf-8") as f_out:
-        writer = None
-
-        for pep_len in sorted(pep_df["peptide_len"].unique()):
-            subset = pep_df[pep_df["peptide_len"] == pep_len]["peptide"]
-            total_batches = math.ceil(len(subset) / BATCH_SIZE)
-            print(f"\n••• Length {pep_len}: {len(subset):,} peptides → {total_batches} batches ≤ {BATCH_SIZE}")
-
-            for i in range(total_batches):
-                global_batch += 1
-                batch_peps = subset.iloc[i * BATCH_SIZE:(i + 1) * BATCH_SIZE].tolist()
-
-                # submit
-                rid, _ = submit_batch(batch_peps, pep_len, global_batch, ALLELES_STR)
-
-                # poll
-                res_json = poll_result(rid)
-                cols, rows = extract_peptide_table(res_json)
-
-                # write
-                if first_write:
-                    writer = csv.writer(f_out)
-                    writer.writerow(cols)
-                    first_write = False
-                if writer is None:
-                    writer = csv.writer(f_out)
-                writer.writerows(rows)
-                f_out.flush()
-
-                print(f"   ✅  Batch {global_batch} done – wrote {len(rows):,} rows")
-
-    print(f"\n🎉  Done. Results → {RESULTS_OUT}")
+    run_predictions(pep_df)
+    results_path = RESULTS_DATASET if RESULTS_FORMAT == "parquet" else RESULTS_OUT
+    print(f"\n🎉  Done. Results → {results_path}")
     print(f"⏱️  Runtime: {time.time() - t0:,.1f} s")
 
 
@@ -0,0 +1,526 @@
+"""
+Incremental runner for the data build (partition → sequencecalc → k-mer
+index → peptidecalcs → …).
+
+Stages are declared in a JSON spec (default: src/data/pipeline.json). Each
+stage names the files or directories it reads and writes; a stage is skipped
+when the content hashes of its inputs, its parameters and its code (the
+script plus the sibling modules it imports) match the last successful run and
+its outputs are still as that run left them. Stages whose inputs come from
+another stage's outputs run after it; everything else runs in parallel.
+
+  {
+    "vars": {"data": "src/data"},
+    "stages": [
+      {"name": "partition",
+       "script": "src/data/partition_iav6_by_protein.py",
+       "args": ["--input", "{data}/IBV_all.parquet", "--outdir", "{data}/IBV_partitioned"],
+       "inputs": ["{data}/IBV_all.parquet"],
+       "outputs": ["{data}/IBV_partitioned"]},
+      {"name": "sequencecalc",
+       "foreach": {"protein": "{data}/IBV_partitioned/protein=*"},
+       "script": "src/data/build_sequencecalc.py",
+       "args": ["--dataset", "{data}/IBV_partitioned", "--only-proteins", "{protein}",
+                "--output", "{data}/IBV_sequencecalc.parts/{protein}.parquet"],
+       "inputs": ["{data}/IBV_partitioned/protein={protein}"],
+       "outputs": ["{data}/IBV_sequencecalc.parts/{protein}.parquet"]},
+      {"name": "sequencecalc-merge", "builtin": "concat_parquet",
+       "inputs": ["{data}/IBV_sequencecalc.parts/*.parquet"],
+       "outputs": ["{data}/IBV_sequencecalc.parquet"]}
+    ]
+  }
+
+Stage fields:
+  script + args   run `python <script> <args…>`
+  config          for scripts configured by module constants (peptidecalcs):
+                  set these constants, then call the module's main(). Values
+                  replacing a Path constant become Paths; derived constants
+                  (e.g. CACHE_DB) are not recomputed and must be set too
+  builtin         concat_parquet: concatenate the input Parquet files
+  foreach         {"var": "<glob>"}: one stage instance per match, with {var}
+                  bound to the text matched by `*`; expanded once the upstream
+                  stages have finished, so per-protein work is only redone for
+                  proteins whose partition changed. Outputs of instances whose
+                  match has disappeared are deleted
+  inputs/outputs  paths (globs allowed in inputs) relative to the repo root
+  after           extra stage names to wait for
+
+Parquet files are hashed by schema and column values, so a rewrite that only
+moves row-group boundaries counts as unchanged. Run state, a stat-keyed hash
+cache and per-stage logs live next to the spec in `<spec>.state/`.
+
+Usage (from repo root):
+
+  python src/data/pipeline.py                      # every stage
+  python src/data/pipeline.py sequencecalc-merge   # a stage and what it needs
+
+Optional flags:
+  --spec src/data/pipeline.json
+  --var data=/scratch/ibv     override a spec variable (repeatable)
+  --jobs 4                    stages run at once (default: CPU count)
+  --force sequencecalc        rerun these stages even if unchanged (repeatable)
+  --dry-run                   print what would run
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DEFAULT_SPEC = Path(__file__).with_name("pipeline.json")
+HASH_CHUNK = 1 << 20
+LOG_TAIL = 20
+_IMPORT = re.compile(r"^\s*(?:from\s+(\w+)\s+import|import\s+(\w+))", re.M)
+_GLOB_CHARS = "*?["
+
+_BOOTSTRAP = """\
+import json, sys
+from pathlib import Path
+sys.path.insert(0, {dir!r})
+sys.argv = [{script!r}] + json.loads({args!r})
+import {module} as m
+for k, v in json.loads({config!r}).items():
+    cur = getattr(m, k, None)
+    if v is not None and isinstance(cur, Path):
+        v = Path(v)
+    elif isinstance(cur, (set, frozenset)):
+        v = set(v)
+    setattr(m, k, v)
+m.main()
+"""
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Run the data build, skipping stages whose inputs are unchanged.")
+    p.add_argument("targets", nargs="*", help="Stages to bring up to date (default: all)")
+    p.add_argument("--spec", default=str(DEFAULT_SPEC), help="Pipeline spec (JSON)")
+    p.add_argument("--var", action="append", default=[], metavar="KEY=VALUE",
+                   help="Override a spec variable")
+    p.add_argument("--jobs", type=int, default=None, help="Stages run at once (default: CPU count)")
+    p.add_argument("--force", action="append", default=[], help="Rerun this stage even if unchanged")
+    p.add_argument("--dry-run", action="store_true", help="Only print what would run")
+    return p.parse_args()
+
+
+# ───────────────────────── hashing ─────────────────────────
+class Hasher:
+    """SHA-256 of files and directory trees, cached by (size, mtime)."""
+
+    def __init__(self, cache_path: Path) -> None:
+        self.path = cache_path
+        self.lock = threading.Lock()
+        try:
+            self.cache: Dict[str, List] = json.loads(cache_path.read_text())
+        except (OSError, ValueError):
+            self.cache = {}
+
+    def file(self, path: Path) -> str:
+        st = path.stat()
+        key = str(path.resolve())
+        with self.lock:
+            hit = self.cache.get(key)
+        if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+            return hit[2]
+        digest = parquet_digest(path) if path.suffix == ".parquet" else None
+        if digest is None:
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                while chunk := f.read(HASH_CHUNK):
+                    h.update(chunk)
+            digest = h.hexdigest()
+        with self.lock:
+            self.cache[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def tree(self, path: Path) -> Optional[str]:
+        """Digest of a file or directory (relative names + contents); None if missing."""
+        if path.is_file():
+            return self.file(path)
+        if not path.is_dir():
+            return None
+        h = hashlib.sha256()
+        for f in sorted(p for p in path.rglob("*") if p.is_file() and "__pycache__" not in p.parts):
+            h.update(f.relative_to(path).as_posix().encode() + b"\0" + self.file(f).encode() + b"\n")
+        return h.hexdigest()
+
+    def save(self) -> None:
+        with self.lock:
+            write_json(self.path, self.cache)
+
+
+def parquet_digest(path: Path) -> Optional[str]:
+    """Digest of a Parquet file's schema and column values, independent of its
+    row-group layout (writers that stream batches split row groups wherever the
+    batches happened to end). None if the file cannot be read as Parquet."""
+    try:
+        pf = pq.ParquetFile(path)
+        h = hashlib.sha256(pf.schema_arrow.serialize().to_pybytes())
+        for name in pf.schema_arrow.names:
+            col = pf.read(columns=[name]).column(0).combine_chunks()
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, pa.schema([pa.field(name, col.type)])) as w:
+                w.write_batch(pa.record_batch([col], names=[name]))
+            h.update(sink.getvalue())
+    except (pa.ArrowException, OSError):
+        return None
+    return h.hexdigest()
+
+
+def write_json(path: Path, obj: Any) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(obj, indent=1, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def code_files(script: Path) -> List[Path]:
+    """The script plus every sibling module it imports, transitively."""
+    seen: Dict[Path, None] = {}
+    todo = [script]
+    while todo:
+        f = todo.pop()
+        if f in seen or not f.is_file():
+            continue
+        seen[f] = None
+        for a, b in _IMPORT.findall(f.read_text(encoding="utf-8")):
+            todo.append(f.with_name(f"{a or b}.py"))
+    return sorted(seen)
+
+
+# ───────────────────────── spec ─────────────────────────
+@dataclass
+class Stage:
+    """One runnable instance of a spec stage (foreach stages have several)."""
+    id: str
+    group: str
+    script: Optional[Path]
+    args: List[str]
+    config: Optional[Dict[str, Any]]
+    builtin: Optional[str]
+    inputs: List[str]
+    outputs: List[str]
+
+
+@dataclass
+class Template:
+    name: str
+    spec: Dict[str, Any]
+    deps: Set[str] = field(default_factory=set)
+
+
+def fmt(value: Any, env: Dict[str, str]) -> Any:
+    """Substitute {vars} in strings, recursively through lists and dicts."""
+    if isinstance(value, str):
+        return value.format_map(env)
+    if isinstance(value, list):
+        return [fmt(v, env) for v in value]
+    if isinstance(value, dict):
+        return {k: fmt(v, env) for k, v in value.items()}
+    return value
+
+
+def static_prefix(path: str) -> str:
+    """The part of a path pattern before its first {var} or glob character."""
+    cut = min((i for i, c in enumerate(path) if c in "{" + _GLOB_CHARS), default=len(path))
+    return path[:cut]
+
+
+def overlaps(a: str, b: str) -> bool:
+    a, b = static_prefix(a), static_prefix(b)
+    return a.startswith(b) or b.startswith(a)
+
+
+def load_spec(path: Path, overrides: List[str]) -> tuple[Dict[str, str], List[Template]]:
+    spec = json.loads(path.read_text(encoding="utf-8"))
+    env = {k: str(v) for k, v in spec.get("vars", {}).items()}
+    for item in overrides:
+        k, sep, v = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--var expects KEY=VALUE, got {item!r}")
+        env[k] = v
+    templates: List[Template] = []
+    for s in spec["stages"]:
+        if sum(k in s for k in ("script", "builtin")) != 1:
+            raise SystemExit(f"Stage {s.get('name')!r}: give exactly one of script, builtin")
+        templates.append(Template(s["name"], s))
+    names = {t.name for t in templates}
+    if len(names) != len(templates):
+        raise SystemExit("Stage names must be unique")
+
+    # Partial formatting: foreach variables stay as {var} until expansion
+    def loose(v: Any) -> Any:
+        return fmt(v, _Loose(env))
+
+    for t in templates:
+        for other in templates:
+            if other is t:
+                continue
+            if any(overlaps(i, o) for i in loose(t.spec.get("inputs", []))
+                   for o in loose(other.spec.get("outputs", []))):
+                t.deps.add(other.name)
+        for a in t.spec.get("after", []):
+            if a not in names:
+                raise SystemExit(f"Stage {t.name!r}: unknown stage in after: {a!r}")
+            t.deps.add(a)
+    return env, templates
+
+
+class _Loose(dict):
+    def __missing__(self, key: str) -> str:
+        return "{" + key + "}"
+
+
+def expand(t: Template, env: Dict[str, str]) -> List[Stage]:
+    """Stage instances of a template, resolving its foreach glob against the disk."""
+    s = t.spec
+    bindings: List[Dict[str, str]] = [{}]
+    if "foreach" in s:
+        (var, pattern), = s["foreach"].items()
+        pattern = fmt(pattern, env)
+        rx = re.compile(re.escape(pattern).replace(r"\*", "(.+)") + "$")
+        values = sorted({m.group(1) for p in glob.glob(pattern) if (m := rx.match(Path(p).as_posix()))})
+        bindings = [{var: v} for v in values]
+    out = []
+    for b in bindings:
+        e = {**env, **b}
+        out.append(Stage(
+            id=t.name + "".join(f"[{k}={v}]" for k, v in b.items()),
+            group=t.name,
+            script=Path(fmt(s["script"], e)) if "script" in s else None,
+            args=fmt(s.get("args", []), e),
+            config=fmt(s["config"], e) if "config" in s else None,
+            builtin=s.get("builtin"),
+            inputs=fmt(s.get("inputs", []), e),
+            outputs=fmt(s.get("outputs", []), e),
+        ))
+    return out
+
+
+def resolve_inputs(stage: Stage) -> List[Path]:
+    paths: List[Path] = []
+    for pattern in stage.inputs:
+        if any(c in pattern for c in _GLOB_CHARS):
+            paths += [Path(p) for p in sorted(glob.glob(pattern))]
+        elif Path(pattern).exists():
+            paths.append(Path(pattern))
+        else:
+            raise FileNotFoundError(f"missing input {pattern}")
+    return paths
+
+
+# ───────────────────────── builtins ─────────────────────────
+def concat_parquet(inputs: List[Path], outputs: List[str]) -> None:
+    files = [f for p in inputs for f in ([p] if p.is_file() else sorted(p.rglob("*.parquet")))]
+    if not files:
+        raise FileNotFoundError("concat_parquet: no input files")
+    out = Path(outputs[0])
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(out.suffix + ".tmp")
+    schema = pq.read_schema(files[0])
+    with pq.ParquetWriter(tmp, schema, compression="zstd") as w:
+        for f in files:
+            w.write_table(pq.read_table(f).cast(schema))
+    os.replace(tmp, out)
+
+
+BUILTINS = {"concat_parquet": concat_parquet}
+
+
+# ───────────────────────── runner ─────────────────────────
+class Runner:
+    def __init__(self, spec_path: Path, jobs: int, force: Set[str], dry_run: bool) -> None:
+        self.state_dir = spec_path.with_suffix(".state")
+        self.state_path = self.state_dir / "state.json"
+        try:
+            self.state: Dict[str, Dict[str, Any]] = json.loads(self.state_path.read_text())
+        except (OSError, ValueError):
+            self.state = {}
+        self.hasher = Hasher(self.state_dir / "hashes.json")
+        self.lock = threading.Lock()
+        self.jobs = jobs
+        self.force = force
+        self.dry_run = dry_run
+
+    def key(self, stage: Stage, inputs: List[Path]) -> str:
+        code = code_files(stage.script) if stage.script else []
+        payload = {
+            "script": stage.script.as_posix() if stage.script else None,
+            "builtin": stage.builtin,
+            "args": stage.args,
+            "config": stage.config,
+            "code": {f.name: self.hasher.file(f) for f in code},
+            "inputs": {p.as_posix(): self.hasher.tree(p) for p in inputs},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def up_to_date(self, stage: Stage, key: str) -> bool:
+        prev = self.state.get(stage.id)
+        if prev is None or prev["key"] != key or stage.group in self.force:
+            return False
+        return all(self.hasher.tree(Path(o)) == prev["outputs"].get(o) for o in stage.outputs)
+
+    def command(self, stage: Stage) -> List[str]:
+        if stage.config is None:
+            return [sys.executable, str(stage.script), *stage.args]
+        code = _BOOTSTRAP.format(dir=str(stage.script.parent.resolve()), script=str(stage.script),
+                                 module=stage.script.stem, args=json.dumps(stage.args),
+                                 config=json.dumps(stage.config))
+        return [sys.executable, "-c", code]
+
+    def run_stage(self, stage: Stage, upstream_changed: bool) -> str:
+        """'skipped' | 'ran' | 'would run'; raises on failure."""
+        if self.dry_run and upstream_changed:
+            return "would run"          # its inputs are about to change
+        inputs = resolve_inputs(stage)
+        key = self.key(stage, inputs)
+        if self.up_to_date(stage, key):
+            return "skipped"
+        if self.dry_run:
+            return "would run"
+
+        if stage.builtin:
+            BUILTINS[stage.builtin](inputs, stage.outputs)
+        else:
+            log = self.state_dir / "logs" / (re.sub(r"[^\w.=-]+", "_", stage.id) + ".log")
+            log.parent.mkdir(parents=True, exist_ok=True)
+            with open(log, "w", encoding="utf-8") as f:
+                env = {**os.environ, "PYTHONIOENCODING": "utf-8"}
+                rc = subprocess.run(self.command(stage), stdout=f, stderr=subprocess.STDOUT, env=env).returncode
+            if rc != 0:
+                tail = log.read_text(encoding="utf-8", errors="replace").splitlines()[-LOG_TAIL:]
+                raise RuntimeError(f"exit code {rc} (log: {log})\n    " + "\n    ".join(tail))
+
+        missing = [o for o in stage.outputs if not Path(o).exists()]
+        if missing:
+            raise RuntimeError(f"did not write {', '.join(missing)}")
+        outputs = {o: self.hasher.tree(Path(o)) for o in stage.outputs}
+        with self.lock:
+            self.state[stage.id] = {"key": key, "group": stage.group, "outputs": outputs,
+                                    "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            write_json(self.state_path, self.state)
+            self.hasher.save()
+        return "ran"
+
+    def prune(self, group: str, live: List[Stage]) -> None:
+        """Delete outputs of foreach instances whose match has disappeared."""
+        ids = {s.id for s in live}
+        with self.lock:
+            stale = [k for k, v in self.state.items() if v.get("group") == group and k not in ids]
+        for k in stale:
+            if self.dry_run:
+                print(f"[pipeline] would prune {k}")
+                continue
+            for o in self.state[k]["outputs"]:
+                p = Path(o)
+                if p.is_dir():
+                    shutil.rmtree(p)
+                elif p.exists():
+                    p.unlink()
+            with self.lock:
+                del self.state[k]
+                write_json(self.state_path, self.state)
+            print(f"[pipeline] 🧹 Pruned {k}")
+
+    def run(self, env: Dict[str, str], templates: List[Template], targets: List[str]) -> bool:
+        by_name = {t.name: t for t in templates}
+        unknown = [t for t in targets if t not in by_name]
+        if unknown:
+            raise SystemExit(f"Unknown stage(s): {', '.join(unknown)} (have: {', '.join(by_name)})")
+        wanted: Set[str] = set()
+        todo = list(targets or by_name)
+        while todo:
+            n = todo.pop()
+            if n not in wanted:
+                wanted.add(n)
+                todo.extend(by_name[n].deps)
+
+        done: Dict[str, str] = {}            # template → 'ran' | 'skipped' | 'failed' | …
+        open_: Dict[str, List[Future]] = {}
+        pending = [t for t in templates if t.name in wanted]
+        ok = True
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            while pending or open_:
+                for t in list(pending):
+                    dep_states = [done.get(d) for d in t.deps & wanted]
+                    if None in dep_states:
+                        continue
+                    pending.remove(t)
+                    if any(s in ("failed", "blocked") for s in dep_states):
+                        done[t.name] = "blocked"
+                        print(f"[pipeline] ⏭️  {t.name}: blocked by a failed upstream stage")
+                        continue
+                    changed = any(s in ("ran", "would run") for s in dep_states)
+                    stages = expand(t, env)
+                    if "foreach" in t.spec:
+                        self.prune(t.name, stages)
+                    open_[t.name] = [pool.submit(self._timed, s, changed) for s in stages]
+                    if not stages:
+                        print(f"[pipeline] {t.name}: foreach matched nothing")
+
+                if not open_:
+                    if pending:
+                        raise SystemExit("Stage dependencies form a cycle: "
+                                         + ", ".join(t.name for t in pending))
+                    continue
+                wait([f for fs in open_.values() for f in fs], return_when=FIRST_COMPLETED)
+                for name, fs in list(open_.items()):
+                    if all(f.done() for f in fs):
+                        results = [f.result() for f in fs]
+                        del open_[name]
+                        if "failed" in results:
+                            done[name], ok = "failed", False
+                        elif any(r in ("ran", "would run") for r in results):
+                            done[name] = "would run" if self.dry_run else "ran"
+                        else:
+                            done[name] = "skipped"
+        self.hasher.save()
+        counts = {s: list(done.values()).count(s) for s in sorted(set(done.values()))}
+        print("[pipeline] Done: " + ", ".join(f"{n} {s}" for s, n in counts.items()))
+        return ok
+
+    def _timed(self, stage: Stage, upstream_changed: bool) -> str:
+        t0 = time.time()
+        try:
+            result = self.run_stage(stage, upstream_changed)
+        except Exception as e:
+            print(f"[pipeline] ❌ {stage.id}: {e}")
+            return "failed"
+        if result == "ran":
+            print(f"[pipeline] ✅ {stage.id} ({time.time() - t0:,.1f}s)")
+        elif result == "would run":
+            print(f"[pipeline] would run {stage.id}")
+        else:
+            print(f"[pipeline] ✔️  {stage.id} up to date")
+        return result
+
+
+def main() -> None:
+    a = parse_args()
+    spec_path = Path(a.spec)
+    env, templates = load_spec(spec_path, a.var)
+    unknown = [f for f in a.force if f not in {t.name for t in templates}]
+    if unknown:
+        raise SystemExit(f"--force: unknown stage(s) {', '.join(unknown)}")
+    runner = Runner(spec_path, a.jobs or os.cpu_count() or 1, set(a.force), a.dry_run)
+    if not runner.run(env, templates, a.targets):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
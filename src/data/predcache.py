@@ -0,0 +1,151 @@
+"""
+On-disk cache of IEDB predictions for peptidecalcs.
+
+Everything lives in one SQLite file next to the results:
+
+  predictions  (peptide, allele, method, version)
+               one row per prediction already written to the results file
+  jobs         manifest of IEDB jobs: result_id, batch_no, pep_len, peptides,
+               status ('submitted' | 'writing' | 'done' | 'failed'), the
+               results-file offset a batch started writing at, timestamps
+
+Before a run, `missing()` drops peptides whose every (allele, method) pair is
+already cached for the configured predictor version. Jobs still marked
+'submitted' were in flight when the last run stopped; they are re-polled
+instead of resubmitted. A job caught in 'writing' had its rows partly appended;
+`truncate_offset()` tells the caller where to cut the results file, and
+`writing_batches()` which batch files to remove, before the job is written
+again or dropped, so an interrupted run resumes exactly where it left off.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    peptide TEXT NOT NULL,
+    allele  TEXT NOT NULL,
+    method  TEXT NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (peptide, allele, method, version)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS jobs (
+    result_id    TEXT PRIMARY KEY,
+    batch_no     INTEGER NOT NULL,
+    pep_len      INTEGER NOT NULL,
+    peptides     TEXT NOT NULL,          -- newline-joined
+    status       TEXT NOT NULL,
+    write_offset INTEGER,
+    submitted_at REAL NOT NULL,
+    completed_at REAL
+);
+"""
+
+
+class PredictionCache:
+    """Prediction cache + job manifest for one predictor configuration."""
+
+    def __init__(self, path: Path, alleles: Sequence[str], methods: Sequence[str],
+                 version: str) -> None:
+        self.path = Path(path)
+        self.alleles = list(alleles)
+        self.methods = list(methods)
+        self.version = version
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    # ── lookups ────────────────────────────────────────────────────
+    def missing(self, peptides: Iterable[str]) -> Set[str]:
+        """Return the peptides that still lack at least one (allele, method) prediction."""
+        peptides = set(peptides)
+        if not peptides:
+            return peptides
+        need = len(self.alleles) * len(self.methods)
+        a_ph = ",".join("?" * len(self.alleles))
+        m_ph = ",".join("?" * len(self.methods))
+
+        cur = self.conn.cursor()
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS query (peptide TEXT PRIMARY KEY)")
+        cur.execute("DELETE FROM query")
+        cur.executemany("INSERT INTO query VALUES (?)", ((p,) for p in peptides))
+        done = cur.execute(
+            f"""SELECT q.peptide
+                FROM   query q JOIN predictions p ON p.peptide = q.peptide
+                WHERE  p.version = ? AND p.allele IN ({a_ph}) AND p.method IN ({m_ph})
+                GROUP  BY q.peptide
+                HAVING COUNT(*) = ?""",
+            [self.version, *self.alleles, *self.methods, need],
+        )
+        peptides.difference_update(r[0] for r in done)
+        cur.execute("DELETE FROM query")
+        return peptides
+
+    def pending_jobs(self) -> List[Tuple[str, int, int, List[str]]]:
+        """Jobs submitted by an earlier run that never completed: (result_id, batch_no, pep_len, peptides)."""
+        rows = self.conn.execute(
+            "SELECT result_id, batch_no, pep_len, peptides FROM jobs "
+            "WHERE status IN ('submitted', 'writing') ORDER BY batch_no"
+        ).fetchall()
+        return [(rid, bno, plen, peps.split("\n")) for rid, bno, plen, peps in rows]
+
+    def truncate_offset(self) -> Optional[int]:
+        """Results-file offset of a batch whose write was interrupted, if any."""
+        row = self.conn.execute(
+            "SELECT MIN(write_offset) FROM jobs WHERE status = 'writing'"
+        ).fetchone()
+        return None if row[0] is None else int(row[0])
+
+    def writing_batches(self) -> List[int]:
+        """Batch numbers whose write was interrupted."""
+        rows = self.conn.execute(
+            "SELECT batch_no FROM jobs WHERE status = 'writing' ORDER BY batch_no"
+        ).fetchall()
+        return [int(r[0]) for r in rows]
+
+    def last_batch_no(self) -> int:
+        row = self.conn.execute("SELECT MAX(batch_no) FROM jobs").fetchone()
+        return int(row[0] or 0)
+
+    # ── updates ────────────────────────────────────────────────────
+    def record_submitted(self, result_id: str, batch_no: int, pep_len: int,
+                         peptides: Sequence[str]) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, 'submitted', NULL, ?, NULL)",
+                (result_id, batch_no, pep_len, "\n".join(peptides), time.time()),
+            )
+
+    def record_writing(self, result_id: str, offset: int) -> None:
+        """Mark that rows for `result_id` are about to be appended at `offset`."""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'writing', write_offset = ? WHERE result_id = ?",
+                (offset, result_id),
+            )
+
+    def record_failed(self, result_id: str) -> None:
+        with self.conn:
+            self.conn.execute("UPDATE jobs SET status = 'failed' WHERE result_id = ?", (result_id,))
+
+    def record_done(self, result_id: str, cols: Sequence[str], rows: Sequence[Sequence]) -> None:
+        """Cache every (peptide, allele) in a finished peptide table and close the job."""
+        i_pep, i_all = cols.index("peptide"), cols.index("allele")
+        pairs = {(r[i_pep], r[i_all]) for r in rows}
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO predictions VALUES (?, ?, ?, ?)",
+                ((pep, allele, m, self.version) for pep, allele in pairs for m in self.methods),
+            )
+            self.conn.execute(
+                "UPDATE jobs SET status = 'done', completed_at = ? WHERE result_id = ?",
+                (time.time(), result_id),
+            )
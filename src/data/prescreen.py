@@ -0,0 +1,163 @@
+"""
+Offline pre-screening of peptides before they are sent to IEDB.
+
+Predictors share one small interface: `score(peptides)` returns an
+(n_peptides, n_alleles) array where higher means "more likely to bind".
+
+- PssmPredictor  local, vectorised position-specific scoring matrices, one per
+                 allele, fitted by ridge regression of -log(EL percentile) on
+                 the residues at the anchor slots P1–P4 and PΩ-3…PΩ. Training
+                 data is any IEDB result table we already hold
+                 (e.g. predictions_annotated.csv).
+- IedbPredictor  the remote NetMHCpan backend (see peptidecalcs.py).
+
+`Prescreen` turns a predictor into a filter: for every allele a score cutoff
+is calibrated on one half of the held-out binders (EL percentile <= binder_pct)
+so that `recall` of them are kept, and checked on the other half; alleles that
+miss the target on that validation half are not used for pruning. A peptide is
+dropped only if it falls below the cutoff for every allele; alleles without a
+model never drop anything.
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+ANCHOR_SLOTS = (0, 1, 2, 3, -4, -3, -2, -1)   # every position of an 8-mer
+N_CODES = len(AMINO_ACIDS) + 1                 # + "other"
+
+_LUT = np.full(256, len(AMINO_ACIDS), dtype=np.uint8)
+_LUT[np.frombuffer(AMINO_ACIDS.encode(), dtype=np.uint8)] = np.arange(len(AMINO_ACIDS))
+
+
+def slot_codes(peptides: Sequence[str]) -> np.ndarray:
+    """(n, len(ANCHOR_SLOTS)) residue codes at the anchor slots; peptides must be >= 8 long."""
+    peps = pd.Series(peptides, dtype=object)
+    lens = peps.str.len().to_numpy()
+    if len(lens) and lens.min() < len(ANCHOR_SLOTS):
+        raise ValueError(f"peptides must be at least {len(ANCHOR_SLOTS)} residues long")
+    out = np.empty((len(peps), len(ANCHOR_SLOTS)), dtype=np.uint8)
+    for k in np.unique(lens):
+        idx = np.flatnonzero(lens == k)
+        raw = np.frombuffer("".join(peps.iloc[idx]).encode("ascii"), dtype=np.uint8)
+        out[idx] = _LUT[raw.reshape(len(idx), k)[:, list(ANCHOR_SLOTS)]]
+    return out
+
+
+class Predictor(ABC):
+    """Scores peptides against `alleles`; higher = more likely to bind."""
+
+    alleles: List[str]
+
+    @abstractmethod
+    def score(self, peptides: Sequence[str]) -> np.ndarray:
+        """(n_peptides, n_alleles) scores."""
+
+
+class PssmPredictor(Predictor):
+    def __init__(self, alleles: Sequence[str], weights: np.ndarray, bias: np.ndarray) -> None:
+        self.alleles = list(alleles)
+        self.weights = weights          # (A, slots, N_CODES)
+        self.bias = bias                # (A,)
+
+    @classmethod
+    def fit(cls, df: pd.DataFrame, target: str = "netmhcpan_el_percentile",
+            ridge: float = 1.0) -> "PssmPredictor":
+        """Fit one matrix per allele from rows with `allele`, `peptide` and `target`."""
+        alleles, weights, bias = [], [], []
+        n_feat = len(ANCHOR_SLOTS) * N_CODES
+        for allele, grp in df.groupby("allele", sort=True):
+            codes = slot_codes(grp["peptide"].tolist())
+            y = -np.log(np.clip(grp[target].to_numpy(dtype=np.float64), 0.01, 100.0))
+            X = np.zeros((len(grp), n_feat))
+            X[np.arange(len(grp))[:, None], np.arange(len(ANCHOR_SLOTS)) * N_CODES + codes] = 1.0
+            mu = y.mean()
+            w = np.linalg.solve(X.T @ X + ridge * np.eye(n_feat), X.T @ (y - mu))
+            alleles.append(allele)
+            weights.append(w.reshape(len(ANCHOR_SLOTS), N_CODES))
+            bias.append(mu)
+        return cls(alleles, np.stack(weights), np.asarray(bias))
+
+    def score(self, peptides: Sequence[str], chunk: int = 200_000) -> np.ndarray:
+        codes = slot_codes(peptides)
+        slots = np.arange(len(ANCHOR_SLOTS))
+        out = np.empty((len(codes), len(self.alleles)))
+        for lo in range(0, len(codes), chunk):
+            c = codes[lo:lo + chunk]
+            # weights[:, slot, code] summed over slots → (A, n)
+            out[lo:lo + chunk] = (self.weights[:, slots[None, :], c].sum(axis=2)
+                                  + self.bias[:, None]).T
+        return out
+
+
+class Prescreen:
+    def __init__(self, predictor: Predictor, cutoffs: Dict[str, float],
+                 recall: Dict[str, float]) -> None:
+        self.predictor = predictor
+        self.cutoffs = cutoffs
+        self.recall = recall            # validation recall achieved per allele
+
+    @classmethod
+    def calibrate(cls, df: pd.DataFrame, recall: float = 0.99, binder_pct: float = 2.0,
+                  holdout: float = 0.2, seed: int = 0,
+                  target: str = "netmhcpan_el_percentile") -> "Prescreen":
+        """
+        Fit a PSSM on part of `df`, set cutoffs on half of the held-out binders
+        and measure recall on the other half. An allele whose validation recall
+        falls short of `recall` (or that has no validation binders) gets a
+        cutoff of -inf, i.e. it never lets the pre-screen drop a peptide.
+        """
+        peptides = df["peptide"].unique()
+        rng = np.random.default_rng(seed)
+        held = rng.choice(peptides, size=int(len(peptides) * holdout), replace=False)
+        is_calib = df["peptide"].isin(set(held[: len(held) // 2]))
+        is_valid = df["peptide"].isin(set(held[len(held) // 2:]))
+
+        predictor = PssmPredictor.fit(df[~(is_calib | is_valid)], target=target)
+        is_binder = df[target] <= binder_pct
+        cutoffs, achieved = {}, {}
+        for i, allele in enumerate(predictor.alleles):
+            of_allele = is_binder & (df["allele"] == allele)
+            calib = df.loc[is_calib & of_allele, "peptide"].tolist()
+            valid = df.loc[is_valid & of_allele, "peptide"].tolist()
+            if not calib:
+                continue
+            s = predictor.score(calib)[:, i]
+            cut = float(np.quantile(s, 1.0 - recall, method="lower"))
+            got = float((predictor.score(valid)[:, i] >= cut).mean()) if valid else 0.0
+            cutoffs[allele] = cut if got >= recall else -np.inf
+            achieved[allele] = got
+        return cls(predictor, cutoffs, achieved)
+
+    def unpruned(self, alleles: Sequence[str]) -> List[str]:
+        """Alleles whose cutoff failed validation and so keep every peptide."""
+        return [a for a in alleles if self.cutoffs.get(a) == -np.inf]
+
+    def keep_mask(self, peptides: Sequence[str], alleles: Sequence[str]) -> np.ndarray:
+        """True for peptides that may bind at least one of `alleles` and must be submitted."""
+        if any(a not in self.cutoffs for a in alleles) or len(peptides) == 0:
+            return np.ones(len(peptides), dtype=bool)
+        cols = [self.predictor.alleles.index(a) for a in alleles]
+        cut = np.array([self.cutoffs[a] for a in alleles])
+        return (self.predictor.score(peptides)[:, cols] >= cut).any(axis=1)
+
+    def uncovered(self, alleles: Sequence[str]) -> List[str]:
+        return [a for a in alleles if a not in self.cutoffs]
+
+
+def load_training(path, target: str = "netmhcpan_el_percentile",
+                  lengths: Optional[Sequence[int]] = None) -> pd.DataFrame:
+    """Read an IEDB result table (CSV or Parquet) for `Prescreen.calibrate`."""
+    path = str(path)
+    cols = ["allele", "peptide", target]
+    df = pd.read_parquet(path, columns=cols) if path.endswith(".parquet") else pd.read_csv(path, usecols=cols)
+    df = df.dropna()
+    df = df[df["peptide"].str.len() >= len(ANCHOR_SLOTS)]
+    if lengths is not None:
+        df = df[df["peptide"].str.len().isin(list(lengths))]
+    return df.drop_duplicates(["allele", "peptide"]).reset_index(drop=True)
@@ -0,0 +1,323 @@
+"""
+Align reference sequences to the per-position frequency profiles in a
+sequencecalc table and write the position mapping as a small Parquet file.
+
+This is the dashboards' `nwAffineBanded` (IAV2.md / IBV.md) run once at build
+time instead of in the browser on every protein switch. Scoring, band width,
+tie-breaking and traceback are the same, so `aligned_sequence` equals what the
+dashboard computes:
+
+  band      max(75, |M - N| + 20) around the diagonal
+  match     2·ln(freq / 0.05) if the residue occurs at that position,
+            0 if the position has an 'X', otherwise -5
+  gaps      affine, open -5 / extend -2
+
+The DP is vectorised per profile row (Mx and Ix from the previous row, Iy as
+a running max along the row); only the previous score row and a
+(M+1) × (2·band+1) uint8 traceback band are kept.
+
+Output rows (one per alignment column):
+
+  protein, record, header, column, position, ref_position, residue
+
+`position` is the 1-based profile position (NULL for a residue inserted
+relative to the profile), `ref_position` the 1-based position in the
+reference (NULL where the profile position has no reference residue) and
+`residue` the character of `aligned_sequence` ('-' for gaps).
+
+Usage (from repo root):
+
+  python src/data/profile_align.py \
+    --sequencecalc src/data/IAV8_sequencecalc.parquet \
+    --fasta  src/data/IAV8_consensus.fasta \
+    --output src/data/IAV8_alignment_map.parquet
+
+Optional flags:
+  --band 75  --gap-open -5  --gap-extend -2
+  --workers 4     worker processes (default: CPU count)
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+NEG = -1e9                      # score of cells outside the band (as in the JS)
+
+MAP_SCHEMA = pa.schema([
+    pa.field("protein", pa.string()),
+    pa.field("record", pa.int32()),
+    pa.field("header", pa.string()),
+    pa.field("column", pa.int32()),
+    pa.field("position", pa.int32()),
+    pa.field("ref_position", pa.int32()),
+    pa.field("residue", pa.string()),
+])
+
+# traceback band bits
+_TB_M = 0b0011                  # Mx came from Mx / Ix / Iy (0, 1, 2)
+_TB_IX = 0b0100                 # Ix extended (else opened from Mx)
+_TB_IY = 0b1000                 # Iy extended (else opened from Mx)
+
+
+class Profile:
+    """Residue frequencies of one protein: `freq[i, byte]` for 0-based position i."""
+
+    def __init__(self, freq: np.ndarray, has_x: np.ndarray) -> None:
+        self.freq = freq                                 # (M, 256) float64
+        self.has_x = has_x                               # position lists an 'X'
+
+    def __len__(self) -> int:
+        return len(self.freq)
+
+    @classmethod
+    def from_rows(cls, position: np.ndarray, aminoacid: List[str], value: np.ndarray) -> "Profile":
+        freq = np.zeros((int(position.max()), 256))
+        codes = np.frombuffer("".join(aminoacid).encode("latin-1"), dtype=np.uint8)
+        freq[position - 1, codes] = value
+        has_x = np.zeros(len(freq), dtype=bool)
+        has_x[position[codes == ord("X")] - 1] = True
+        return cls(freq, has_x)
+
+
+def normalise_protein(s: str) -> str:
+    """Same as the dashboards' normProtein: trim, drop whitespace, upper-case."""
+    return re.sub(r"\s+", "", s.strip()).upper()
+
+
+def read_fasta(path: Path) -> List[Tuple[str, str]]:
+    """[(header without '>', sequence), …] with whitespace removed from sequences."""
+    out, header, seq = [], None, []
+    for line in path.read_text().splitlines():
+        if line.startswith(">"):
+            if header is not None:
+                out.append((header, "".join(seq)))
+            header, seq = line[1:].strip(), []
+        elif line.strip():
+            seq.append(re.sub(r"\s+", "", line))
+    if header is not None:
+        out.append((header, "".join(seq)))
+    return out
+
+
+def load_profiles(path: Path, proteins: Optional[List[str]] = None) -> Dict[str, Profile]:
+    tbl = pq.read_table(path, columns=["protein", "position", "aminoacid", "value"]).to_pandas()
+    if proteins is not None:
+        tbl = tbl[tbl["protein"].isin(proteins)]
+    return {
+        p: Profile.from_rows(g["position"].to_numpy(), g["aminoacid"].tolist(), g["value"].to_numpy())
+        for p, g in tbl.groupby("protein", sort=True)
+    }
+
+
+# ───────────────────────── alignment ─────────────────────────
+def _running_gap(open_: np.ndarray, start: float, g_ext: float) -> np.ndarray:
+    """Iy[t] = max(open_[t], Iy[t-1] + g_ext) with Iy[-1] = start, in sequential float order."""
+    n = len(open_)
+    t = np.arange(n)
+    # closed form: best opening so far (later index wins ties, as in the
+    # recurrence) extended to t, then verified against the recurrence
+    c = open_ - t * g_ext
+    best = np.maximum.accumulate(np.where(c >= np.maximum.accumulate(c), t, 0))
+    y = np.maximum(open_[best] + (t - best) * g_ext, start + (t + 1) * g_ext)
+    prev = np.concatenate(([start], y[:-1]))
+    bad = np.flatnonzero(y != np.maximum(open_, prev + g_ext))
+    if len(bad):
+        # rounding differs from the sequential sum – finish the row exactly
+        k = bad[0]
+        last = prev[k]
+        for u in range(k, n):
+            last = max(open_[u], last + g_ext)
+            y[u] = last
+    return y
+
+
+def align(ref: str, profile: Profile, band: int = 75,
+          g_open: float = -5.0, g_ext: float = -2.0) -> Tuple[str, np.ndarray, np.ndarray]:
+    """
+    Banded affine-gap global alignment of `ref` to `profile`.
+
+    Returns (aligned_sequence, position, ref_position): per alignment column the
+    1-based profile and reference positions, 0 where that side has a gap.
+    """
+    M, N = len(profile), len(ref)
+    if N == 0:
+        raise ValueError("empty reference sequence")
+    bw = max(band, abs(M - N) + 20)
+    W = 2 * bw + 1
+    codes = np.frombuffer(ref.encode("latin-1"), dtype=np.uint8)
+
+    # substitution scores for every band cell, (M, W) with column c ↔ j = i - bw + c
+    jj = np.arange(1, M + 1)[:, None] - bw + np.arange(W)[None, :]
+    valid = (jj >= 1) & (jj <= N)
+    f = profile.freq[np.arange(M)[:, None], codes[np.clip(jj, 1, N) - 1]]
+    with np.errstate(divide="ignore"):
+        subst = np.where(f > 0, 2 * np.log(f / 0.05),
+                         np.where(profile.has_x[:, None], 0.0, -5.0))
+    subst[~valid] = 0.0
+
+    # row 0; rows are swapped between `prev` and `cur` buffers
+    prev = np.full((3, N + 1), NEG)                  # Mx, Ix, Iy of row i-1
+    cur = np.empty_like(prev)
+    prev[0, 0] = 0.0
+    j0 = np.arange(1, min(bw, N) + 1)
+    prev[2, j0] = g_open + (j0 - 1) * g_ext
+    tb = np.zeros((M + 1, W), dtype=np.uint8)        # column c ↔ j = i - bw + c
+    tb[0, bw + j0] = _TB_IY
+
+    for i in range(1, M + 1):
+        js, je = max(1, i - bw), min(N, i + bw)
+        cur.fill(NEG)
+        if i <= bw:
+            cur[1, 0] = g_open + (i - 1) * g_ext
+            tb[i, bw - i] = _TB_IX
+        if je < js:
+            prev, cur = cur, prev
+            continue
+        mx, ix, iy = prev
+        cur_m, cur_x, cur_y = cur
+        c0 = js - i + bw
+        s = subst[i - 1, c0:c0 + je - js + 1]
+
+        # max of (Mx, Ix, Iy) + s, first maximum wins (like indexOf)
+        m_best = mx[js - 1:je] + s
+        from_x = ix[js - 1:je] + s
+        from_y = iy[js - 1:je] + s
+        src_m = (from_x > m_best).astype(np.uint8)
+        np.maximum(m_best, from_x, out=m_best)
+        src_m[from_y > m_best] = 2
+        np.maximum(m_best, from_y, out=m_best)
+        cur_m[js:je + 1] = m_best
+
+        x_open = mx[js:je + 1] + g_open
+        x_ext = ix[js:je + 1] + g_ext
+        x_is_ext = x_open < x_ext
+        cur_x[js:je + 1] = np.where(x_is_ext, x_ext, x_open)
+
+        y_open = cur_m[js - 1:je] + g_open
+        cur_y[js:je + 1] = _running_gap(y_open, cur_y[js - 1], g_ext)
+        y_is_ext = y_open < cur_y[js - 1:je] + g_ext
+
+        tb[i, c0:c0 + je - js + 1] = src_m | (x_is_ext * _TB_IX) | (y_is_ext * _TB_IY)
+        prev, cur = cur, prev
+    mx, ix, iy = prev
+
+    # traceback
+    def tb_at(i: int, j: int) -> int:
+        c = j - i + bw
+        return int(tb[i, c]) if 0 <= c < W else 0
+
+    m_end, x_end, y_end = mx[N], ix[N], iy[N]
+    state = 0 if (m_end >= x_end and m_end >= y_end) else 1 if x_end >= y_end else 2
+    pos, ref_pos = [], []
+    i, j = M, N
+    while i > 0 or j > 0:
+        t = tb_at(i, j)
+        if state == 0:
+            if j > 0:
+                pos.append(i)
+                ref_pos.append(j)
+            state = t & _TB_M
+            i -= 1
+            j -= 1
+        elif state == 1:
+            pos.append(i)
+            ref_pos.append(0)
+            state = 1 if t & _TB_IX else 0
+            i -= 1
+        else:
+            if j > 0:
+                pos.append(0)
+                ref_pos.append(j)
+            state = 2 if t & _TB_IY else 0
+            j -= 1
+        if i <= 0 and j <= 0:
+            break
+
+    pos_arr = np.asarray(pos[::-1], dtype=np.int32)
+    ref_arr = np.asarray(ref_pos[::-1], dtype=np.int32)
+    aligned = "".join(ref[r - 1] if r > 0 else "-" for r in ref_arr)
+    return aligned, pos_arr, ref_arr
+
+
+def mapping_table(protein: str, record: int, header: str,
+                  aligned: str, pos: np.ndarray, ref_pos: np.ndarray) -> pa.Table:
+    n = len(aligned)
+    return pa.table({
+        "protein": pa.repeat(pa.scalar(protein, pa.string()), n),
+        "record": pa.repeat(pa.scalar(record, pa.int32()), n),
+        "header": pa.repeat(pa.scalar(header, pa.string()), n),
+        "column": pa.array(np.arange(1, n + 1), pa.int32()),
+        "position": pa.array(pos, pa.int32(), mask=pos == 0),
+        "ref_position": pa.array(ref_pos, pa.int32(), mask=ref_pos == 0),
+        "residue": pa.array(list(aligned), pa.string()),
+    }, schema=MAP_SCHEMA)
+
+
+def align_record(protein: str, record: int, header: str, seq: str, profile: Profile,
+                 band: int, g_open: float, g_ext: float) -> pa.Table:
+    aligned, pos, ref_pos = align(seq, profile, band, g_open, g_ext)
+    return mapping_table(protein, record, header, aligned, pos, ref_pos)
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Align reference sequences to sequencecalc profiles.")
+    p.add_argument("--sequencecalc", required=True, help="Per-position frequency table (Parquet)")
+    p.add_argument("--fasta", required=True, action="append",
+                   help="Reference FASTA; repeat for several files. Headers name the protein.")
+    p.add_argument("--output", required=True, help="Output Parquet file")
+    p.add_argument("--band", type=int, default=75, help="Minimum band half-width (default: 75)")
+    p.add_argument("--gap-open", type=float, default=-5.0)
+    p.add_argument("--gap-extend", type=float, default=-2.0)
+    p.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    return p.parse_args()
+
+
+def main() -> None:
+    a = parse_args()
+    records = []
+    for path in map(Path, a.fasta):
+        if not path.exists():
+            raise SystemExit(f"FASTA not found: {path}")
+        records.extend(read_fasta(path))
+    if not records:
+        raise SystemExit("No FASTA records found")
+
+    wanted = sorted({normalise_protein(h) for h, _ in records})
+    profiles = load_profiles(Path(a.sequencecalc), wanted)
+    for p in wanted:
+        if p not in profiles:
+            print(f"[align] ⚠️  No profile for {p} – skipped")
+
+    tables = []
+    with ProcessPoolExecutor(max_workers=a.workers) as pool:
+        futures = []
+        for rec, (header, seq) in enumerate(records):
+            protein = normalise_protein(header)
+            if protein in profiles and seq:
+                futures.append(pool.submit(align_record, protein, rec, header, seq,
+                                           profiles[protein], a.band, a.gap_open, a.gap_extend))
+        for fut in futures:
+            t = fut.result()
+            gaps = t["ref_position"].null_count
+            print(f"[align] {t['header'][0].as_py()}: {t.num_rows:,} columns, "
+                  f"{gaps:,} profile positions without a reference residue")
+            tables.append(t)
+
+    out = pa.concat_tables(tables) if tables else MAP_SCHEMA.empty_table()
+    out_path = Path(a.output)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(out, out_path, compression="zstd",
+                   use_dictionary=["protein", "header", "residue"])
+    print(f"[align] Wrote {out.num_rows:,} rows for {len(tables)} record(s) → {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,552 @@
+"""
+Serve filtered position statistics and peptide window tallies straight from
+the Hive dataset written by partition_iav6_by_protein.py, so the dashboards
+can ask for the few kilobytes a view needs instead of downloading a whole
+protein into DuckDB-WASM (`CREATE OR REPLACE TABLE proteins_cache AS ...`).
+
+Endpoints (GET; /peptides also takes a JSON body by POST):
+
+  /proteins                     proteins in the dataset with their row counts
+  /position-stats?protein=M1    rows of the dashboards' `positionStats` query
+  /peptides?protein=M1&window=12:9&window=40:10
+                                rows of `getWindowTalliesRows(windows)`
+  /values?protein=M1&column=country
+                                distinct values (with counts) of a filter column
+  /stats, /health
+
+Every data endpoint takes the dashboards' filters, each repeatable:
+
+  genotype=…  host=…  host_category=Human|Non-human  country=…
+  collection_from / collection_to / release_from / release_to = YYYY[-MM[-DD]]
+
+and format=json (default; an array of row objects, like `.toArray()`) or
+format=arrow (an Arrow IPC stream). Responses are gzip-compressed when the
+client accepts it and carry an ETag.
+
+Only the files under `<dataset>/protein=<protein>/` are scanned, and only the
+columns the filters need. Filtered sequences and encoded responses are kept
+in two LRU caches keyed on the normalised filters (sorted, deduplicated
+lists, padded dates, the effective host category) plus the size and mtime
+of the protein's files, so a rebuilt partition is never answered from stale
+entries. With no filters and --sequencecalc, position stats come from the
+prebuilt table, like the dashboards' fast path.
+
+Usage (from repo root):
+
+  python src/data/query_service.py --dataset src/data/IAV6_partitioned
+
+Optional flags:
+  --sequencecalc src/data/IAV8_sequencecalc.parquet
+  --host 127.0.0.1  --port 8008
+  --cache-mb 64            response cache
+  --sequence-cache-mb 512  filtered-sequence cache
+  --max-windows 5000       windows per /peptides request
+  --threads 4              DuckDB threads (default: DuckDB's choice)
+  --quiet                  no per-request log lines
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from build_sequencecalc import count_residues, counts_to_table, file_signature, list_partitions
+
+HUMAN = "Homo sapiens"
+VALUE_COLUMNS = ("genotype", "host", "country")
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+
+# Same normalisation as the dashboards: YYYY → YYYY-01-01, YYYY-MM → YYYY-MM-01
+DATE_SQL = """TRY_CAST(CASE
+    WHEN {c} IS NULL OR {c} = '' THEN NULL
+    WHEN LENGTH({c}) = 4 THEN {c} || '-01-01'
+    WHEN LENGTH({c}) = 7 THEN {c} || '-01'
+    ELSE {c} END AS DATE)"""
+
+WINDOW_TALLIES_SQL = """
+WITH
+ex_all AS (
+  SELECT p.start, p.len, SUBSTR(f.sequence, p.start, p.len) AS peptide
+  FROM filtered f CROSS JOIN params p
+),
+cnt_all AS (SELECT start, len, peptide, COUNT(*) AS cnt_all FROM ex_all GROUP BY start, len, peptide),
+tot_all AS (SELECT start, len, SUM(cnt_all) AS total_all FROM cnt_all GROUP BY start, len),
+filtered_u AS (SELECT DISTINCT sequence FROM filtered),
+ex_u AS (
+  SELECT p.start, p.len, SUBSTR(u.sequence, p.start, p.len) AS peptide
+  FROM filtered_u u CROSS JOIN params p
+),
+cnt_u AS (SELECT start, len, peptide, COUNT(*) AS cnt_unique FROM ex_u GROUP BY start, len, peptide),
+tot_u AS (SELECT start, len, SUM(cnt_unique) AS total_unique FROM cnt_u GROUP BY start, len)
+SELECT
+  COALESCE(a.start, u.start)        AS start,
+  COALESCE(a.len, u.len)            AS len,
+  COALESCE(a.peptide, u.peptide)    AS peptide,
+  COALESCE(a.cnt_all, 0)::INT       AS frequency_all,
+  COALESCE(tA.total_all, 0)::INT    AS total_all,
+  CASE WHEN tA.total_all IS NULL OR tA.total_all = 0
+       THEN 0.0 ELSE a.cnt_all * 1.0 / tA.total_all END AS proportion_all,
+  COALESCE(u.cnt_unique, 0)::INT    AS frequency_unique,
+  COALESCE(tU.total_unique, 0)::INT AS total_unique,
+  CASE WHEN tU.total_unique IS NULL OR tU.total_unique = 0
+       THEN 0.0 ELSE u.cnt_unique * 1.0 / tU.total_unique END AS proportion_unique
+FROM cnt_all a
+FULL JOIN cnt_u u USING (start, len, peptide)
+LEFT JOIN tot_all tA USING (start, len)
+LEFT JOIN tot_u tU USING (start, len)
+ORDER BY start, len, frequency_all DESC, peptide
+"""
+
+
+class BadRequest(ValueError):
+    """A malformed request parameter (answered with 400)."""
+
+
+class NotFound(LookupError):
+    """An unknown protein, column or path (answered with 404)."""
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Serve filtered position stats and peptide tallies.")
+    p.add_argument("--dataset", required=True, help="Hive dataset from partition_iav6_by_protein.py")
+    p.add_argument("--sequencecalc", default=None, help="Prebuilt sequencecalc for unfiltered position stats")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8008)
+    p.add_argument("--cache-mb", type=float, default=64, help="Response cache size (default: 64)")
+    p.add_argument("--sequence-cache-mb", type=float, default=512,
+                   help="Filtered-sequence cache size (default: 512)")
+    p.add_argument("--max-windows", type=int, default=5000, help="Windows per /peptides request (default: 5000)")
+    p.add_argument("--threads", type=int, default=None, help="DuckDB threads")
+    p.add_argument("--quiet", action="store_true", help="No per-request log lines")
+    return p.parse_args()
+
+
+# ───────────────────────── request parameters ─────────────────────────
+@dataclass(frozen=True)
+class Filters:
+    genotypes: Tuple[str, ...] = ()
+    hosts: Tuple[str, ...] = ()
+    host_category: Optional[str] = None       # "human" | "non-human" | None (both or neither)
+    countries: Tuple[str, ...] = ()
+    collection: Tuple[Optional[str], Optional[str]] = (None, None)
+    release: Tuple[Optional[str], Optional[str]] = (None, None)
+
+    def empty(self) -> bool:
+        return self == Filters()
+
+
+def _values(params: Dict[str, List[str]], name: str) -> Tuple[str, ...]:
+    return tuple(sorted({v.strip() for v in params.get(name, []) if v.strip()}))
+
+
+def _date(params: Dict[str, List[str]], name: str) -> Optional[str]:
+    vals = _values(params, name)
+    if not vals:
+        return None
+    if len(vals) > 1:
+        raise BadRequest(f"{name} given more than once")
+    d = vals[0]
+    if re.fullmatch(r"\d{4}", d):
+        d += "-01-01"
+    elif re.fullmatch(r"\d{4}-\d{2}", d):
+        d += "-01"
+    elif not re.fullmatch(r"\d{4}-\d{2}-\d{2}", d):
+        raise BadRequest(f"{name}: expected YYYY, YYYY-MM or YYYY-MM-DD, got {vals[0]!r}")
+    return d
+
+
+def parse_filters(params: Dict[str, List[str]]) -> Filters:
+    cats = {c.lower() for c in _values(params, "host_category")}
+    unknown = cats - {"human", "non-human"}
+    if unknown:
+        raise BadRequest(f"host_category: expected Human or Non-human, got {', '.join(sorted(unknown))}")
+    return Filters(
+        genotypes=_values(params, "genotype"),
+        hosts=_values(params, "host"),
+        host_category=next(iter(cats)) if len(cats) == 1 else None,
+        countries=_values(params, "country"),
+        collection=(_date(params, "collection_from"), _date(params, "collection_to")),
+        release=(_date(params, "release_from"), _date(params, "release_to")),
+    )
+
+
+def parse_windows(params: Dict[str, List[str]], limit: int) -> Tuple[Tuple[int, int], ...]:
+    """Sorted distinct (start, len) pairs from `window=start:len` (repeatable or comma-separated)."""
+    wins = set()
+    for raw in params.get("window", []):
+        for w in raw.split(","):
+            if not w.strip():
+                continue
+            m = re.fullmatch(r"\s*(\d+)\s*:\s*(\d+)\s*", w)
+            if not m or int(m.group(1)) < 1 or int(m.group(2)) < 1:
+                raise BadRequest(f"window: expected start:len with positive integers, got {w!r}")
+            wins.add((int(m.group(1)), int(m.group(2))))
+    if len(wins) > limit:
+        raise BadRequest(f"{len(wins)} windows; at most {limit} per request")
+    return tuple(sorted(wins))
+
+
+def where_clause(f: Filters) -> Tuple[str, List[Any]]:
+    """SQL conditions and parameters equivalent to the dashboards' filtered CTE."""
+    conds, args = ["sequence IS NOT NULL"], []
+    for column, values in (("genotype", f.genotypes), ("host", f.hosts), ("country", f.countries)):
+        if values:
+            conds.append(f"list_contains(?, {column})")
+            args.append(list(values))
+    if f.host_category == "human":
+        conds.append(f"host = '{HUMAN}'")
+    elif f.host_category == "non-human":
+        conds.append(f"host <> '{HUMAN}'")
+    for column, (lo, hi) in (("collection_date", f.collection), ("release_date", f.release)):
+        if lo:
+            conds.append(f"{DATE_SQL.format(c=column)} >= CAST(? AS DATE)")
+            args.append(lo)
+        if hi:
+            conds.append(f"{DATE_SQL.format(c=column)} <= CAST(? AS DATE)")
+            args.append(hi)
+    return " AND ".join(conds), args
+
+
+# ───────────────────────── LRU cache ─────────────────────────
+class LRUCache:
+    """Thread-safe least-recently-used cache bounded by the total size of its values."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.items: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.items[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, n) = self.items.popitem(last=False)
+                self.bytes -= n
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"entries": len(self.items), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+@dataclass(frozen=True)
+class Body:
+    raw: bytes
+    gz: Optional[bytes]
+    content_type: str
+    etag: str
+
+    @property
+    def size(self) -> int:
+        return len(self.raw) + len(self.gz or b"")
+
+
+def encode(tbl: pa.Table, fmt: str) -> Body:
+    if fmt == "arrow":
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, tbl.schema) as w:
+            w.write_table(tbl)
+        raw, ctype = sink.getvalue().to_pybytes(), "application/vnd.apache.arrow.stream"
+    else:
+        raw, ctype = json.dumps(tbl.to_pylist(), separators=(",", ":")).encode(), "application/json"
+    gz = gzip.compress(raw, GZIP_LEVEL) if len(raw) >= GZIP_MIN_BYTES else None
+    return Body(raw, gz, ctype, '"' + hashlib.blake2b(raw, digest_size=12).hexdigest() + '"')
+
+
+# ───────────────────────── queries ─────────────────────────
+def fetch_table(cur: duckdb.DuckDBPyConnection) -> pa.Table:
+    """Result of the last query as an Arrow table (`.arrow()` returns a reader on newer DuckDB)."""
+    res = cur.arrow()
+    return res.read_all() if isinstance(res, pa.RecordBatchReader) else res
+
+
+class QueryService:
+    def __init__(self, dataset: Path, sequencecalc: Optional[Path], cache_bytes: int,
+                 sequence_cache_bytes: int, max_windows: int, threads: Optional[int] = None) -> None:
+        self.dataset = dataset
+        self.sequencecalc = sequencecalc
+        self.max_windows = max_windows
+        self.db = duckdb.connect()
+        if threads:
+            self.db.execute(f"SET threads = {int(threads)}")
+        self.responses = LRUCache(cache_bytes)
+        self.sequences = LRUCache(sequence_cache_bytes)
+        self.started = time.time()
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    # partition pruning: only the protein's own files are ever opened
+    def files(self, protein: str) -> List[Path]:
+        if not protein:
+            raise BadRequest("protein is required")
+        files = list_partitions(self.dataset).get(protein)
+        if not files:
+            raise NotFound(f"Unknown protein {protein!r}")
+        return files
+
+    def signature(self, files: Sequence[Path]) -> Tuple:
+        sig = tuple((f.name,) + file_signature(f) for f in files)
+        if self.sequencecalc is not None and self.sequencecalc.exists():
+            sig += (file_signature(self.sequencecalc),)
+        return sig
+
+    def filtered(self, protein: str, files: List[Path], sig: Tuple, f: Filters) -> pa.ChunkedArray:
+        key = (protein, sig, f)
+        seqs = self.sequences.get(key)
+        if seqs is None:
+            where, args = where_clause(f)
+            cur = self.db.cursor().execute(f"SELECT sequence FROM read_parquet(?) WHERE {where}",
+                                           [[str(p) for p in files]] + args)
+            seqs = fetch_table(cur)["sequence"]
+            self.sequences.put(key, seqs, seqs.nbytes)
+        return seqs
+
+    def position_stats(self, protein: str, files: List[Path], sig: Tuple, f: Filters) -> pa.Table:
+        if f.empty() and self.sequencecalc is not None and self.sequencecalc.exists():
+            return fetch_table(self.db.cursor().execute(
+                "SELECT position, aminoacid, frequency_all, total_all, value, "
+                "frequency_unique, total_unique, value_unique "
+                "FROM read_parquet(?) WHERE protein = ? ORDER BY position, aminoacid",
+                [str(self.sequencecalc), protein]))
+        seqs = self.filtered(protein, files, sig, f)
+        tbl = counts_to_table(protein, count_residues(seqs), count_residues(pc.unique(seqs.combine_chunks())))
+        return tbl.drop_columns(["protein"])
+
+    def window_tallies(self, protein: str, files: List[Path], sig: Tuple, f: Filters,
+                       windows: Tuple[Tuple[int, int], ...]) -> pa.Table:
+        cur = self.db.cursor()
+        cur.register("filtered", pa.table({"sequence": self.filtered(protein, files, sig, f)}))
+        cur.register("params", pa.table({"start": pa.array([w[0] for w in windows], pa.int64()),
+                                         "len": pa.array([w[1] for w in windows], pa.int64())}))
+        return fetch_table(cur.execute(WINDOW_TALLIES_SQL))
+
+    def values(self, protein: str, files: List[Path], sig: Tuple, f: Filters, column: str) -> pa.Table:
+        if column not in VALUE_COLUMNS:
+            raise NotFound(f"Unknown column {column!r}; expected one of {', '.join(VALUE_COLUMNS)}")
+        where, args = where_clause(f)
+        return fetch_table(self.db.cursor().execute(
+            f"SELECT {column} AS value, COUNT(*)::INT AS n FROM read_parquet(?) "
+            f"WHERE {where} AND {column} IS NOT NULL AND {column} <> '' "
+            f"GROUP BY 1 ORDER BY n DESC, value",
+            [[str(p) for p in files]] + args))
+
+    def proteins(self) -> pa.Table:
+        parts = {p: fs for p, fs in list_partitions(self.dataset).items() if fs}
+        cur = self.db.cursor()
+        rows = [cur.execute("SELECT COUNT(*) FROM read_parquet(?)", [[str(f) for f in fs]]).fetchone()[0]
+                for fs in parts.values()]
+        return pa.table({"protein": list(parts), "rows": pa.array(rows, pa.int64())})
+
+    def answer(self, endpoint: str, params: Dict[str, List[str]]) -> Tuple[Body, bool]:
+        """(encoded response, served from cache) for one data request."""
+        fmt = (params.get("format") or ["json"])[-1]
+        if fmt not in ("json", "arrow"):
+            raise BadRequest(f"format: expected json or arrow, got {fmt!r}")
+        with self.lock:
+            self.requests += 1
+
+        if endpoint == "proteins":
+            parts = list_partitions(self.dataset)
+            key: Tuple = (endpoint, fmt, tuple((p,) + self.signature(fs) for p, fs in parts.items()))
+            hit = self.responses.get(key)
+            if hit is not None:
+                return hit, True
+            body = encode(self.proteins(), fmt)
+            self.responses.put(key, body, body.size)
+            return body, False
+
+        protein = (params.get("protein") or [""])[-1].strip()
+        files = self.files(protein)
+        sig = self.signature(files)
+        f = parse_filters(params)
+        if endpoint == "position-stats":
+            extra: Any = None
+        elif endpoint == "peptides":
+            extra = parse_windows(params, self.max_windows)
+        elif endpoint == "values":
+            extra = (params.get("column") or [""])[-1]
+        else:
+            raise NotFound(f"Unknown endpoint /{endpoint}")
+
+        key = (endpoint, fmt, protein, sig, f, extra)
+        hit = self.responses.get(key)
+        if hit is not None:
+            return hit, True
+        if endpoint == "position-stats":
+            tbl = self.position_stats(protein, files, sig, f)
+        elif endpoint == "peptides":
+            tbl = self.window_tallies(protein, files, sig, f, extra)
+        else:
+            tbl = self.values(protein, files, sig, f, extra)
+        body = encode(tbl, fmt)
+        self.responses.put(key, body, body.size)
+        return body, False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"uptime_s": round(time.time() - self.started, 1), "requests": self.requests,
+                "responses": self.responses.stats(), "sequences": self.sequences.stats()}
+
+
+# ───────────────────────── HTTP ─────────────────────────
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], service: QueryService, quiet: bool = False) -> None:
+        super().__init__(address, QueryHandler)
+        self.service = service
+        self.quiet = quiet
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    server: QueryServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def send_body(self, body: bytes, content_type: str, code: int = 200,
+                  headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Expose-Headers", "ETag, X-Cache")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def send_json(self, obj: Any, code: int = 200) -> None:
+        self.send_body(json.dumps(obj).encode(), "application/json", code)
+
+    def do_OPTIONS(self) -> None:
+        self.send_response(204)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, If-None-Match")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        self.handle_query(url.path.strip("/"), parse_qs(url.query))
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        try:
+            doc = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if not isinstance(doc, dict):
+                raise ValueError("expected a JSON object")
+            for k, v in doc.items():
+                if k == "windows":
+                    k, v = "window", [f"{int(w['start'])}:{int(w['len'])}" for w in v]
+                params.setdefault(k, []).extend(str(x) for x in (v if isinstance(v, list) else [v]))
+        except (ValueError, KeyError, TypeError) as exc:
+            return self.send_json({"detail": f"Bad request body: {exc}"}, 400)
+        self.handle_query(url.path.strip("/"), params)
+
+    def handle_query(self, endpoint: str, params: Dict[str, List[str]]) -> None:
+        service = self.server.service
+        if endpoint == "health":
+            return self.send_json({"status": "ok"})
+        if endpoint == "stats":
+            return self.send_json(service.stats())
+        t0 = time.perf_counter()
+        try:
+            body, cached = service.answer(endpoint, params)
+        except BadRequest as exc:
+            return self.send_json({"detail": str(exc)}, 400)
+        except NotFound as exc:
+            return self.send_json({"detail": str(exc)}, 404)
+        except duckdb.Error as exc:
+            return self.send_json({"detail": f"Query failed: {exc}"}, 500)
+
+        headers = {"ETag": body.etag, "X-Cache": "hit" if cached else "miss", "Vary": "Accept-Encoding"}
+        if self.headers.get("If-None-Match") == body.etag:
+            self.send_response(304)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            sent = 0
+        elif body.gz is not None and "gzip" in self.headers.get("Accept-Encoding", ""):
+            self.send_body(body.gz, body.content_type, headers={**headers, "Content-Encoding": "gzip"})
+            sent = len(body.gz)
+        else:
+            self.send_body(body.raw, body.content_type, headers=headers)
+            sent = len(body.raw)
+        if not self.server.quiet:
+            print(f"[query] {self.command} /{endpoint} {(params.get('protein') or [''])[-1]} · "
+                  f"{'hit' if cached else 'miss'} · {(time.perf_counter() - t0) * 1000:,.1f} ms · "
+                  f"{sent / 1024:,.1f} KB", flush=True)
+
+
+def start_server(service: QueryService, host: str = "127.0.0.1", port: int = 0,
+                 quiet: bool = True) -> QueryServer:
+    """Serve in a daemon thread; the bound port is `server.server_address[1]`."""
+    server = QueryServer((host, port), service, quiet)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    a = parse_args()
+    dataset = Path(a.dataset)
+    if not dataset.is_dir():
+        raise SystemExit(f"Dataset not found: {dataset}")
+    sequencecalc = Path(a.sequencecalc) if a.sequencecalc else None
+    if sequencecalc is not None and not sequencecalc.exists():
+        raise SystemExit(f"Sequencecalc not found: {sequencecalc}")
+
+    service = QueryService(dataset, sequencecalc, int(a.cache_mb * 2**20),
+                           int(a.sequence_cache_mb * 2**20), a.max_windows, a.threads)
+    server = QueryServer((a.host, a.port), service, a.quiet)
+    print(f"[query] {len(list_partitions(dataset))} proteins in {dataset}")
+    print(f"[query] Serving on http://{a.host}:{a.port} "
+          "(proteins, position-stats, peptides, values, stats, health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Result sinks for peptidecalcs: where finished IEDB peptide tables are written.
+
+- CsvResultsSink      the original growing CSV (every IEDB column, as returned)
+- ParquetResultsSink  a Hive-partitioned Parquet dataset with the slim schema
+                      already applied (allele, peptide, peptide_len, EL/BA
+                      percentiles rounded to 2 dp as float32), one file per
+                      batch and partition – no CSV, no separate compression pass;
+                      with a PeptideDictionary, peptide becomes an int32
+                      peptide_id like `slim_parquet.py --peptide-dict`
+
+Each finished batch is converted and written on its own, so peak memory stays
+bounded by one batch. Parquet batch files are named after the batch number, so
+rewriting a batch after an interrupted run overwrites its files instead of
+duplicating them; `recover()` removes the files of interrupted batches, which
+covers batches that are resubmitted under a new number.
+"""
+
+from __future__ import annotations
+
+import csv
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from peptide_dict import PeptideDictionary
+
+SLIM_SCHEMA = pa.schema([
+    pa.field("allele", pa.string()),
+    pa.field("peptide", pa.string()),
+    pa.field("peptide_len", pa.int16()),
+    pa.field("netmhcpan_el_percentile", pa.float32()),
+    pa.field("netmhcpan_ba_percentile", pa.float32()),
+])
+SLIM_ID_SCHEMA = SLIM_SCHEMA.set(1, pa.field("peptide_id", pa.int32()))
+
+
+def slim_peptide_table(cols: Sequence[str], rows: Sequence[Sequence],
+                       pep_len: Optional[int] = None,
+                       peptides: Optional[PeptideDictionary] = None) -> pa.Table:
+    """IEDB peptide_table rows → Arrow table with SLIM_SCHEMA.
+
+    `pep_len` is the length of every peptide; None (a packed batch of several
+    lengths) takes each row's length from its peptide. With `peptides` the
+    table has SLIM_ID_SCHEMA; peptides new to the dictionary are added.
+    """
+    idx = {name: cols.index(name) for name in
+           ("allele", "peptide", "netmhcpan_el_percentile", "netmhcpan_ba_percentile")}
+
+    def column(name: str, typ: pa.DataType) -> pa.Array:
+        i = idx[name]
+        return pa.array([r[i] for r in rows], type=typ)
+
+    def percentile(name: str) -> pa.Array:
+        return pc.cast(pc.round(column(name, pa.float64()), ndigits=2), pa.float32())
+
+    peptide = column("peptide", pa.string())
+    if pep_len is None:
+        lengths = pc.cast(pc.utf8_length(peptide), pa.int16())
+    else:
+        lengths = pa.repeat(pa.scalar(pep_len, pa.int16()), len(rows))
+    if peptides is None:
+        schema, pep_col = SLIM_SCHEMA, peptide
+    else:
+        schema, pep_col = SLIM_ID_SCHEMA, peptides.encode(peptide, add=True)
+    return pa.table({
+        "allele": column("allele", pa.string()),
+        schema.field(1).name: pep_col,
+        "peptide_len": lengths,
+        "netmhcpan_el_percentile": percentile("netmhcpan_el_percentile"),
+        "netmhcpan_ba_percentile": percentile("netmhcpan_ba_percentile"),
+    }, schema=schema)
+
+
+class CsvResultsSink:
+    """Append raw IEDB rows to one CSV; the header is written once."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._f = None
+        self._writer = None
+        self._first_write = True
+
+    def recover(self, offset: Optional[int], batch_nos: Sequence[int] = ()) -> None:
+        """Cut off rows from a batch whose write was interrupted."""
+        if offset is not None and self.path.exists():
+            print(f"Truncating {self.path.name} to {offset:,} bytes (interrupted write)")
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+
+    def __enter__(self) -> "CsvResultsSink":
+        if self.path.exists() and self.path.stat().st_size > 0:
+            print(f"Appending to existing result file: {self.path.name}")
+            self._first_write = False
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = open(self.path, "a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._f)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._f.close()
+
+    def tell(self) -> int:
+        return self._f.tell()
+
+    def write(self, batch_no: int, pep_len: Optional[int], cols: List[str], rows: List[List]) -> int:
+        if self._first_write:
+            self._writer.writerow(cols)
+            self._first_write = False
+        self._writer.writerows(rows)
+        self._f.flush()
+        return len(rows)
+
+
+class ParquetResultsSink:
+    """Write each batch as slim Parquet files under `<root>/<partition_by>=<value>/`."""
+
+    def __init__(self, root: Path, partition_by: str = "peptide_len",
+                 compression: str = "zstd", peptides: Optional[PeptideDictionary] = None) -> None:
+        schema = SLIM_SCHEMA if peptides is None else SLIM_ID_SCHEMA
+        if partition_by not in schema.names:
+            raise ValueError(f"Cannot partition by {partition_by!r}; choose from {schema.names}")
+        self.root = Path(root)
+        self.peptides = peptides
+        self.partitioning = ds.partitioning(
+            pa.schema([schema.field(partition_by)]), flavor="hive"
+        )
+        self.format = ds.ParquetFileFormat()
+        self.write_opts = self.format.make_write_options(
+            compression=compression,
+            use_dictionary=["allele", "peptide"] if peptides is None else ["allele"],
+        )
+
+    def recover(self, offset: Optional[int], batch_nos: Sequence[int] = ()) -> None:
+        """Remove the files of batches whose write was interrupted."""
+        for batch_no in batch_nos:
+            for f in self.root.glob(f"**/batch-{batch_no:06d}-*.parquet"):
+                print(f"Removing {f.relative_to(self.root)} (interrupted write)")
+                f.unlink()
+
+    def __enter__(self) -> "ParquetResultsSink":
+        self.root.mkdir(parents=True, exist_ok=True)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def tell(self) -> int:
+        return 0
+
+    def write(self, batch_no: int, pep_len: Optional[int], cols: List[str], rows: List[List]) -> int:
+        tbl = slim_peptide_table(cols, rows, pep_len, self.peptides)
+        if self.peptides is not None:
+            self.peptides.save()        # before any file refers to the new IDs
+        ds.write_dataset(
+            tbl,
+            base_dir=str(self.root),
+            format=self.format,
+            file_options=self.write_opts,
+            partitioning=self.partitioning,
+            basename_template=f"batch-{batch_no:06d}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            use_threads=False,
+        )
+        return tbl.num_rows
@@ -0,0 +1,321 @@
+"""
+Slim IEDB prediction tables (CSV or Parquet) into compact ZSTD Parquet files.
+
+Replaces the old single-file scripts parquetcompress.py (big IEDB CSV →
+iedb_netmhc_slim.parquet) and compresstable.py (peptide_table.parquet →
+peptide_table_slim.parquet). A schema mapping says which columns to keep and
+what to store them as; every input is slimmed in its own worker process.
+
+Usage (from repo root):
+
+  python src/data/slim_parquet.py --mapping iedb \
+    src/data/iedb_netmhcpan_30k_allalleles_results.csv
+
+  python src/data/slim_parquet.py --mapping peptide_table --workers 4 \
+    --output-dir src/data/slim  runs/*/peptide_table.parquet
+
+Optional flags:
+  --mapping iedb | peptide_table | path/to/mapping.json   (default: iedb)
+  --output-dir DIR       (default: next to each input)
+  --suffix _slim         output name = <input stem><suffix>.parquet
+  --percentiles uint16   store percentiles as uint16 hundredths (opt-in)
+  --clustered            sort by --sort-keys with small row groups, page index
+                         and a Bloom filter on peptide (see clustered_parquet.py)
+  --peptide-dict src/data/peptide_dict.parquet
+                         replace the peptide column with an int32 peptide_id
+                         from the shared dictionary (see peptide_dict.py);
+                         new peptides are appended to the dictionary first
+  --workers 4            worker processes (default: CPU count)
+
+A mapping is a JSON object of output column → type, or → {"type": …,
+"source": "<input column>"} when the name changes:
+
+  {"allele": "string", "peptide": "string",
+   "el": {"type": "percentile", "source": "netmhcpan_el_percentile"}}
+
+Types: string, int16, int32, int64, float32, percentile, peptide_id (needs
+--peptide-dict; with it, a string column named "peptide" becomes peptide_id
+automatically). Percentiles are rounded to 2 decimals and stored as float32,
+or with --percentiles uint16 as round(value * 100) in a uint16 column
+(0–655.35, exact at 2 decimals, half the bytes). uint16 columns carry field metadata {"scale": "0.01"}; readers must
+divide by 100.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pcsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from clustered_parquet import write_clustered
+from peptide_dict import PeptideDictionary
+
+ROW_GROUP_SIZE = 1_000_000
+CLUSTERED_ROW_GROUP = 65_536
+BATCH_SIZE = 262_144          # rows per Parquet scanner batch
+CSV_BLOCK_SIZE = 1 << 26      # 64 MB CSV read blocks
+PERCENTILE_MAX = 655.35       # largest value a uint16 hundredth can hold
+
+PRESETS: Dict[str, Dict[str, str]] = {
+    # iedb_netmhcpan_*_results.csv → iedb_netmhc_slim.parquet
+    "iedb": {
+        "allele": "string",
+        "peptide": "string",
+        "netmhcpan_el_percentile": "percentile",
+        "netmhcpan_ba_percentile": "percentile",
+    },
+    # IEDB peptide_table (original column names kept)
+    "peptide_table": {
+        "seq #": "int32",
+        "peptide length": "int16",
+        "allele": "string",
+        "peptide": "string",
+        "start": "int32",
+        "end": "int32",
+        "netmhcpan_el percentile": "percentile",
+        "netmhcpan_ba percentile": "percentile",
+    },
+}
+
+TYPES = {
+    "string": pa.string(),
+    "int16": pa.int16(),
+    "int32": pa.int32(),
+    "int64": pa.int64(),
+    "float32": pa.float32(),
+    "peptide_id": pa.int32(),
+}
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Slim IEDB prediction tables into compact Parquet files.")
+    p.add_argument("inputs", nargs="+", help="Input CSV or Parquet files")
+    p.add_argument("--mapping", default="iedb",
+                   help=f"Preset ({', '.join(PRESETS)}) or path to a JSON column mapping (default: iedb)")
+    p.add_argument("--output-dir", default=None, help="Output directory (default: next to each input)")
+    p.add_argument("--suffix", default="_slim", help="Appended to the input stem (default: _slim)")
+    p.add_argument("--percentiles", choices=["float32", "uint16"], default="float32",
+                   help="Percentile storage: float32, or uint16 hundredths (default: float32)")
+    p.add_argument("--clustered", action="store_true",
+                   help="Write the sorted, lookup-optimised layout")
+    p.add_argument("--sort-keys", default="allele,peptide",
+                   help="Sort keys for --clustered (default: allele,peptide)")
+    p.add_argument("--sort-memory-rows", type=int, default=5_000_000,
+                   help="Rows held in memory per sorted run with --clustered (default: 5,000,000)")
+    p.add_argument("--peptide-dict", default=None,
+                   help="Shared peptide dictionary Parquet; writes peptide_id instead of peptide")
+    p.add_argument("--compression", default="zstd", help="Parquet compression codec (default: zstd)")
+    p.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    return p.parse_args()
+
+
+# ───────────────────────── mapping ─────────────────────────
+def load_mapping(spec: str) -> List[Dict[str, str]]:
+    """Normalise a preset name or JSON file into [{name, source, type}, …]."""
+    if spec in PRESETS:
+        raw = PRESETS[spec]
+    else:
+        path = Path(spec)
+        if not path.exists():
+            raise SystemExit(f"Unknown mapping {spec!r}: not a preset ({', '.join(PRESETS)}) or a file")
+        raw = json.loads(path.read_text())
+
+    cols = []
+    for name, v in raw.items():
+        col = {"type": v} if isinstance(v, str) else dict(v)
+        col.setdefault("source", name)
+        col["name"] = name
+        if col["type"] != "percentile" and col["type"] not in TYPES:
+            raise SystemExit(f"Column {name!r}: unknown type {col['type']!r}")
+        cols.append(col)
+    return cols
+
+
+def with_peptide_ids(cols: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Swap a string column named "peptide" for an interned peptide_id column."""
+    return [{"name": "peptide_id", "type": "peptide_id", "source": c["source"]}
+            if c["name"] == "peptide" and c["type"] == "string" else c
+            for c in cols]
+
+
+def output_schema(cols: List[Dict[str, str]], percentiles: str) -> pa.Schema:
+    fields = []
+    for c in cols:
+        if c["type"] != "percentile":
+            fields.append(pa.field(c["name"], TYPES[c["type"]]))
+        elif percentiles == "uint16":
+            fields.append(pa.field(c["name"], pa.uint16(), metadata={"scale": "0.01"}))
+        else:
+            fields.append(pa.field(c["name"], pa.float32()))
+    return pa.schema(fields)
+
+
+# ───────────────────────── slimming ─────────────────────────
+def encode_percentile(arr, percentiles: str) -> pa.Array:
+    rounded = pc.round(pc.cast(arr, pa.float64()), ndigits=2)
+    if percentiles == "float32":
+        return pc.cast(rounded, pa.float32())
+    hi = pc.max(rounded).as_py()
+    if (hi is not None and hi > PERCENTILE_MAX) or (pc.min(rounded).as_py() or 0) < 0:
+        raise ValueError(f"percentile outside 0–{PERCENTILE_MAX}; use --percentiles float32")
+    return pc.cast(pc.round(pc.multiply(rounded, 100.0)), pa.uint16())
+
+
+def slim_table(tbl: pa.Table, cols: List[Dict[str, str]], schema: pa.Schema,
+               percentiles: str, peptides: Optional[PeptideDictionary] = None) -> pa.Table:
+    arrays = []
+    for c, field in zip(cols, schema):
+        src = tbl[c["source"]]
+        if pa.types.is_dictionary(src.type):
+            src = src.cast(src.type.value_type)
+        if c["type"] == "percentile":
+            arrays.append(encode_percentile(src, percentiles))
+        elif c["type"] == "peptide_id":
+            arrays.append(peptides.encode(src))
+        else:
+            arrays.append(pc.cast(src, field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def source_types(cols: List[Dict[str, str]]) -> Dict[str, pa.DataType]:
+    """CSV type of every source column, so streamed blocks never infer a different one."""
+    types: Dict[str, pa.DataType] = {}
+    for c in cols:
+        if c["type"] == "percentile":
+            types[c["source"]] = pa.float64()
+        elif c["type"] == "peptide_id":
+            types[c["source"]] = pa.string()
+        else:
+            types[c["source"]] = TYPES[c["type"]]
+    return types
+
+
+def read_batches(path: Path, sources: List[str],
+                 column_types: Optional[Dict[str, pa.DataType]] = None) -> Iterable[pa.Table]:
+    if path.suffix.lower() == ".csv":
+        reader = pcsv.open_csv(
+            path,
+            read_options=pcsv.ReadOptions(block_size=CSV_BLOCK_SIZE, use_threads=True),
+            convert_options=pcsv.ConvertOptions(include_columns=sources, auto_dict_encode=True,
+                                                column_types=column_types or {}),
+        )
+        for batch in reader:
+            yield pa.Table.from_batches([batch])
+        return
+
+    dataset = ds.dataset(path, format="parquet")
+    missing = [c for c in sources if c not in dataset.schema.names]
+    if missing:
+        raise ValueError(f"{path}: missing columns {', '.join(missing)}")
+    for batch in dataset.scanner(columns=sources, batch_size=BATCH_SIZE, use_threads=True).to_batches():
+        yield pa.Table.from_batches([batch])
+
+
+def distinct_peptides(src: Path, cols: List[Dict[str, str]]) -> pa.Array:
+    """Distinct values of the peptide_id source column(s) of one input."""
+    sources = sorted({c["source"] for c in cols if c["type"] == "peptide_id"})
+    uniq = pa.array([], pa.string())
+    for t in read_batches(src, sources, {s: pa.string() for s in sources}):
+        for s in sources:
+            col = t[s].cast(pa.string())
+            uniq = pc.unique(pa.chunked_array([uniq, pc.unique(col)]))
+    return pc.drop_null(uniq)
+
+
+def slim_file(src: Path, dst: Path, cols: List[Dict[str, str]], percentiles: str,
+              compression: str, sort_keys: Optional[List[str]], sort_memory_rows: int,
+              peptide_dict: Optional[str] = None) -> int:
+    """Slim one input file into `dst`; returns the number of rows written."""
+    schema = output_schema(cols, percentiles)
+    peptides = PeptideDictionary(peptide_dict) if peptide_dict else None
+    tables = (slim_table(t, cols, schema, percentiles, peptides)
+              for t in read_batches(src, [c["source"] for c in cols], source_types(cols)))
+    strings = [f.name for f in schema if pa.types.is_string(f.type)]
+
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if sort_keys:
+        return write_clustered(
+            tables, dst, sort_keys,
+            memory_rows=sort_memory_rows,
+            row_group_size=CLUSTERED_ROW_GROUP,
+            bloom_columns=[c for c in ("peptide", "peptide_id") if c in schema.names],
+            compression=compression,
+            use_dictionary=strings,
+        )
+
+    total = 0
+    with pq.ParquetWriter(dst, schema=schema, compression=compression,
+                          use_dictionary=strings) as writer:
+        for slim in tables:
+            writer.write_table(slim, row_group_size=ROW_GROUP_SIZE)
+            total += slim.num_rows
+    return total
+
+
+def main() -> None:
+    a = parse_args()
+    cols = load_mapping(a.mapping)
+    if a.peptide_dict:
+        cols = with_peptide_ids(cols)
+    elif any(c["type"] == "peptide_id" for c in cols):
+        raise SystemExit("The mapping has peptide_id columns; pass --peptide-dict")
+    sort_keys = [k.strip() for k in a.sort_keys.split(",") if k.strip()] if a.clustered else None
+    if sort_keys and a.peptide_dict:
+        sort_keys = ["peptide_id" if k == "peptide" else k for k in sort_keys]
+    if sort_keys:
+        unknown = [k for k in sort_keys if k not in {c["name"] for c in cols}]
+        if unknown:
+            raise SystemExit(f"Sort keys not in the mapping: {', '.join(unknown)}")
+
+    jobs = []
+    for inp in map(Path, a.inputs):
+        if not inp.exists():
+            raise SystemExit(f"Input not found: {inp}")
+        out_dir = Path(a.output_dir) if a.output_dir else inp.parent
+        jobs.append((inp, out_dir / f"{inp.stem}{a.suffix}.parquet"))
+    if len({dst for _, dst in jobs}) < len(jobs):
+        raise SystemExit("Two inputs map to the same output file; use distinct names or --suffix")
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=a.workers) as pool:
+        if a.peptide_dict:
+            # Intern first, in input order, so IDs don't depend on worker timing
+            peptides = PeptideDictionary(a.peptide_dict)
+            before = len(peptides)
+            uniq = [pool.submit(distinct_peptides, src, cols) for src, _ in jobs]
+            for fut in uniq:
+                peptides.add(fut.result())
+            peptides.save()
+            print(f"[slim] Peptide dictionary: {len(peptides) - before:,} new, "
+                  f"{len(peptides):,} total → {a.peptide_dict}")
+
+        futures = {
+            pool.submit(slim_file, src, dst, cols, a.percentiles, a.compression,
+                        sort_keys, a.sort_memory_rows, a.peptide_dict): (src, dst)
+            for src, dst in jobs
+        }
+        for fut, (src, dst) in futures.items():
+            try:
+                rows = fut.result()
+            except Exception as e:
+                failed += 1
+                print(f"[slim] ❌ {src}: {e}")
+                continue
+            layout = f" (clustered by {', '.join(sort_keys)})" if sort_keys else ""
+            print(f"[slim] {src.name}: {rows:,} rows{layout} → {dst} "
+                  f"({dst.stat().st_size / 1e6:,.1f} MB)")
+
+    if failed:
+        raise SystemExit(f"[slim] {failed} of {len(jobs)} input(s) failed")
+
+
+if __name__ == "__main__":
+    main()
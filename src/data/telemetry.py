@@ -0,0 +1,196 @@
+"""
+Per-batch telemetry for long IEDB prediction runs.
+
+`Telemetry.batch_done` turns a finished batch into one structured event and
+
+- appends it to a JSONL file (one object per line, flushed per batch)
+- rewrites a Prometheus textfile (node_exporter textfile collector format)
+  with run totals, time per phase, peptides left per length and the ETA
+- prints a progress line with throughput and ETA
+
+Phases of a batch:
+
+  submit  POST /pipeline round trip
+  queue   accepted → result seen as done (IEDB queue + compute)
+  poll    time spent inside GET /results calls (part of queue)
+  write   writing the rows to the results sink
+
+The ETA takes the mean turnaround per peptide observed for each length
+(the overall mean for lengths not seen yet), multiplies by the peptides
+left per length and divides by the number of jobs in flight.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+PHASES = ("submit", "queue", "poll", "write")
+
+
+@dataclass
+class BatchEvent:
+    batch_no: int
+    pep_len: int
+    result_id: Optional[str]
+    resumed: bool
+    peptides: int
+    windows: int                  # peptides scored by IEDB (more than submitted when packed)
+    rows: int
+    submitted_at: float           # unix time the job was accepted (or resumed)
+    completed_at: float           # unix time the result was seen as done
+    written_at: float
+    polls: int
+    retries: int
+    submit_s: float
+    queue_s: float
+    poll_s: float
+    write_s: float
+    rows_per_s: float             # rows / (submit + queue + write)
+
+
+def format_duration(seconds: float) -> str:
+    if math.isnan(seconds) or math.isinf(seconds):
+        return "?"
+    seconds = int(round(seconds))
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}h{m:02d}m" if h else f"{m}m{s:02d}s" if m else f"{s}s"
+
+
+class Telemetry:
+    def __init__(self, remaining: Dict[int, int], jsonl_path: Optional[Path] = None,
+                 prom_path: Optional[Path] = None, in_flight: int = 1,
+                 prefix: str = "iedb") -> None:
+        self.remaining = {int(k): int(v) for k, v in remaining.items()}
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.in_flight = max(in_flight, 1)
+        self.prefix = prefix
+        self.started = time.time()
+
+        self.batches = 0
+        self.peptides = 0
+        self.rows = 0
+        self.polls = 0
+        self.retries = 0
+        self.phase_s = {p: 0.0 for p in PHASES}
+        self.turnaround: Dict[int, list] = {}     # pep_len → [seconds, peptides]
+        self._jsonl = None
+        if jsonl_path is not None:
+            jsonl_path.parent.mkdir(parents=True, exist_ok=True)
+            self._jsonl = open(jsonl_path, "a", encoding="utf-8")
+
+    # ───────────── events ─────────────
+    def batch_done(self, b, rows: int, write_s: float) -> BatchEvent:
+        """Record a batch once its rows are written; `b` is a peptidecalcs.Batch."""
+        now = time.time()
+        queue_s = max(b.completed_at - b.submitted_at, 0.0)
+        busy = b.submit_s + queue_s + write_s
+        ev = BatchEvent(
+            batch_no=b.batch_no, pep_len=b.pep_len, result_id=b.result_id,
+            resumed=b.resumed, peptides=len(b.peptides), windows=b.windows, rows=rows,
+            submitted_at=b.submitted_at, completed_at=b.completed_at, written_at=now,
+            polls=b.polls, retries=b.retries,
+            submit_s=b.submit_s, queue_s=queue_s, poll_s=b.poll_s, write_s=write_s,
+            rows_per_s=rows / busy if busy > 0 else 0.0,
+        )
+
+        self.batches += 1
+        self.peptides += ev.peptides
+        self.rows += rows
+        self.polls += ev.polls
+        self.retries += ev.retries
+        for p in PHASES:
+            self.phase_s[p] += getattr(ev, f"{p}_s")
+        for pep_len, n in Counter(len(p) for p in b.peptides).items():
+            self.remaining[pep_len] = max(self.remaining.get(pep_len, 0) - n, 0)
+        if not ev.resumed:
+            t = self.turnaround.setdefault(ev.pep_len, [0.0, 0])
+            t[0] += ev.submit_s + queue_s
+            t[1] += ev.peptides
+
+        if self._jsonl is not None:
+            self._jsonl.write(json.dumps(asdict(ev)) + "\n")
+            self._jsonl.flush()
+        if self.prom_path is not None:
+            self.write_prometheus()
+        print(self.progress_line())
+        return ev
+
+    # ───────────── derived numbers ─────────────
+    def eta_seconds(self) -> float:
+        seen = [t for t in self.turnaround.values() if t[1]]
+        if not any(self.remaining.values()):
+            return 0.0
+        if not seen:
+            return float("nan")
+        overall = sum(t[0] for t in seen) / sum(t[1] for t in seen)
+        work = 0.0
+        for pep_len, left in self.remaining.items():
+            t = self.turnaround.get(pep_len)
+            per_pep = t[0] / t[1] if t and t[1] else overall
+            work += left * per_pep
+        return work / self.in_flight
+
+    def progress_line(self) -> str:
+        elapsed = max(time.time() - self.started, 1e-9)
+        left = sum(self.remaining.values())
+        by_len = ", ".join(f"{k}:{v:,}" for k, v in sorted(self.remaining.items()) if v)
+        return (f"   📈  {self.batches:,} batches · {self.peptides:,} peptides done, {left:,} left"
+                f" · {self.rows / elapsed:,.0f} rows/s · {self.peptides / elapsed:,.1f} pep/s"
+                f" · ETA {format_duration(self.eta_seconds())}"
+                + (f"  [left by length {by_len}]" if by_len else ""))
+
+    # ───────────── Prometheus textfile ─────────────
+    def write_prometheus(self) -> None:
+        p = self.prefix
+        elapsed = max(time.time() - self.started, 1e-9)
+        eta = self.eta_seconds()
+        lines = [
+            f"# HELP {p}_batches_done_total Batches written in this run.",
+            f"# TYPE {p}_batches_done_total counter",
+            f"{p}_batches_done_total {self.batches}",
+            f"# HELP {p}_peptides_done_total Peptides whose predictions were written.",
+            f"# TYPE {p}_peptides_done_total counter",
+            f"{p}_peptides_done_total {self.peptides}",
+            f"# HELP {p}_rows_written_total Result rows written.",
+            f"# TYPE {p}_rows_written_total counter",
+            f"{p}_rows_written_total {self.rows}",
+            f"# HELP {p}_polls_total Result polls issued.",
+            f"# TYPE {p}_polls_total counter",
+            f"{p}_polls_total {self.polls}",
+            f"# HELP {p}_retries_total HTTP requests retried.",
+            f"# TYPE {p}_retries_total counter",
+            f"{p}_retries_total {self.retries}",
+            f"# HELP {p}_phase_seconds_total Seconds spent per batch phase, summed over batches.",
+            f"# TYPE {p}_phase_seconds_total counter",
+            *(f'{p}_phase_seconds_total{{phase="{ph}"}} {self.phase_s[ph]:.3f}' for ph in PHASES),
+            f"# HELP {p}_peptides_remaining Peptides still to predict, by length.",
+            f"# TYPE {p}_peptides_remaining gauge",
+            *(f'{p}_peptides_remaining{{length="{k}"}} {v}' for k, v in sorted(self.remaining.items())),
+            f"# HELP {p}_rows_per_second Rows written per wall-clock second since start.",
+            f"# TYPE {p}_rows_per_second gauge",
+            f"{p}_rows_per_second {self.rows / elapsed:.3f}",
+            f"# HELP {p}_eta_seconds Estimated seconds until all peptides are predicted.",
+            f"# TYPE {p}_eta_seconds gauge",
+            f"{p}_eta_seconds {eta:.0f}" if not math.isnan(eta) else f"{p}_eta_seconds NaN",
+            f"# HELP {p}_last_batch_timestamp_seconds Unix time of the last written batch.",
+            f"# TYPE {p}_last_batch_timestamp_seconds gauge",
+            f"{p}_last_batch_timestamp_seconds {time.time():.0f}",
+        ]
+        self.prom_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.prom_path.with_name(self.prom_path.name + ".tmp")
+        tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(tmp, self.prom_path)        # collectors never see a half-written file
+
+    def close(self) -> None:
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
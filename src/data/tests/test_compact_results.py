@@ -0,0 +1,34 @@
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pcsv = pytest.importorskip("pyarrow.csv")
+
+from compact_results import compact  # noqa: E402
+
+
+def write_csv(path, rows):
+    pcsv.write_csv(pa.table({"allele": [r[0] for r in rows], "peptide": [r[1] for r in rows],
+                             "score": [r[2] for r in rows]}), path)
+
+
+def test_output_keeps_the_source(tmp_path):
+    src, out = tmp_path / "r.csv", tmp_path / "o.csv"
+    write_csv(src, [("A", "SIINFEKL", 1.0), ("A", "SIINFEKL", 2.0), ("B", "GILGFVFTL", 3.0)])
+    before = src.read_bytes()
+
+    r = compact([src], out, None, 64, in_place=False)
+
+    assert src.read_bytes() == before
+    assert r["rows_in"] == 3 and r["rows_out"] == 2
+    got = pcsv.read_csv(out).to_pylist()
+    assert got == [{"allele": "A", "peptide": "SIINFEKL", "score": 2.0},
+                   {"allele": "B", "peptide": "GILGFVFTL", "score": 3.0}]
+
+
+def test_in_place_replaces_the_source(tmp_path):
+    src = tmp_path / "r.csv"
+    write_csv(src, [("A", "SIINFEKL", 1.0), ("A", "SIINFEKL", 2.0)])
+
+    compact([src], src, None, 64)
+
+    assert pcsv.read_csv(src).num_rows == 1
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from kmer_index import ALPHABET, KmerIndex, build_protein  # noqa: E402
+
+SEQUENCES = {
+    "HA": ["MKAILVVLLYTFAT", "MKAILVVLLYTFAT", "MKTIIALSYIFCLA"],
+    "NA": ["MNPNQKIITIGSVS", "MNPNQKIIAIGSVS", "MKAILVVLAYTFAT"],
+}
+
+
+def build_index(root):
+    proteins = {}
+    for protein, seqs in SEQUENCES.items():
+        part = root / "data" / f"protein={protein}"
+        part.mkdir(parents=True)
+        pq.write_table(pa.table({"sequence": seqs}), part / "part-0.parquet")
+        proteins[protein] = build_protein(protein, [part / "part-0.parquet"],
+                                          root / "index" / f"protein={protein}", [9])
+    (root / "index" / "_index.json").write_text(
+        json.dumps({"alphabet": ALPHABET, "k": [9], "proteins": proteins}))
+    return KmerIndex(root / "index")
+
+
+def brute_neighbours(peptide, protein):
+    """(k-mers at Hamming distance 1, their summed frequency_all) by scanning every window."""
+    found = {}
+    for seq in SEQUENCES[protein]:
+        for w in {seq[i:i + len(peptide)] for i in range(len(seq) - len(peptide) + 1)}:
+            if sum(x != y for x, y in zip(w, peptide)) == 1:
+                found[w] = found.get(w, 0) + 1
+    return len(found), sum(found.values())
+
+
+def test_absent_peptide_gets_its_neighbourhood(tmp_path):
+    index = build_index(tmp_path)
+    peptide = "KAILVVLLW"             # in no protein; one residue off KAILVVLLY
+    assert all(peptide not in s for seqs in SEQUENCES.values() for s in seqs)
+
+    row = index.lookup([peptide], neighbours=True).to_pylist()[0]
+
+    best = max(SEQUENCES, key=lambda p: brute_neighbours(peptide, p)[1])
+    n, freq = brute_neighbours(peptide, best)
+    assert row["frequency_all"] == 0
+    assert row["protein"] == best == "HA"
+    assert (row["neighbours"], row["neighbour_frequency_all"]) == (n, freq) == (1, 2)